@@ -0,0 +1,637 @@
+import numpy as np
+from typing import List, Tuple
+
+from neighbors import Neighbors, TopKNeighbors
+from neighbor_builder import BuildProgressCallback, no_build_progress
+
+
+class RandomProjectionForest:
+    """
+    Approximate K nearest neighbors of all datapoints of a set of
+    embeddings. Every tree splits the datapoints recursively by random
+    hyperplanes until the leaves hold at most `leaf_size` points and the
+    points of a leaf are candidates of each other. After every round of
+    trees the candidates are refined once with the neighbors of the
+    neighbors. Rounds are added until the recall estimated on a sample of
+    exact queries reaches the target, so the work grows with N * K instead
+    of N².
+    """
+
+    DEFAULT_K: int = 50
+    DEFAULT_LEAF_SIZE: int = 64
+    DEFAULT_RECALL_TARGET: float = 0.95
+    DEFAULT_TREES_PER_ROUND: int = 4
+    DEFAULT_MAX_ROUNDS: int = 16
+    # Refinement looks at this many nearest neighbors of the nearest
+    # neighbors
+    REFINE_NEIGHBORS: int = 10
+    RECALL_SAMPLE_SIZE: int = 256
+    DEFAULT_DISTANCE_SAMPLE_AMOUNT: int = 256
+    # Candidate distances are computed in batches of this many values
+    BATCH_VALUES: int = 2 ** 24
+
+    _distance_metric: str
+    _positions: np.ndarray
+    _leaf_size: int
+    _rng: np.random.Generator
+
+    _tree_amount: int
+    _estimated_recall: float
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        distance_metric: str,
+        leaf_size: int = DEFAULT_LEAF_SIZE,
+        seed: int = 0
+    ):
+        if distance_metric not in Neighbors.DISTANCE_METRICS:
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+        if leaf_size < 2:
+            raise ValueError(f"Invalid leaf size: {leaf_size}")
+        self._distance_metric = distance_metric
+        positions = np.asarray(embeddings, dtype=np.float32)
+        if distance_metric == "cosine":
+            # The cosine order is the euclidean order of unit vectors
+            norms = np.linalg.norm(positions, axis=1, keepdims=True)
+            positions = positions / np.maximum(
+                norms, np.finfo(np.float32).tiny
+            )
+        self._positions = np.ascontiguousarray(positions)
+        self._leaf_size = leaf_size
+        self._rng = np.random.default_rng(seed)
+        self._tree_amount = 0
+        self._estimated_recall = 0.0
+
+    @property
+    def tree_amount(self) -> int:
+        return self._tree_amount
+
+    @property
+    def estimated_recall(self) -> float:
+        return self._estimated_recall
+
+    def _pairwise_distances(
+        self, points: np.ndarray, others: np.ndarray
+    ) -> np.ndarray:
+        dots = points @ others.T
+        if self._distance_metric == "cosine":
+            return 1.0 - dots
+        squared = (
+            np.einsum("nd,nd->n", points, points)[:, None]
+            + np.einsum("nd,nd->n", others, others)[None, :]
+            - 2.0 * dots
+        )
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def _candidate_distances(
+        self, rows: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        """
+        Returns the distances of the datapoints `rows` to their (n, c)
+        `candidates` in the distance metric of the forest.
+        """
+        distances = np.empty(candidates.shape, dtype=np.float32)
+        dimensions = self._positions.shape[1]
+        batch = max(1, self.BATCH_VALUES // (candidates.shape[1] * dimensions))
+        for start in range(0, len(rows), batch):
+            end = start + batch
+            points = self._positions[rows[start:end]]
+            others = self._positions[candidates[start:end]]
+            dots = np.matmul(others, points[:, :, None])[:, :, 0]
+            if self._distance_metric == "cosine":
+                distances[start:end] = 1.0 - dots
+            else:
+                squared = (
+                    np.einsum("nd,nd->n", points, points)[:, None]
+                    + np.einsum("ncd,ncd->nc", others, others)
+                    - 2.0 * dots
+                )
+                distances[start:end] = np.sqrt(np.maximum(squared, 0.0))
+        return distances
+
+    def _tree_leaves(self) -> List[np.ndarray]:
+        leaves = []
+        stack = [np.arange(len(self._positions))]
+        while stack:
+            indices = stack.pop()
+            if len(indices) <= self._leaf_size:
+                leaves.append(indices)
+                continue
+            # The hyperplane halfway between two random points
+            a, b = self._positions[
+                self._rng.choice(indices, size=2, replace=False)
+            ]
+            normal = a - b
+            side = self._positions[indices] @ normal > normal @ (a + b) / 2
+            if side.all() or not side.any():
+                # Duplicates cannot be separated by a hyperplane
+                side = self._rng.permutation(len(indices)) < len(indices) // 2
+            stack.append(indices[side])
+            stack.append(indices[~side])
+        return leaves
+
+    def _tree_neighbors(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        datapoint_amount = len(self._positions)
+        indices = np.full((datapoint_amount, k), -1, dtype=np.int64)
+        distances = np.full((datapoint_amount, k), np.inf, dtype=np.float32)
+        for leaf in self._tree_leaves():
+            leaf_positions = self._positions[leaf]
+            leaf_distances = self._pairwise_distances(
+                leaf_positions, leaf_positions
+            )
+            np.fill_diagonal(leaf_distances, np.inf)
+            amount = min(k, len(leaf) - 1)
+            if amount == 0:
+                continue
+            nearest = np.argpartition(
+                leaf_distances, amount - 1, axis=1
+            )[:, :amount]
+            indices[leaf, :amount] = leaf[nearest]
+            distances[leaf, :amount] = np.take_along_axis(
+                leaf_distances, nearest, axis=1
+            )
+        return indices, distances
+
+    @staticmethod
+    def _merge(
+        k: int,
+        indices: np.ndarray,
+        distances: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Keeps the k nearest unique candidates of every row sorted by
+        distance.
+        """
+        order = np.argsort(indices, axis=1, kind="stable")
+        indices = np.take_along_axis(indices, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        duplicate = np.zeros(indices.shape, dtype=bool)
+        duplicate[:, 1:] = indices[:, 1:] == indices[:, :-1]
+        distances = np.where(duplicate | (indices < 0), np.inf, distances)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest = np.take_along_axis(
+            nearest,
+            np.argsort(
+                np.take_along_axis(distances, nearest, axis=1),
+                axis=1, kind="stable"
+            ),
+            axis=1
+        )
+        indices = np.take_along_axis(indices, nearest, axis=1)
+        distances = np.take_along_axis(distances, nearest, axis=1)
+        return np.where(np.isinf(distances), -1, indices), distances
+
+    def _refine(
+        self, indices: np.ndarray, distances: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Makes the nearest neighbors of every point candidates of each
+        other, which also proposes the neighbors of the neighbors. The
+        distances within a group come from one small Gram matrix.
+        """
+        datapoint_amount, k = indices.shape
+        amount = min(k, self.REFINE_NEIGHBORS)
+        rows = np.arange(datapoint_amount)
+        groups = np.concatenate(
+            [
+                rows[:, None],
+                np.where(indices >= 0, indices, rows[:, None])[:, :amount]
+            ],
+            axis=1
+        )
+        group_size = amount + 1
+        targets = np.empty(
+            (datapoint_amount, group_size, group_size), dtype=np.int64
+        )
+        candidates = np.empty_like(targets)
+        group_distances = np.empty(targets.shape, dtype=np.float32)
+        batch = max(1, self.BATCH_VALUES // (
+            group_size * self._positions.shape[1]
+        ))
+        for start in range(0, datapoint_amount, batch):
+            end = start + batch
+            group = groups[start:end]
+            positions = self._positions[group]
+            dots = np.matmul(positions, positions.transpose(0, 2, 1))
+            if self._distance_metric == "cosine":
+                group_distances[start:end] = 1.0 - dots
+            else:
+                norms = np.einsum("ncd,ncd->nc", positions, positions)
+                group_distances[start:end] = np.sqrt(np.maximum(
+                    norms[:, :, None] + norms[:, None, :] - 2.0 * dots, 0.0
+                ))
+            targets[start:end] = group[:, :, None]
+            candidates[start:end] = group[:, None, :]
+        group_distances[targets == candidates] = np.inf
+
+        # Keeps the k nearest proposals per point
+        targets = targets.ravel()
+        candidates = candidates.ravel()
+        group_distances = group_distances.ravel()
+        order = np.lexsort((group_distances, targets))
+        targets = targets[order]
+        ranks = (
+            np.arange(len(targets))
+            - np.searchsorted(targets, rows)[targets]
+        )
+        keep = (ranks < k) & np.isfinite(group_distances[order])
+        proposed = np.full((datapoint_amount, k), -1, dtype=np.int64)
+        proposed_distances = np.full(
+            (datapoint_amount, k), np.inf, dtype=np.float32
+        )
+        proposed[targets[keep], ranks[keep]] = candidates[order][keep]
+        proposed_distances[targets[keep], ranks[keep]] = (
+            group_distances[order][keep]
+        )
+        return self._merge(
+            k,
+            np.concatenate([indices, proposed], axis=1),
+            np.concatenate([distances, proposed_distances], axis=1)
+        )
+
+    def _exact_neighbors(
+        self, rows: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        distances = self._pairwise_distances(
+            self._positions[rows], self._positions
+        )
+        distances[np.arange(len(rows)), rows] = np.inf
+        candidates = np.broadcast_to(
+            np.arange(len(self._positions)), distances.shape
+        )
+        return self._merge(k, candidates, distances.astype(np.float32))
+
+    def _recall(
+        self, indices: np.ndarray, sample: np.ndarray, exact: np.ndarray
+    ) -> float:
+        hits = [
+            len(np.intersect1d(indices[row], expected))
+            for row, expected in zip(sample, exact)
+        ]
+        return float(np.mean(hits)) / exact.shape[1]
+
+    def distance_samples(
+        self, amount: int = DEFAULT_DISTANCE_SAMPLE_AMOUNT
+    ) -> np.ndarray:
+        """
+        Returns the distances of every datapoint to the same random other
+        datapoints, sorted per datapoint. They describe the distances
+        beyond the K nearest neighbors for `TopKNeighbors`.
+
+        :param amount: The amount of sampled datapoints, at most N - 1.
+
+        :return: The (N, amount) sorted distances.
+        """
+        datapoint_amount = len(self._positions)
+        amount = min(amount, datapoint_amount - 1)
+        # One spare sample replaces the point itself if it was sampled
+        sample = self._rng.choice(datapoint_amount, amount + 1, replace=False)
+        samples = np.empty((datapoint_amount, amount), dtype=np.float32)
+        batch = max(1, self.BATCH_VALUES // (amount + 1))
+        for start in range(0, datapoint_amount, batch):
+            end = min(start + batch, datapoint_amount)
+            distances = self._pairwise_distances(
+                self._positions[start:end], self._positions[sample]
+            )
+            distances[sample[None, :] == np.arange(start, end)[:, None]] = (
+                np.inf
+            )
+            samples[start:end] = np.sort(distances, axis=1)[:, :amount]
+        return samples
+
+    def build(
+        self,
+        k: int = DEFAULT_K,
+        recall_target: float = DEFAULT_RECALL_TARGET,
+        trees_per_round: int = DEFAULT_TREES_PER_ROUND,
+        max_rounds: int = DEFAULT_MAX_ROUNDS,
+        progress: BuildProgressCallback = no_build_progress
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the approximate k nearest neighbors of all datapoints.
+
+        :param k: The amount of neighbors per datapoint.
+        :param recall_target: The recall@k to reach in [0, 1]. The build
+            stops after `max_rounds` rounds if it is not reached.
+        :param trees_per_round: The amount of trees added per round.
+        :param max_rounds: The maximum amount of rounds.
+        :param progress: Called with the finished and the maximum amount
+            of rounds after every round.
+
+        :return: The (N, k + 1) indices and distances sorted by distance
+            in the layout of `TopKNeighbors`. Column 0 refers to the point
+            itself.
+        """
+        datapoint_amount = len(self._positions)
+        if not 0 < k < datapoint_amount:
+            raise ValueError(
+                f"Invalid k: {k}. k must be in (0, {datapoint_amount})."
+            )
+        if not 0.0 < recall_target <= 1.0:
+            raise ValueError(f"Invalid recall target: {recall_target}")
+
+        sample = self._rng.choice(
+            datapoint_amount,
+            size=min(self.RECALL_SAMPLE_SIZE, datapoint_amount),
+            replace=False
+        )
+        exact, _ = self._exact_neighbors(sample, k)
+
+        indices = np.full((datapoint_amount, k), -1, dtype=np.int64)
+        distances = np.full((datapoint_amount, k), np.inf, dtype=np.float32)
+        for round_ in range(max_rounds):
+            for _ in range(trees_per_round):
+                tree_indices, tree_distances = self._tree_neighbors(k)
+                indices, distances = self._merge(
+                    k,
+                    np.concatenate([indices, tree_indices], axis=1),
+                    np.concatenate([distances, tree_distances], axis=1)
+                )
+                self._tree_amount += 1
+            indices, distances = self._refine(indices, distances)
+            self._estimated_recall = self._recall(indices, sample, exact)
+            progress(round_ + 1, max_rounds)
+            if self._estimated_recall >= recall_target:
+                break
+
+        # Points in tiny leaves can be left with less than k candidates
+        unfilled = np.flatnonzero((indices < 0).any(axis=1))
+        if len(unfilled) > 0:
+            indices[unfilled], distances[unfilled] = self._exact_neighbors(
+                unfilled, k
+            )
+
+        rows = np.arange(datapoint_amount)[:, None]
+        return (
+            np.concatenate([rows, indices], axis=1),
+            np.concatenate(
+                [np.zeros((datapoint_amount, 1), dtype=np.float32), distances],
+                axis=1
+            )
+        )
+
+
+def pairwise_distances(
+    points: np.ndarray, others: np.ndarray, distance_metric: str
+) -> np.ndarray:
+    """
+    Returns the (n, m) distances between n points and m others in the
+    given distance metric as float32.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    others = np.asarray(others, dtype=np.float32)
+    dots = points @ others.T
+    if distance_metric == "cosine":
+        return 1.0 - dots / np.maximum(
+            np.linalg.norm(points, axis=1)[:, None]
+            * np.linalg.norm(others, axis=1)[None, :],
+            np.finfo(np.float32).tiny
+        )
+    squared = (
+        np.einsum("nd,nd->n", points, points)[:, None]
+        + np.einsum("nd,nd->n", others, others)[None, :]
+        - 2.0 * dots
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def low_dimensional_neighbors(
+    positions: np.ndarray,
+    distance_metric: str,
+    k: int,
+    sample_amount: int = RandomProjectionForest.DEFAULT_DISTANCE_SAMPLE_AMOUNT,
+    seed: int = 0
+) -> TopKNeighbors:
+    """
+    Returns the exact K nearest neighbors and the distance samples of low
+    dimensional positions as in-memory `TopKNeighbors`. A k-d tree finds
+    the neighbors, so the work grows with N * log(N) * K instead of N² and
+    the datapoint amount is not limited to uint16 like with
+    `ComputedNeighbors`.
+
+    :param positions: The (N, d) positions, e.g. of a projection.
+    :param distance_metric: "euclidean" or "cosine".
+    :param k: The amount of neighbors per datapoint, at most N - 1.
+    :param sample_amount: The amount of distance samples per datapoint.
+    :param seed: The seed of the sampled datapoints.
+    """
+    if distance_metric not in Neighbors.DISTANCE_METRICS:
+        raise ValueError(f"Invalid distance metric: {distance_metric}")
+    # scipy is imported lazily to keep the server start fast
+    from scipy.spatial import cKDTree
+
+    positions = np.asarray(positions, dtype=np.float32)
+    datapoint_amount = len(positions)
+    k = min(k, datapoint_amount - 1)
+    sample_amount = min(sample_amount, datapoint_amount - 1)
+    points = positions
+    if distance_metric == "cosine":
+        # The cosine order is the euclidean order of unit vectors
+        points = positions / np.maximum(
+            np.linalg.norm(positions, axis=1, keepdims=True),
+            np.finfo(np.float32).tiny
+        )
+    distances, indices = cKDTree(points).query(points, k=k + 1, workers=-1)
+    if distance_metric == "cosine":
+        distances = distances ** 2 / 2
+    # Duplicates can come before the point itself, which goes to column 0
+    rows = np.arange(datapoint_amount)
+    others = np.argsort(
+        indices == rows[:, None], axis=1, kind="stable"
+    )[:, :k]
+    indices = np.concatenate(
+        [rows[:, None], np.take_along_axis(indices, others, axis=1)], axis=1
+    )
+    distances = np.concatenate(
+        [
+            np.zeros((datapoint_amount, 1)),
+            np.take_along_axis(distances, others, axis=1)
+        ],
+        axis=1
+    )
+
+    # One spare sample replaces the point itself if it was sampled
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(datapoint_amount, sample_amount + 1, replace=False)
+    samples = np.empty((datapoint_amount, sample_amount), dtype=np.float32)
+    batch = max(
+        1, RandomProjectionForest.BATCH_VALUES // (sample_amount + 1)
+    )
+    for start in range(0, datapoint_amount, batch):
+        end = min(start + batch, datapoint_amount)
+        sampled = pairwise_distances(
+            positions[start:end], positions[sample], distance_metric
+        )
+        sampled[sample[None, :] == np.arange(start, end)[:, None]] = np.inf
+        samples[start:end] = np.sort(sampled, axis=1)[:, :sample_amount]
+
+    return TopKNeighbors.from_arrays(
+        distance_metric, positions, indices, distances, samples
+    )
+
+
+class TopKNeighborsPatch:
+    """
+    Appends datapoints to the top-K neighbors of a dataset without a
+    rebuild: the new datapoints get exact neighbor lists against all
+    datapoints and the lists of the existing datapoints take in the new
+    datapoints that are closer than their K-th neighbor. The work grows
+    with M * N * D for M new datapoints. Exact `Neighbors` are converted
+    to top-K neighbors first, their distance samples are taken from the
+    exact sorted distances.
+    """
+
+    # Distances of new datapoints are computed in blocks of this many
+    # values
+    BLOCK_VALUES: int = 2 ** 24
+
+    _distance_metric: str
+    _positions: np.ndarray
+    _indices: np.ndarray
+    _distances: np.ndarray
+    _distance_samples: np.ndarray
+    _rng: np.random.Generator
+
+    def __init__(
+        self,
+        neighbors: Neighbors | TopKNeighbors,
+        k: int = RandomProjectionForest.DEFAULT_K,
+        sample_amount: int = (
+            RandomProjectionForest.DEFAULT_DISTANCE_SAMPLE_AMOUNT
+        ),
+        seed: int = 0
+    ):
+        """
+        :param neighbors: The current neighbors.
+        :param k: The amount of neighbors per datapoint if `neighbors`
+            are exact, top-K neighbors keep their K.
+        :param sample_amount: The amount of distance samples per
+            datapoint if `neighbors` are exact.
+        :param seed: The seed of the distance samples of new datapoints.
+        """
+        self._distance_metric = neighbors.distance_metric
+        self._positions = np.asarray(neighbors.positions(), dtype=np.float32)
+        pairs = neighbors.distance_index_pairs()
+        if isinstance(neighbors, TopKNeighbors):
+            self._indices = pairs["index"].astype(np.int64)
+            self._distances = np.array(pairs["distance"])
+            self._distance_samples = np.array(neighbors.distance_samples())
+        else:
+            k = min(k, neighbors.datapoint_amount - 1)
+            self._indices = pairs["index"][:, :k + 1].astype(np.int64)
+            self._distances = np.array(pairs["distance"][:, :k + 1])
+            sorted_distances = neighbors.sorted_distances()
+            sample_amount = min(sample_amount, sorted_distances.shape[1])
+            # Sample q is the distance at rank (q + 0.5) / Q * (N - 1)
+            columns = (
+                (np.arange(sample_amount) + 0.5) / sample_amount
+                * sorted_distances.shape[1]
+            ).astype(np.int64)
+            self._distance_samples = np.array(sorted_distances[:, columns])
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def datapoint_amount(self) -> int:
+        return len(self._positions)
+
+    @property
+    def k(self) -> int:
+        return self._indices.shape[1] - 1
+
+    def append(self, positions: np.ndarray):
+        """
+        Appends the (M, D) positions of new datapoints.
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        if positions.ndim != 2 or positions.shape[1] != (
+            self._positions.shape[1]
+        ):
+            raise ValueError(
+                f"Invalid positions: expected shape "
+                f"(M, {self._positions.shape[1]}), got {positions.shape}."
+            )
+        old_amount = self.datapoint_amount
+        all_positions = np.concatenate([self._positions, positions])
+        datapoint_amount = len(all_positions)
+        k = self.k
+        sample_amount = min(
+            self._distance_samples.shape[1], datapoint_amount - 1
+        )
+
+        indices = np.empty((len(positions), k + 1), dtype=np.int64)
+        distances = np.empty((len(positions), k + 1), dtype=np.float32)
+        samples = np.empty((len(positions), sample_amount), dtype=np.float32)
+        block_size = max(1, self.BLOCK_VALUES // datapoint_amount)
+        for start in range(0, len(positions), block_size):
+            end = min(start + block_size, len(positions))
+            rows = np.arange(end - start)
+            block_distances = pairwise_distances(
+                positions[start:end], all_positions, self._distance_metric
+            )
+
+            # The new datapoints are candidates of the existing ones
+            self._merge_into_existing(
+                old_amount + start, block_distances[:, :old_amount].T
+            )
+
+            # The sample never contains the point itself
+            sample = self._rng.choice(
+                datapoint_amount, sample_amount + 1, replace=False
+            )
+            sampled = block_distances[:, sample]
+            indices_of_rows = old_amount + start + rows
+            sampled[sample[None, :] == indices_of_rows[:, None]] = np.inf
+            samples[start:end] = np.sort(sampled, axis=1)[:, :sample_amount]
+
+            block_distances[rows, indices_of_rows] = -np.inf
+            nearest = np.argpartition(block_distances, k, axis=1)[:, :k + 1]
+            nearest_distances = np.take_along_axis(
+                block_distances, nearest, axis=1
+            )
+            order = np.argsort(nearest_distances, axis=1, kind="stable")
+            indices[start:end] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:end] = np.take_along_axis(
+                nearest_distances, order, axis=1
+            )
+            distances[start:end, 0] = 0.0
+
+        self._positions = all_positions
+        self._indices = np.concatenate([self._indices, indices])
+        self._distances = np.concatenate([self._distances, distances])
+        self._distance_samples = np.concatenate(
+            [self._distance_samples[:, :sample_amount], samples]
+        )
+
+    def _merge_into_existing(self, first_index: int, distances: np.ndarray):
+        k = self.k
+        candidates = np.broadcast_to(
+            np.arange(first_index, first_index + distances.shape[1]),
+            distances.shape
+        )
+        # Only rows with a new datapoint closer than their K-th neighbor
+        # change
+        rows = np.flatnonzero(
+            distances.min(axis=1) < self._distances[:, -1]
+        )
+        if len(rows) == 0:
+            return
+        merged_indices = np.concatenate(
+            [self._indices[rows, 1:], candidates[rows]], axis=1
+        )
+        merged_distances = np.concatenate(
+            [self._distances[rows, 1:], distances[rows]], axis=1
+        )
+        order = np.argsort(merged_distances, axis=1, kind="stable")[:, :k]
+        self._indices[rows, 1:] = np.take_along_axis(
+            merged_indices, order, axis=1
+        )
+        self._distances[rows, 1:] = np.take_along_axis(
+            merged_distances, order, axis=1
+        )
+
+    def dump(self, filename: str):
+        TopKNeighbors.dump(
+            filename, self._distance_metric, self._positions,
+            self._indices, self._distances, self._distance_samples
+        )
@@ -0,0 +1,19 @@
+import os
+import numpy as np
+from typing import Dict
+
+# The floating point type that the dimensionality reduction, its inverse
+# and the metrics compute in. float32 halves the memory traffic of every
+# projection, float64 is the reference. It is set per instance, the
+# COMPUTE_DTYPE environment variable sets the default.
+COMPUTE_DTYPES: Dict[str, type] = {
+    "float64": np.float64,
+    "float32": np.float32
+}
+DEFAULT_COMPUTE_DTYPE: str = os.environ.get("COMPUTE_DTYPE", "float64")
+
+
+def compute_dtype(name: str) -> type:
+    if name not in COMPUTE_DTYPES:
+        raise ValueError(f"Invalid compute dtype: {name}")
+    return COMPUTE_DTYPES[name]
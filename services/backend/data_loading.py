@@ -3,9 +3,10 @@ from torch.utils.data.dataloader import DataLoader
 import datasets
 import os
 import numpy as np
-from typing import List
 import torch
 
+from preprocessing import pad_upper_triangles
+
 
 class DataModule(L.LightningDataModule):
     """
@@ -176,17 +177,4 @@ def make_process_function(max_landmarks):
 
 
 def process_single_input(inp, max_landmarks):
-    def _pad_array(array):
-        return np.pad(
-            array,
-            ((0, max_landmarks - array.shape[0]), (0, max_landmarks - array.shape[1])),
-            mode="constant",
-            constant_values=-1,
-        )
-
-    def _take_upper_triangle(array: np.ndarray) -> List[float]:
-        indices = np.triu_indices(max_landmarks, k=1)
-        values = array[indices]
-        return values.tolist()
-
-    return torch.tensor(_take_upper_triangle(_pad_array(inp)))
+    return torch.from_numpy(pad_upper_triangles([inp], max_landmarks)[0])
@@ -2,10 +2,74 @@ from __future__ import annotations
 import os
 import json
 import pickle
+import hashlib
+import tempfile
+import threading
+import numpy as np
 import pandas as pd
-from typing import Any, List, Dict
+from typing import Any, ClassVar, List, Dict
 
-from neighbors import CachedNeighbors
+from neighbors import CachedNeighbors, TopKNeighbors
+from approximate_neighbors import RandomProjectionForest, TopKNeighborsPatch
+from quantized_embeddings import QuantizedEmbeddings
+from compute_dtype import DEFAULT_COMPUTE_DTYPE, compute_dtype
+
+
+# Rows per block of the landmark distances
+DISTANCE_BLOCK_SIZE: int = 4096
+# Bytes per read of `file_fingerprint`
+FINGERPRINT_CHUNK_SIZE: int = 2 ** 24
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Returns the sha256 of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(FINGERPRINT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def landmark_distances(
+    embeddings: np.ndarray,
+    landmarks: np.ndarray,
+    distance_metric: str,
+    dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+) -> np.ndarray:
+    """
+    Returns the distances of embeddings to landmarks. They are computed in
+    blocks of rows, so no (N, D) copy of the embeddings and no temporaries
+    of another dtype are created.
+
+    :param embeddings: The (N, D) embeddings, e.g. a memmap.
+    :param landmarks: The (L, D) landmark embeddings.
+    :param distance_metric: "euclidean" or "cosine".
+    :param dtype: The dtype to compute in.
+
+    :return: The (N, L) distances.
+    """
+    if distance_metric not in ('euclidean', 'cosine'):
+        raise ValueError(f"Invalid distance metric: {distance_metric}")
+    landmarks = np.asarray(landmarks, dtype=dtype)
+    landmark_squared_norms = np.einsum('ld,ld->l', landmarks, landmarks)
+    distances = np.empty((len(embeddings), len(landmarks)), dtype=dtype)
+    for start in range(0, len(embeddings), DISTANCE_BLOCK_SIZE):
+        block = slice(start, start + DISTANCE_BLOCK_SIZE)
+        rows = np.asarray(embeddings[block]).astype(dtype, copy=False)
+        squared_norms = np.einsum('nd,nd->n', rows, rows)[:, np.newaxis]
+        dots = rows @ landmarks.T
+        if distance_metric == 'euclidean':
+            distances[block] = np.sqrt(np.maximum(
+                squared_norms + landmark_squared_norms - 2 * dots, 0
+            ))
+        else:
+            distances[block] = 1 - dots / np.maximum(
+                np.sqrt(squared_norms * landmark_squared_norms),
+                np.finfo(dtype).tiny
+            )
+    return distances
 
 
 class Dataset:
@@ -21,19 +85,45 @@ class Dataset:
     _no_neighbors: bool
 
     _dataset_path: str
+    _embeddings_path: str
     _cosine_neighbors_path: str
     _euclidean_neighbors_path: str
     _metadata_path: str
 
     _dataframe: pd.DataFrame
-    _cosine_neighbors: CachedNeighbors
-    _euclidean_neighbors: CachedNeighbors
+    _embeddings: np.ndarray | None
+    _embeddings_fingerprint: str | None
+    _quantized_embeddings: QuantizedEmbeddings | None
+    _cosine_neighbors: CachedNeighbors | TopKNeighbors
+    _euclidean_neighbors: CachedNeighbors | TopKNeighbors
     _metadata: Dict[str, Any]
 
+    _shared: ClassVar[Dict[str, Dataset]] = {}
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
     @classmethod
     def all(cls, no_neighbors: bool = True) -> List[Dataset]:
         return [cls(name, no_neighbors) for name in cls.VALID_NAMES]
 
+    @classmethod
+    def get(cls, name: str) -> Dataset:
+        """
+        Returns the process wide shared dataset with the given name,
+        loading it on first use.
+        """
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls(name)
+            return cls._shared[name]
+
+    @classmethod
+    def loaded_names(cls) -> List[str]:
+        """
+        Returns the names of the shared datasets that are already loaded.
+        """
+        with cls._shared_lock:
+            return list(cls._shared)
+
     @property
     def name(self) -> str:
         return self._name
@@ -42,6 +132,38 @@ class Dataset:
     def dataset_path(self) -> str:
         return self._dataset_path
 
+    @classmethod
+    def data_path(cls, filename: str) -> str:
+        """
+        Returns the path of a file in the data directory.
+        """
+        inside_docker = bool(os.environ.get('INSIDE_DOCKER', False))
+        return os.path.join(
+            cls.DOCKER_PATH if inside_docker else cls.LOCAL_PATH, filename
+        )
+
+    @staticmethod
+    def embeddings_filename(name: str, datapoint_amount: int) -> str:
+        return f"{name}_embeddings_{datapoint_amount}.npy"
+
+    @staticmethod
+    def labels_filename(name: str, datapoint_amount: int) -> str:
+        return f"{name}_labels_{datapoint_amount}.npy"
+
+    @staticmethod
+    def neighbors_filename(name: str, distance_metric: str) -> str:
+        if distance_metric not in ('euclidean', 'cosine'):
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+        return f"{name}_{distance_metric}_neighbors.bin"
+
+    @property
+    def embeddings_path(self) -> str:
+        """
+        The path of the .npy cache of the embeddings, see
+        `embeddings_file`.
+        """
+        return self._embeddings_path
+
     @property
     def cosine_neighbors_path(self) -> str:
         return self._cosine_neighbors_path
@@ -50,6 +172,25 @@ class Dataset:
     def euclidean_neighbors_path(self) -> str:
         return self._euclidean_neighbors_path
 
+    def topk_neighbors_path(self, distance_metric: str) -> str:
+        """
+        Returns the path of the approximate top-K neighbors, which are used
+        if the exact neighbors of the distance metric do not exist or do not
+        match the dataset after an append.
+        """
+        root, extension = os.path.splitext(
+            self.neighbors_path(distance_metric)
+        )
+        return root + TopKNeighbors.FILENAME_SUFFIX + extension
+
+    def neighbors_path(self, distance_metric: str) -> str:
+        if distance_metric == 'cosine':
+            return self._cosine_neighbors_path
+        elif distance_metric == 'euclidean':
+            return self._euclidean_neighbors_path
+        else:
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+
     @property
     def metadata_path(self) -> str:
         return self._metadata_path
@@ -59,13 +200,127 @@ class Dataset:
         return self._dataframe
 
     @property
-    def cosine_neighbors(self) -> CachedNeighbors | None:
+    def embeddings(self) -> np.ndarray:
+        """
+        Returns the embeddings of all datapoints as one contiguous
+        (N, D) float32 array. It is built on first access and shared by all
+        users of this dataset.
+        """
+        if self._embeddings is None:
+            if self._embeddings_file_is_current():
+                self._embeddings = np.load(
+                    self._embeddings_path, mmap_mode='r'
+                )
+            else:
+                self._embeddings = np.ascontiguousarray(
+                    np.vstack(self._dataframe['embeddings'].to_numpy()),
+                    dtype=np.float32
+                )
+                self._embeddings.flags.writeable = False
+        return self._embeddings
+
+    def embeddings_file(self) -> str:
+        """
+        Writes the embeddings to a .npy file next to the dataset unless it
+        is up to date and returns its path. Other processes can map the
+        file instead of loading the dataset.
+        """
+        if not self._embeddings_file_is_current():
+            self._write_cache(self._embeddings_path, self.embeddings)
+        return self._embeddings_path
+
+    def embeddings_fingerprint(self) -> str:
+        """
+        Returns the `file_fingerprint` of `embeddings_file`. It tells
+        whether processes that map the cache, e.g. shard workers, see the
+        same revision of the dataset.
+        """
+        if self._embeddings_fingerprint is None:
+            self._embeddings_fingerprint = file_fingerprint(
+                self.embeddings_file()
+            )
+        return self._embeddings_fingerprint
+
+    def labels_file(self) -> str:
+        """
+        Writes the labels to a .npy file next to the dataset unless it is
+        up to date and returns its path, see `embeddings_file`.
+        """
+        path = self.data_path(self.labels_filename(self._name, len(self)))
+        if not self.cache_is_current(self._name, path, len(self)):
+            self._write_cache(path, np.asarray(self.label_array.tolist()))
+        return path
+
+    @classmethod
+    def cache_is_current(
+        cls, name: str, path: str, datapoint_amount: int
+    ) -> bool:
+        """
+        Returns whether the .npy cache of a dataset exists, is newer than
+        the dataset and has a row per datapoint. The dataset is not loaded.
+        """
+        return (
+            os.path.exists(path)
+            and os.stat(path).st_mtime_ns >= os.stat(
+                cls.data_path(f"{name}_embeddings.pkl")
+            ).st_mtime_ns
+            and len(np.load(path, mmap_mode='r')) == datapoint_amount
+        )
+
+    def _embeddings_file_is_current(self) -> bool:
+        # After an append the file may belong to the new version of the
+        # dataset
+        return self.cache_is_current(
+            self._name, self._embeddings_path, len(self)
+        )
+
+    @staticmethod
+    def _write_cache(path: str, array: np.ndarray):
+        # Concurrent writers each write their own temporary file
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            prefix=os.path.basename(path),
+            suffix=".tmp"
+        )
+        with os.fdopen(descriptor, 'wb') as file:
+            np.save(file, array)
+        os.replace(temporary_path, path)
+
+    @property
+    def quantized_embeddings(self) -> QuantizedEmbeddings:
+        """
+        Returns an int8 copy of the embeddings with one scale per row for
+        fast approximate distances. It is built on first access and shared
+        by all users of this dataset.
+        """
+        if self._quantized_embeddings is None:
+            self._quantized_embeddings = QuantizedEmbeddings(self.embeddings)
+        return self._quantized_embeddings
+
+    def landmark_distances(
+        self,
+        landmarks: np.ndarray,
+        distance_metric: str,
+        dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+    ) -> np.ndarray:
+        """
+        Returns the (N, L) distances of all datapoints to the (L, D)
+        landmark embeddings, see `landmark_distances`.
+        """
+        return landmark_distances(
+            self.embeddings, landmarks, distance_metric, dtype
+        )
+
+    @property
+    def cosine_neighbors(self) -> CachedNeighbors | TopKNeighbors | None:
         if self._no_neighbors:
             return None
         return self._cosine_neighbors
 
     @property
-    def euclidean_neighbors(self) -> CachedNeighbors | None:
+    def euclidean_neighbors(
+        self
+    ) -> CachedNeighbors | TopKNeighbors | None:
         if self._no_neighbors:
             return None
         return self._euclidean_neighbors
@@ -74,7 +329,13 @@ class Dataset:
     def labels(self) -> List[str]:
         return self._metadata['labels']
 
-    def neighbors(self, distance_metric: str) -> CachedNeighbors:
+    @property
+    def label_array(self) -> np.ndarray:
+        return self._dataframe['label'].to_numpy()
+
+    def neighbors(
+        self, distance_metric: str
+    ) -> CachedNeighbors | TopKNeighbors:
         if distance_metric == 'cosine':
             return self.cosine_neighbors
         elif distance_metric == 'euclidean':
@@ -82,6 +343,105 @@ class Dataset:
         else:
             raise ValueError(f"Invalid distance metric: {distance_metric}")
 
+    @classmethod
+    def open_neighbors(
+        cls,
+        name: str,
+        distance_metric: str,
+        datapoint_amount: int | None = None
+    ) -> CachedNeighbors | TopKNeighbors:
+        """
+        Maps the neighbors of a dataset without loading it. The exact
+        neighbors are used if they have `datapoint_amount` datapoints,
+        otherwise the top-K neighbors. Without a datapoint amount the
+        neighbors with more datapoints, those of the last append, are used.
+        """
+        path = cls.data_path(cls.neighbors_filename(name, distance_metric))
+        root, extension = os.path.splitext(path)
+        topk_path = root + TopKNeighbors.FILENAME_SUFFIX + extension
+        if not os.path.exists(topk_path):
+            return CachedNeighbors(path)
+        if os.path.exists(path):
+            neighbors = CachedNeighbors(path)
+            if datapoint_amount is None:
+                datapoint_amount = max(
+                    neighbors.datapoint_amount,
+                    TopKNeighbors(topk_path).datapoint_amount
+                )
+            if neighbors.datapoint_amount == datapoint_amount:
+                return neighbors
+        # Appended datasets only have current top-K neighbors
+        return TopKNeighbors(topk_path)
+
+    def _load_neighbors(
+        self, distance_metric: str
+    ) -> CachedNeighbors | TopKNeighbors:
+        return self.open_neighbors(self._name, distance_metric, len(self))
+
+    def append(
+        self,
+        rows: pd.DataFrame,
+        k: int = RandomProjectionForest.DEFAULT_K
+    ) -> Dataset:
+        """
+        Appends embedded rows to the dataset and patches the neighbors of
+        both distance metrics instead of rebuilding them. The new rows get
+        their neighbors among all datapoints and the existing datapoints
+        take in new rows closer than their K-th neighbor, so the work grows
+        with the number of new rows. Exact neighbors are replaced by top-K
+        neighbors.
+
+        This dataset is not changed, instances that use it keep working on
+        the old rows. The returned dataset replaces it as the shared one.
+
+        :param rows: The new rows with the same columns as `dataframe`.
+        :param k: The amount of neighbors per datapoint if the current
+            neighbors are exact.
+
+        :return: The dataset with the new rows.
+        """
+        missing_columns = set(self._dataframe.columns) - set(rows.columns)
+        if missing_columns:
+            raise ValueError(f"Missing columns: {sorted(missing_columns)}")
+        unknown_labels = set(rows['label']) - set(self.labels)
+        if unknown_labels:
+            raise ValueError(f"Unknown labels: {sorted(unknown_labels)}")
+        rows = rows[list(self._dataframe.columns)]
+        if len(rows) == 0:
+            return self
+        positions = np.vstack(rows['embeddings'].to_numpy()).astype(
+            np.float32
+        )
+
+        for distance_metric in ('euclidean', 'cosine'):
+            if self._no_neighbors:
+                neighbors = self._load_neighbors(distance_metric)
+            else:
+                neighbors = self.neighbors(distance_metric)
+            patch = TopKNeighborsPatch(neighbors, k=k)
+            patch.append(positions)
+            patch.dump(self.topk_neighbors_path(distance_metric))
+
+        # The neighbors are written first, the exact neighbors of an
+        # interrupted first append still match the old dataframe
+        dataframe = pd.concat([self._dataframe, rows], ignore_index=True)
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(self._dataset_path),
+            prefix=os.path.basename(self._dataset_path),
+            suffix=".tmp"
+        )
+        with os.fdopen(descriptor, 'wb') as file:
+            dataframe.to_pickle(file)
+        os.replace(temporary_path, self._dataset_path)
+
+        # The files of the replaced neighbors stay valid for the maps of
+        # this dataset
+        dataset = Dataset(self._name, self._no_neighbors)
+        with self._shared_lock:
+            if self._shared.get(self._name) is self:
+                self._shared[self._name] = dataset
+        return dataset
+
     def __len__(self) -> int:
         return len(self._dataframe)
 
@@ -91,34 +451,27 @@ class Dataset:
         self._name = name
         self._no_neighbors = no_neighbors
 
-        inside_docker = bool(os.environ.get('INSIDE_DOCKER', False))
-
-        self._dataset_path = os.path.join(
-            self.DOCKER_PATH if inside_docker else self.LOCAL_PATH,
-            f"{self._name}_embeddings.pkl"
-        )
-        self._cosine_neighbors_path = os.path.join(
-            self.DOCKER_PATH if inside_docker else self.LOCAL_PATH,
-            f"{self._name}_cosine_neighbors.bin"
+        self._dataset_path = self.data_path(f"{self._name}_embeddings.pkl")
+        self._cosine_neighbors_path = self.data_path(
+            self.neighbors_filename(self._name, 'cosine')
         )
-        self._euclidean_neighbors_path = os.path.join(
-            self.DOCKER_PATH if inside_docker else self.LOCAL_PATH,
-            f"{self._name}_euclidean_neighbors.bin"
-        )
-        self._metadata_path = os.path.join(
-            self.DOCKER_PATH if inside_docker else self.LOCAL_PATH,
-            f"{self._name}_meta.json"
+        self._euclidean_neighbors_path = self.data_path(
+            self.neighbors_filename(self._name, 'euclidean')
         )
+        self._metadata_path = self.data_path(f"{self._name}_meta.json")
 
         with open(self._dataset_path, 'rb') as file:
             self._dataframe = pickle.load(file)
+        # Every version of an appended dataset has its own cache
+        self._embeddings_path = self.data_path(
+            self.embeddings_filename(self._name, len(self._dataframe))
+        )
+        self._embeddings = None
+        self._embeddings_fingerprint = None
+        self._quantized_embeddings = None
         if not self._no_neighbors:
-            self._cosine_neighbors = CachedNeighbors(
-                self._cosine_neighbors_path
-            )
-            self._euclidean_neighbors = CachedNeighbors(
-                self._euclidean_neighbors_path
-            )
+            self._cosine_neighbors = self._load_neighbors('cosine')
+            self._euclidean_neighbors = self._load_neighbors('euclidean')
         with open(self._metadata_path, 'r') as file:
             self._metadata = json.load(file)
 
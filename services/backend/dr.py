@@ -1,51 +1,253 @@
+from __future__ import annotations
+import os
+import sys
+import json
+import tempfile
 import pandas as pd
 import numpy as np
-import itertools
 from random import Random
-from sklearn.metrics.pairwise import euclidean_distances, cosine_distances
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Mapping, Tuple
 
 from metrics import Metrics
-from dataset import Dataset
+from dataset import Dataset, landmark_distances
+from history import LandmarkHistory
+from jobs import ProgressCallback, no_progress
+from instance_state import InstanceState
 from idr import InverseDimensionaltyReduction
+from compute_dtype import DEFAULT_COMPUTE_DTYPE, compute_dtype
+from sharded_projection import ShardedProjection
+from streaming_projection import StreamingProjection
+from shard_workers import ShardCoordinator, ShardUnavailable
+
+
+class StaleSnapshot(ValueError):
+    """
+    Raised when restoring a snapshot of an instance of another version of
+    its dataset, e.g. from before rows were appended.
+    """
+
+
+# Above this many landmarks the top eigenpairs are computed with Lanczos
+# iterations instead of a dense eigensolver
+SPARSE_EIGENSOLVER_THRESHOLD: int = 256
+
+
+def top_eigenpairs(
+    delta_n: np.ndarray, dimension: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the `dimension` largest eigenvalues of the mean centered
+    "inner-product" matrix of the squared landmark distances in decreasing
+    order and their eigenvectors. Neither the mean centering matrix nor
+    the other eigenpairs are computed.
+
+    :param delta_n: The (L, L) squared distances between the landmarks.
+    :param dimension: The number of eigenpairs.
+
+    :return: The (dimension,) eigenvalues and (L, dimension) eigenvectors.
+    """
+    # scipy is imported lazily to keep the server start fast
+    from scipy.linalg import eigh
+    from scipy.sparse.linalg import eigsh
+
+    # B is the mean centered "inner-product" matrix -1/2 H Deltan H with the
+    # mean centering matrix H, i.e. Deltan minus its row and column means
+    # plus its overall mean
+    num_landmarks = len(delta_n)
+    row_means = delta_n.mean(axis=1, keepdims=True)
+    B = delta_n - row_means
+    B -= delta_n.mean(axis=0, keepdims=True)
+    B += row_means.mean()
+    B *= -1 / 2
+
+    # The fixed start vector makes the Lanczos iterations deterministic. It
+    # must not be constant, constant vectors are in the kernel of B.
+    if num_landmarks > SPARSE_EIGENSOLVER_THRESHOLD:
+        eigenvalues, eigenvectors = eigsh(
+            B, k=dimension, which='LA',
+            v0=np.random.default_rng(0).random(num_landmarks).astype(B.dtype)
+        )
+    else:
+        eigenvalues, eigenvectors = eigh(
+            B, subset_by_index=[num_landmarks - dimension, num_landmarks - 1]
+        )
+
+    # We sort the eigenvalues and eigenvectors by decreasing eigenvalues
+    idx = eigenvalues.argsort()[::-1]
+    return eigenvalues[idx], eigenvectors[:, idx]
+
+
+def set_distances(
+    points: np.ndarray,
+    distance_metric: str,
+    dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+) -> np.ndarray:
+    """
+    Returns the pairwise distances within each of many sets of points with
+    one batched matrix product. Like the sklearn distances, they are
+    clipped to valid values and the diagonals are 0.
+
+    :param points: The (S, L, D) points of S sets.
+    :param distance_metric: "euclidean" or "cosine".
+    :param dtype: The dtype to compute in.
+
+    :return: The (S, L, L) distances.
+    """
+    points = np.asarray(points, dtype=dtype)
+    dots = points @ points.transpose(0, 2, 1)
+    squared_norms = np.einsum('sll->sl', dots)
+    if distance_metric == 'euclidean':
+        distances = squared_norms[:, :, np.newaxis] - 2 * dots
+        distances += squared_norms[:, np.newaxis, :]
+        np.sqrt(np.maximum(distances, 0, out=distances), out=distances)
+    elif distance_metric == 'cosine':
+        norms = np.maximum(np.sqrt(squared_norms), np.finfo(dtype).tiny)
+        distances = 1 - dots / (
+            norms[:, :, np.newaxis] * norms[:, np.newaxis, :]
+        )
+        np.clip(distances, 0, 2, out=distances)
+    else:
+        raise ValueError(f"Invalid distance metric: {distance_metric}")
+    np.einsum('sll->sl', distances)[:] = 0
+    return distances
 
 
 def balanced_heuristic(
     dataset: Dataset, num_landmarks: int, seed: int
 ) -> pd.DataFrame:
-    df = dataset.dataframe.sample(frac=1, random_state=seed)
-    label_dfs = [df[df["label"] == label] for label in df["label"].unique()]
-    Random(seed).shuffle(label_dfs)
-
-    return pd.concat(
-        [
-            label_df.iloc[i % num_landmarks].to_frame().T
-            for i, label_df in zip(
-                range(num_landmarks), itertools.cycle(label_dfs)
-            )
-        ]
+    """
+    Selects landmarks from the labels in turn. The labels are in random
+    order and the i-th landmark is the i-th datapoint of its label in a
+    random order of all datapoints.
+    """
+    permutation = np.random.RandomState(seed).permutation(len(dataset))
+    codes, labels = pd.factorize(
+        dataset.dataframe["label"].to_numpy()[permutation]
+    )
+    label_order = list(range(len(labels)))
+    Random(seed).shuffle(label_order)
+
+    # The shuffled datapoints grouped by label
+    grouped = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(labels))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    ranks = np.arange(num_landmarks)
+    landmark_codes = np.asarray(label_order)[ranks % len(labels)]
+    too_few = ranks >= counts[landmark_codes]
+    if too_few.any():
+        raise ValueError(
+            f"Not enough datapoints of label "
+            f"{labels[landmark_codes[too_few][0]]} for {num_landmarks} "
+            "balanced landmarks!"
+        )
+    return dataset.dataframe.iloc[
+        permutation[grouped[starts[landmark_codes] + ranks]]
+    ]
+
+
+def _incremental_heuristic(
+    dataset: Dataset,
+    num_landmarks: int,
+    seed: int,
+    distance_metric: str,
+    dtype: type,
+    choose: Callable[[np.ndarray, np.random.Generator], int]
+) -> pd.DataFrame:
+    """
+    Selects a random first landmark and then one landmark at a time from
+    the distances of all datapoints to their nearest landmark so far. The
+    distances are updated with the distances to each new landmark only, so
+    the selection takes O(N * L) distance computations.
+
+    :param choose: Returns the index of the next landmark from the
+        distances to the nearest landmark, which are -1 for landmarks.
+    """
+    embeddings = dataset.embeddings
+    rng = np.random.default_rng(seed)
+    indices = [int(rng.integers(len(dataset)))]
+    min_distances = np.full(len(dataset), np.inf, dtype=dtype)
+    for _ in range(1, num_landmarks):
+        np.minimum(
+            min_distances,
+            landmark_distances(
+                embeddings, embeddings[indices[-1:]], distance_metric, dtype
+            )[:, 0],
+            out=min_distances
+        )
+        min_distances[indices[-1]] = -1
+        indices.append(choose(min_distances, rng))
+    return dataset.dataframe.iloc[indices]
+
+
+def maxmin_heuristic(
+    dataset: Dataset,
+    num_landmarks: int,
+    seed: int,
+    distance_metric: str,
+    dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+) -> pd.DataFrame:
+    """
+    Farthest point selection, every landmark is the datapoint farthest
+    from all previous landmarks.
+    """
+    return _incremental_heuristic(
+        dataset, num_landmarks, seed, distance_metric, dtype,
+        lambda min_distances, _: int(np.argmax(min_distances))
+    )
+
+
+def kmeans_plus_plus_heuristic(
+    dataset: Dataset,
+    num_landmarks: int,
+    seed: int,
+    distance_metric: str,
+    dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+) -> pd.DataFrame:
+    """
+    k-means++ seeding, every landmark is drawn with a probability
+    proportional to the squared distance to its nearest previous landmark.
+    """
+    def choose(min_distances: np.ndarray, rng: np.random.Generator) -> int:
+        weights = np.maximum(min_distances, 0).astype(np.float64) ** 2
+        if weights.sum() == 0:
+            # Only duplicates of landmarks are left
+            weights = (min_distances >= 0).astype(np.float64)
+        return int(rng.choice(len(weights), p=weights / weights.sum()))
+
+    return _incremental_heuristic(
+        dataset, num_landmarks, seed, distance_metric, dtype, choose
     )
 
 
 class DimensionalityReduction:
-    HEURISTICS: List[str] = ["balanced", "random", "first"]
+    HEURISTICS: List[str] = [
+        "balanced", "random", "first", "maxmin", "kmeans++"
+    ]
     DISTANCE_METRICS: List[str] = ["euclidean", "cosine"]
+    # The neural iDR networks are trained for at most 30 landmarks, the
+    # other iDR algorithms work with thousands
     LANDMARK_AMOUNT_RANGE: Tuple[int, int] = (10, 30)
+    EXTENDED_LANDMARK_AMOUNT_RANGE: Tuple[int, int] = (10, 2000)
+    # int8 landmark distances are faster but approximate, they are meant
+    # for interactive updates
+    LANDMARK_DISTANCE_PRECISIONS: List[str] = ["float64", "int8"]
 
     _heuristic: str
     _distance_metric: str
     _num_landmarks: int
-    _dataset: pd.DataFrame
+    _dataset: Dataset
     _dimension: int
+    _compute_dtype: str
+    _dtype: type
 
     _heuristic_func: Callable
     _distance_metric_func: Callable
 
-    _landmarks: pd.DataFrame | None
-    _no_landmark_points: pd.DataFrame | None
+    _state: InstanceState | None
 
-    _landmark_embeddings: np.ndarray | None
     _delta_n: np.ndarray | None
+    _delta_n_old: np.ndarray | None
     _eigenvalues: np.ndarray | None
     _eigenvectors: np.ndarray | None
 
@@ -53,8 +255,11 @@ class DimensionalityReduction:
     _points_calculated: bool
 
     _metrics: Metrics
+    _history: LandmarkHistory
 
     _last_idr_algorithm: str | None
+    _last_precision: str | None
+    _version: int
 
     def __init__(
         self,
@@ -63,7 +268,8 @@ class DimensionalityReduction:
         num_landmarks: int,
         dataset: Dataset,
         dimension: int = 2,
-        create_dataset: bool = False
+        create_dataset: bool = False,
+        compute_dtype_name: str = DEFAULT_COMPUTE_DTYPE
     ):
         self._heuristic = heuristic
         if heuristic == "random":
@@ -80,13 +286,32 @@ class DimensionalityReduction:
             )
         elif heuristic == "balanced":
             self._heuristic_func = balanced_heuristic
+        elif heuristic == "maxmin":
+            self._heuristic_func = (
+                lambda dataset, num_landmarks, seed: maxmin_heuristic(
+                    dataset, num_landmarks, seed, self._distance_metric,
+                    self._dtype
+                )
+            )
+        elif heuristic == "kmeans++":
+            self._heuristic_func = (
+                lambda dataset, num_landmarks, seed: (
+                    kmeans_plus_plus_heuristic(
+                        dataset, num_landmarks, seed, self._distance_metric,
+                        self._dtype
+                    )
+                )
+            )
         else:
             raise NotImplementedError(f"Unknown heuristic: {heuristic}")
 
         self._distance_metric = distance_metric
+        # sklearn is imported lazily to keep the server start fast
         if distance_metric == "euclidean":
+            from sklearn.metrics.pairwise import euclidean_distances
             self._distance_metric_func = euclidean_distances
         elif distance_metric == "cosine":
+            from sklearn.metrics.pairwise import cosine_distances
             self._distance_metric_func = cosine_distances
         else:
             raise NotImplementedError(
@@ -96,52 +321,108 @@ class DimensionalityReduction:
         self._num_landmarks = num_landmarks
         self._dataset = dataset
         self._dimension = dimension
+        self._dtype = compute_dtype(compute_dtype_name)
+        self._compute_dtype = compute_dtype_name
 
-        self._landmarks = None
-        self._no_landmark_points = None
+        self._state = None
 
-        self._landmark_embeddings = None
         self._delta_n = None
+        self._delta_n_old = None
         self._eigenvalues = None
         self._eigenvectors = None
 
-        self._landmarks_reduces = False
+        self._landmarks_reduced = False
         self._points_calculated = False
 
         if not create_dataset:
             self._metrics = Metrics(
-                distance_metric, dataset.neighbors(distance_metric)
+                distance_metric, dataset.neighbors(distance_metric),
+                self._dtype
             )
+        self._history = LandmarkHistory()
 
         self._last_idr_algorithm = None
+        self._last_precision = None
+        self._version = 0
+
+    @classmethod
+    def max_landmark_amount(cls, idr_algorithm: str) -> int:
+        """
+        Returns the maximum number of landmarks the iDR algorithm supports.
+        """
+        if idr_algorithm in InverseDimensionaltyReduction.NEURAL_NETWORK_NAMES:
+            return cls.LANDMARK_AMOUNT_RANGE[1]
+        return cls.EXTENDED_LANDMARK_AMOUNT_RANGE[1]
 
     @property
     def distance_metric(self) -> str:
         return self._distance_metric
 
+    @property
+    def num_landmarks(self) -> int:
+        return self._num_landmarks
+
+    @property
+    def compute_dtype(self) -> str:
+        return self._compute_dtype
+
+    @property
+    def dataset(self) -> Dataset:
+        return self._dataset
+
+    @property
+    def state(self) -> InstanceState:
+        if self._state is None:
+            raise RuntimeError("Landmarks not selected!")
+        return self._state
+
     @property
     def landmarks(self) -> pd.DataFrame:
-        return self._landmarks
+        """
+        Returns the landmarks as a small DataFrame built from the dataset.
+        """
+        landmarks = self._dataset.dataframe.iloc[self.state.landmark_indices]
+        if not self.landmarks_reduced:
+            return landmarks
+        return landmarks.assign(
+            position=self.state.landmark_positions.tolist(), landmark=True
+        )
 
     @landmarks.setter
     def landmarks(self, landmarks: pd.DataFrame):
-        self._landmarks = landmarks.copy()
+        self.move_landmarks(dict(zip(landmarks.index, landmarks["position"])))
 
     @property
-    def no_landmark_points(self) -> pd.DataFrame:
-        return self._no_landmark_points
+    def history(self) -> LandmarkHistory:
+        return self._history
 
     @property
-    def all_points(self):
-        if self._landmarks is None:
-            raise RuntimeError("Landmarks not selected!")
-        if self._no_landmark_points is None:
-            raise RuntimeError("Points not computed!")
-        return pd.concat([self._landmarks, self._no_landmark_points])
+    def max_metrics_k(self) -> int:
+        return self._metrics.max_k
+
+    @property
+    def version(self) -> int:
+        """
+        Increases whenever the state that is part of the snapshot changes.
+        """
+        return self._version
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns an estimate of the memory held by this instance, not
+        counting the shared dataset.
+        """
+        nbytes = self._history.cache_size
+        if self._state is not None:
+            nbytes += self._state.nbytes
+        if hasattr(self, "_metrics"):
+            nbytes += self._metrics.nbytes
+        return nbytes
 
     @property
     def landmarks_selected(self) -> bool:
-        return self._landmarks is not None
+        return self._state is not None
 
     @property
     def landmarks_reduced(self) -> bool:
@@ -156,44 +437,125 @@ class DimensionalityReduction:
         """
         Returns the high dimensional embeddings of the landmarks.
         """
-        return np.vstack(self._landmarks["embeddings"].apply(np.array))
+        return self._dataset.embeddings[self.state.landmark_indices]
 
     @property
     def low_landmark_embeddings(self) -> np.array:
         """
         Returns the 2D embeddings of the landmarks.
         """
-        return np.vstack(self._landmarks["position"].apply(np.array))
+        return self.state.landmark_positions
 
     def distances(self, vector1: np.array, vector2: np.array) -> np.ndarray:
         return self._distance_metric_func(vector1, vector2)
 
-    def compute_metrics(self, k: int) -> Dict[str, Any]:
+    def compute_metrics(
+        self,
+        k: int,
+        progress: ProgressCallback = no_progress,
+        shards: ShardCoordinator | None = None
+    ) -> Dict[str, Any]:
+        """
+        :param k: The neighborhood size.
+        :param progress: Receives the progress of the computation.
+        :param shards: Shard workers of the dataset that compute the
+            metrics instead of this process, which takes over if they
+            fail.
+        """
         if not self.points_calculated:
             raise RuntimeError("Points not calculated!")
-        return self._metrics.calculate_all_metrics(
-            self.all_points,
-            self._last_idr_algorithm,
-            hash(str(self._landmarks['position'])),
-            k
+        self._raise_for_shards(shards)
+        if not 1 <= k <= self.max_metrics_k:
+            raise ValueError(f"k must be in [1, {self.max_metrics_k}]")
+        cache_key = (
+            "metrics", self._history.current_key,
+            self._last_idr_algorithm, self._last_precision, k
+        )
+        metrics = self._history.get(cache_key)
+        if metrics is None:
+            if shards is not None:
+                progress(0.0, "sharded metrics")
+                try:
+                    metrics = shards.calculate_all_metrics(
+                        self.state.positions, self._distance_metric, k
+                    )
+                except ShardUnavailable as error:
+                    print(
+                        f"Computing the metrics locally: {error}",
+                        file=sys.stderr
+                    )
+            if metrics is None:
+                metrics = self._metrics.calculate_all_metrics(
+                    self.state.positions, self._dataset.label_array, k,
+                    progress
+                )
+            self._history.put(cache_key, metrics)
+        return metrics
+
+    def move_landmarks(self, positions: Dict[int, List[float]]):
+        """
+        Sets the positions of the given landmarks.
+
+        :param positions: Maps dataset ids of landmarks to their new position.
+        """
+        if not self.landmarks_reduced:
+            raise RuntimeError("Landmarks not reduced!")
+        indices = self._dataset.dataframe.index.get_indexer(
+            list(positions.keys())
+        )
+        if (indices < 0).any() or not self.state.landmark_mask[indices].all():
+            raise ValueError("Only landmarks can be moved!")
+        new_positions = np.asarray(
+            list(positions.values()), dtype=InstanceState.POSITION_DTYPE
         )
+        if np.array_equal(self.state.positions[indices], new_positions):
+            return
+        self.state.positions[indices] = new_positions
+        self._history.push(self.state.landmark_positions)
+        self._version += 1
+
+    def undo(self):
+        """
+        Restores the previous landmark configuration.
+        """
+        self.state.landmark_positions = self._history.undo()
+        self._version += 1
+
+    def redo(self):
+        """
+        Restores the landmark configuration that was undone last.
+        """
+        self.state.landmark_positions = self._history.redo()
+        self._version += 1
 
     def select_landmarks(self, seed: int = 42):
-        self._landmarks = self._heuristic_func(
+        landmarks = self._heuristic_func(
             self._dataset, self._num_landmarks, seed
         )
+        self._state = InstanceState(
+            len(self._dataset),
+            self._dataset.dataframe.index.get_indexer(landmarks.index),
+            self._dimension
+        )
+        # The configurations and results of the previous landmarks do not
+        # apply to the new ones
+        self._history.reset(self._state.landmark_indices)
+        self._landmarks_reduced = False
+        self._points_calculated = False
+        self._version += 1
 
     def reduce_landmarks(self):
         if not self.landmarks_selected:
             raise RuntimeError("Landmarks not selected!")
 
         # Deltan is the squared distance matrix between the landmarks
+        high_landmark_embeddings = self.high_landmark_embeddings
         self._delta_n = (
             self._distance_metric_func(
-                self.high_landmark_embeddings, self.high_landmark_embeddings
+                high_landmark_embeddings, high_landmark_embeddings
             )
             ** 2
-        )
+        ).astype(self._dtype, copy=False)
         # To cache the distance matrix
         self._delta_n_old = self._delta_n
 
@@ -209,32 +571,139 @@ class DimensionalityReduction:
                 f"for the selected dimension {self._dimension}."
             )
             return []
-        self._L = np.zeros((len(self._landmarks), self._dimension))
-        for i in range(self._dimension):
-            self._L[:, i] = self._eigenvectors[:, i] * np.sqrt(
-                self._eigenvalues[i]
-            )
+        self._L = (
+            self._eigenvectors * np.sqrt(self._eigenvalues)
+        ).astype(self._dtype, copy=False)
 
-        # Append the position of the landmarks to the dataset
-        self._landmarks = self._landmarks.assign(
-            position=self._L.tolist(), landmark=True
-        )
+        # Store the position of the landmarks
+        self.state.landmark_positions = self._L
 
         self._landmarks_reduced = True
+        self._history.push(self.state.landmark_positions)
+        self._version += 1
 
-    def calculate(self, idr_algorithm: str):
+    def select_landmark_sets(self, seeds: List[int]) -> np.ndarray:
+        """
+        Returns the landmarks the heuristic selects for each seed without
+        changing this instance.
+
+        :param seeds: The S seeds.
+
+        :return: The (S, L) dataset positions of the landmarks.
+        """
+        index = self._dataset.dataframe.index
+        return np.array([
+            index.get_indexer(
+                self._heuristic_func(
+                    self._dataset, self._num_landmarks, seed
+                ).index
+            )
+            for seed in seeds
+        ], dtype=np.int64).reshape(len(seeds), self._num_landmarks)
+
+    def reduce_landmark_sets(self, landmark_indices: np.ndarray) -> np.ndarray:
+        """
+        Reduces many sets of landmarks of the same size at once without
+        changing this instance. The distance matrices of all sets are
+        computed with one batched product and decomposed with one stacked
+        eigendecomposition, the positions equal those of
+        `reduce_landmarks` up to the signs of the axes.
+
+        :param landmark_indices: The (S, L) dataset positions of S sets
+            of landmarks, e.g. from `select_landmark_sets`.
+
+        :return: The (S, L, dimension) positions of the landmarks.
+        """
+        landmark_indices = np.asarray(landmark_indices)
+        # Deltan is the squared distance matrix between the landmarks
+        delta_n = set_distances(
+            self._dataset.embeddings[landmark_indices],
+            self._distance_metric, self._dtype
+        ) ** 2
+
+        # B is the mean centered "inner-product" matrix, see
+        # `top_eigenpairs`
+        row_means = delta_n.mean(axis=2, keepdims=True)
+        B = delta_n - row_means
+        B -= delta_n.mean(axis=1, keepdims=True)
+        B += row_means.mean(axis=1, keepdims=True)
+        B *= -1 / 2
+
+        # The eigenvalues are in increasing order
+        eigenvalues, eigenvectors = np.linalg.eigh(B)
+        eigenvalues = eigenvalues[:, :-self._dimension - 1:-1]
+        eigenvectors = eigenvectors[:, :, :-self._dimension - 1:-1]
+        if (eigenvalues <= 0).any():
+            raise ValueError(
+                "Not enough positive eigenvalues for the selected dimension "
+                f"{self._dimension} in landmark sets "
+                f"{np.flatnonzero((eigenvalues <= 0).any(axis=1)).tolist()}"
+            )
+        return eigenvectors * np.sqrt(eigenvalues)[:, np.newaxis, :]
+
+    def calculate(
+        self,
+        idr_algorithm: str,
+        progress: ProgressCallback = no_progress,
+        precision: str = LANDMARK_DISTANCE_PRECISIONS[0],
+        workers: int | None = None,
+        shards: ShardCoordinator | None = None,
+        streaming: bool | None = None
+    ):
+        """
+        Computes the positions of all datapoints that are no landmarks.
+
+        :param idr_algorithm: The inverse dimensionality reduction.
+        :param progress: Receives the progress of the computation.
+        :param precision: "float64" computes the distances to the
+            landmarks exactly, "int8" from the quantized embeddings of the
+            dataset.
+        :param workers: The number of worker processes that project shards
+            of the exact embeddings, 0 projects in this process. Defaults
+            to `ShardedProjection.default_workers()`.
+        :param shards: Shard workers of the dataset that project the exact
+            embeddings instead of this process, which takes over if they
+            fail.
+        :param streaming: Whether this process projects the memory mapped
+            exact embeddings in chunks into a memory mapped output, so its
+            memory use does not grow with the dataset. Defaults to
+            `StreamingProjection.default_streaming()`.
+        """
         if not self.landmarks_reduced:
             raise RuntimeError("Landmarks not reduced!")
+        self._raise_for_shards(shards)
+        if self._num_landmarks > self.max_landmark_amount(idr_algorithm):
+            raise ValueError(
+                f"{idr_algorithm} supports at most "
+                f"{self.max_landmark_amount(idr_algorithm)} landmarks!"
+            )
+        if precision not in self.LANDMARK_DISTANCE_PRECISIONS:
+            raise ValueError(f"Invalid precision: {precision}")
+
+        # Returning to an already computed landmark configuration
+        # is just a cache read
+        cache_key = (
+            "positions", self._history.current_key, idr_algorithm, precision
+        )
+        positions = self._history.get(cache_key)
+        if positions is not None:
+            self._assign_no_landmark_positions(
+                positions, idr_algorithm, precision
+            )
+            return
 
         # Compute new delta_n using one of the inverse dr algorithms
+        progress(0.0, "inverse dimensionality reduction")
+        low_landmark_embeddings = self.low_landmark_embeddings
         low_dimensional_distances = self._distance_metric_func(
-            self.low_landmark_embeddings, self.low_landmark_embeddings
+            low_landmark_embeddings, low_landmark_embeddings
         )
         self._delta_n = InverseDimensionaltyReduction(
-            idr_algorithm, self._distance_metric
+            idr_algorithm, self._distance_metric, self._dtype
         ).inference(low_dimensional_distances, self._delta_n_old)
 
         # recompute eigenvalues and eigenvectors
+        progress(0.2, "eigendecomposition")
         self._eigenvalues, self._eigenvectors = self._compute_eigenstuff()
 
         # The mean distance between the landmarks
@@ -243,73 +712,237 @@ class DimensionalityReduction:
 
         # L_sharp is the pseudo-inverse of L
         # given by eigenvectors * 1/sqrt(eigenvalues)
-        L_sharp = np.zeros((self._dimension, len(self._landmarks)))
-        for i in range(self._dimension):
-            L_sharp[i, :] = (
-                self._eigenvectors[:, i].transpose() * 1 / np.sqrt(
-                    self._eigenvalues[i]
-                )
+        L_sharp = (
+            self._eigenvectors / np.sqrt(self._eigenvalues)
+        ).T.astype(self._dtype)
+
+        if workers is None:
+            workers = ShardedProjection.default_workers()
+        if streaming is None:
+            streaming = StreamingProjection.default_streaming()
+        positions = None
+        if shards is not None and precision != "int8":
+            progress(0.3, "sharded projection")
+            try:
+                positions = shards.project(
+                    self.high_landmark_embeddings, mean_distance, L_sharp,
+                    self._distance_metric, self._compute_dtype
+                )[self.state.other_indices]
+            except ShardUnavailable as error:
+                print(f"Projecting locally: {error}", file=sys.stderr)
+        if positions is None:
+            positions = self._project_locally(
+                precision, workers, streaming, mean_distance, L_sharp,
+                progress
             )
 
-        # We first need to get the embeddings of the other points
-        other_points = self._dataset.dataframe[
-            ~self._dataset.dataframe.index.isin(self._landmarks.index)
-        ]
-        other_embeddings = np.vstack(
-            other_points["embeddings"].apply(np.array)
+        positions = positions.astype(InstanceState.POSITION_DTYPE)
+        self._history.put(cache_key, positions)
+        self._assign_no_landmark_positions(
+            positions, idr_algorithm, precision
         )
 
-        # We compute for each point the distance to the landmarks
-        distance_to_landmarks = (
-            self._distance_metric_func(
-                other_embeddings, self.high_landmark_embeddings
-            ) ** 2
-        )
+    def _project_locally(
+        self,
+        precision: str,
+        workers: int,
+        streaming: bool,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        progress: ProgressCallback
+    ) -> np.ndarray:
+        if workers > 0 and precision != "int8":
+            # The workers compute the distances and positions of their
+            # shards of the memory mapped embeddings
+            progress(0.3, "sharded projection")
+            return ShardedProjection(
+                self._dataset.embeddings_file(), self._distance_metric,
+                self._dtype, workers
+            ).project(
+                self.high_landmark_embeddings, mean_distance, L_sharp
+            )[self.state.other_indices]
+        elif streaming and precision != "int8":
+            return self._project_streaming(mean_distance, L_sharp, progress)
+        else:
+            return self._project(precision, mean_distance, L_sharp, progress)
 
-        # Going through each point, we compute its position
-        # by -1/2 * L_sharp * (distance_to_landmarks - mean_distance)
-        positions = np.zeros((len(other_points), self._dimension))
-        for i in range(len(other_points)):
-            position = -1 / 2 * (
-                L_sharp.dot(distance_to_landmarks[i] - mean_distance)
+    def _project(
+        self,
+        precision: str,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        progress: ProgressCallback
+    ) -> np.ndarray:
+        # We compute for each point the distance to the landmarks. The
+        # shared embedding matrix is used as is, the few landmark rows are
+        # dropped afterwards instead of copying all other embeddings.
+        progress(0.3, "landmark distances")
+        if precision == "int8":
+            distances = self._dataset.quantized_embeddings.landmark_distances(
+                self.high_landmark_embeddings, self._distance_metric
+            ).astype(self._dtype, copy=False)
+        else:
+            distances = self._dataset.landmark_distances(
+                self.high_landmark_embeddings, self._distance_metric,
+                self._dtype
             )
-            positions[i, :] = position
+        distance_to_landmarks = distances[self.state.other_indices] ** 2
 
-        # Append the position of the other points to the dataset
-        self._no_landmark_points = other_points.assign(
-            position=positions.tolist(), landmark=False
+        # For each point we compute its position
+        # by -1/2 * L_sharp * (distance_to_landmarks - mean_distance)
+        progress(0.8, "projection")
+        return -1 / 2 * (
+            (distance_to_landmarks - mean_distance).dot(L_sharp.T)
         )
 
+    def _project_streaming(
+        self,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        progress: ProgressCallback
+    ) -> np.ndarray:
+        # Only the positions of the no landmark points are read back into
+        # memory, the output file is removed afterwards
+        with tempfile.TemporaryDirectory() as directory:
+            positions = StreamingProjection(
+                self._dataset.embeddings_file(), self._distance_metric,
+                self._dtype
+            ).project(
+                self.high_landmark_embeddings, mean_distance, L_sharp,
+                os.path.join(directory, "positions.npy"),
+                lambda fraction, stage: progress(0.3 + 0.6 * fraction, stage)
+            )
+            other_positions = positions[self.state.other_indices]
+            del positions
+        return other_positions
+
+    def _raise_for_shards(self, shards: ShardCoordinator | None):
+        if shards is not None and not shards.covers(self._dataset):
+            raise ValueError(
+                f"The shard workers do not serve the dataset "
+                f"{self._dataset.name}!"
+            )
+
+    def _assign_no_landmark_positions(
+        self, positions: np.ndarray, idr_algorithm: str, precision: str
+    ):
+        self.state.other_positions = positions
         self._points_calculated = True
         self._last_idr_algorithm = idr_algorithm
+        self._last_precision = precision
+        self._version += 1
 
     def _compute_eigenstuff(self) -> Tuple[np.ndarray, np.ndarray]:
-        # H is the mean centering matrix
-        H = -np.ones(
-            (self._num_landmarks, self._num_landmarks)
-        ) / self._num_landmarks
-        np.fill_diagonal(H, 1 - 1 / self._num_landmarks)
+        return top_eigenpairs(self._delta_n, self._dimension)
 
-        # B is the mean centered "inner-product" matrix
-        B = -1 / 2 * (H.dot(self._delta_n).dot(H))
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Returns everything needed to restore this instance without
+        selecting and reducing its landmarks again.
 
-        # We compute the eigenvalues and eigenvectors of B
-        eigenvalues, eigenvectors = np.linalg.eigh(B)
+        :return: A dict of arrays that can be stored with `np.savez`.
+        """
+        if not self.landmarks_reduced:
+            raise RuntimeError("Landmarks not reduced!")
+        meta = {
+            "heuristic": self._heuristic,
+            "distance_metric": self._distance_metric,
+            "num_landmarks": self._num_landmarks,
+            "dataset_name": self._dataset.name,
+            "datapoint_amount": len(self._dataset),
+            "dimension": self._dimension,
+            "compute_dtype": self._compute_dtype,
+            "points_calculated": self._points_calculated,
+            "last_idr_algorithm": self._last_idr_algorithm,
+            "last_precision": self._last_precision,
+            "description": self.to_json()
+        }
+        return {
+            "meta": np.array(json.dumps(meta)),
+            "landmark_indices": self.state.landmark_indices,
+            "positions": self.state.positions,
+            "delta_n_old": self._delta_n_old,
+            "history_states": np.stack(self._history.states),
+            "history_cursor": np.array(self._history.cursor)
+        }
+
+    @staticmethod
+    def snapshot_meta(snapshot: Mapping[str, np.ndarray]) -> Dict[str, Any]:
+        return json.loads(str(snapshot["meta"]))
+
+    @staticmethod
+    def raise_for_stale_snapshot(datapoint_amount: int, dataset: Dataset):
+        """
+        Raises `StaleSnapshot` if a snapshot of `datapoint_amount`
+        datapoints does not belong to the current version of `dataset`.
+        """
+        if datapoint_amount != len(dataset):
+            raise StaleSnapshot(
+                f"The snapshot has {datapoint_amount} datapoints, the "
+                f"dataset {dataset.name} has {len(dataset)}!"
+            )
 
-        # We sort the eigenvalues and eigenvectors by decreasing eigenvalues
-        idx = eigenvalues.argsort()[::-1]
-        eigenvalues = eigenvalues[idx]
-        eigenvectors = eigenvectors[:, idx]
+    @classmethod
+    def from_snapshot(
+        cls, snapshot: Mapping[str, np.ndarray]
+    ) -> DimensionalityReduction:
+        """
+        Restores an instance from the output of `snapshot`.
 
-        return eigenvalues, eigenvectors
+        :raises StaleSnapshot: If the dataset has another number of
+            datapoints than when the snapshot was taken.
+        """
+        meta = cls.snapshot_meta(snapshot)
+        dataset = Dataset.get(meta["dataset_name"])
+        # Snapshots from before the amount was stored have one position
+        # per datapoint
+        datapoint_amount = meta.get(
+            "datapoint_amount", len(snapshot["positions"])
+        )
+        cls.raise_for_stale_snapshot(datapoint_amount, dataset)
+        instance = cls(
+            heuristic=meta["heuristic"],
+            distance_metric=meta["distance_metric"],
+            num_landmarks=meta["num_landmarks"],
+            dataset=dataset,
+            dimension=meta["dimension"],
+            compute_dtype_name=meta.get(
+                "compute_dtype", DEFAULT_COMPUTE_DTYPE
+            )
+        )
+        instance._state = InstanceState(
+            len(instance._dataset),
+            snapshot["landmark_indices"],
+            instance._dimension
+        )
+        instance._state.positions[:] = snapshot["positions"]
+        instance._delta_n_old = np.array(
+            snapshot["delta_n_old"], dtype=instance._dtype
+        )
+        instance._delta_n = instance._delta_n_old
+        instance._landmarks_reduced = True
+        instance._points_calculated = meta["points_calculated"]
+        instance._last_idr_algorithm = meta["last_idr_algorithm"]
+        instance._last_precision = meta.get("last_precision")
+        instance._history.restore(
+            list(snapshot["history_states"]),
+            int(snapshot["history_cursor"]),
+            snapshot["landmark_indices"]
+        )
+        return instance
 
     def to_json(self) -> Dict[str, Any]:
         return {
             "heuristic": self._heuristic,
             "distance_metric": self._distance_metric,
             "num_landmarks": self._num_landmarks,
+            "compute_dtype": self._compute_dtype,
             "landmarks_selected": self.landmarks_selected,
             "landmarks_reduced": self.landmarks_reduced,
             "points_calculated": self.points_calculated,
-            "labels": self._dataset.labels
+            "labels": self._dataset.labels,
+            "state_size": (
+                self._state.nbytes if self._state is not None else 0
+            ),
+            "history": self._history.to_json()
         }
@@ -0,0 +1,186 @@
+import zlib
+import pickle
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+
+class LandmarkHistory:
+    """
+    Keeps the landmark configurations of one selection of landmarks of an
+    instance as an undo/redo stack together with a bounded cache of the
+    results computed for them.
+
+    Cached values are pickled and zlib compressed. Only the
+    `max_cached_results` most recently used results are kept.
+    """
+
+    DEFAULT_MAX_STATES: int = 128
+    DEFAULT_MAX_CACHED_RESULTS: int = 32
+    COMPRESSION_LEVEL: int = 1
+
+    _landmark_indices: np.ndarray
+    _states: List[np.ndarray]
+    _cursor: int
+    _max_states: int
+
+    _cache: "OrderedDict[Tuple[Any, ...], bytes]"
+    _max_cached_results: int
+
+    def __init__(
+        self,
+        max_states: int = DEFAULT_MAX_STATES,
+        max_cached_results: int = DEFAULT_MAX_CACHED_RESULTS
+    ):
+        self._landmark_indices = np.empty(0, dtype=np.int64)
+        self._states = []
+        self._cursor = -1
+        self._max_states = max_states
+
+        self._cache = OrderedDict()
+        self._max_cached_results = max_cached_results
+
+    @staticmethod
+    def state_key(
+        positions: np.ndarray, landmark_indices: np.ndarray
+    ) -> str:
+        """
+        Returns a key that identifies a landmark configuration.
+
+        :param positions: The 2D positions of the landmarks.
+        :param landmark_indices: The dataset positions of the landmarks.
+
+        :return: The hex digest of the landmarks and their positions.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            np.ascontiguousarray(landmark_indices, dtype=np.int64).tobytes()
+        )
+        digest.update(
+            np.ascontiguousarray(positions, dtype=np.float64).tobytes()
+        )
+        return digest.hexdigest()
+
+    def reset(self, landmark_indices: np.ndarray):
+        """
+        Forgets all configurations and cached results when other landmarks
+        are selected.
+
+        :param landmark_indices: The dataset positions of the new
+            landmarks.
+        """
+        self.restore([], -1, landmark_indices)
+
+    @property
+    def current(self) -> np.ndarray | None:
+        if self._cursor < 0:
+            return None
+        return self._states[self._cursor]
+
+    @property
+    def current_key(self) -> str | None:
+        if self._cursor < 0:
+            return None
+        return self.state_key(
+            self._states[self._cursor], self._landmark_indices
+        )
+
+    @property
+    def can_undo(self) -> bool:
+        return self._cursor > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._cursor < len(self._states) - 1
+
+    def push(self, positions: np.ndarray):
+        """
+        Records a new landmark configuration and discards all redo states.
+        Pushing the current configuration again is a no-op.
+        """
+        positions = np.array(positions, dtype=np.float64)
+        current = self.current
+        if current is not None and np.array_equal(current, positions):
+            return
+        del self._states[self._cursor + 1:]
+        self._states.append(positions)
+        if len(self._states) > self._max_states:
+            del self._states[0]
+        self._cursor = len(self._states) - 1
+
+    def undo(self) -> np.ndarray:
+        if not self.can_undo:
+            raise RuntimeError("Nothing to undo!")
+        self._cursor -= 1
+        return self._states[self._cursor].copy()
+
+    def redo(self) -> np.ndarray:
+        if not self.can_redo:
+            raise RuntimeError("Nothing to redo!")
+        self._cursor += 1
+        return self._states[self._cursor].copy()
+
+    def get(self, key: Tuple[Any, ...]) -> Any | None:
+        """
+        Returns the cached value for the given key or None on a cache miss.
+        """
+        data = self._cache.get(key)
+        if data is None:
+            return None
+        self._cache.move_to_end(key)
+        return pickle.loads(zlib.decompress(data))
+
+    def put(self, key: Tuple[Any, ...], value: Any):
+        self._cache[key] = zlib.compress(
+            pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+            self.COMPRESSION_LEVEL
+        )
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_cached_results:
+            self._cache.popitem(last=False)
+
+    @property
+    def states(self) -> List[np.ndarray]:
+        return list(self._states)
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def restore(
+        self,
+        states: List[np.ndarray],
+        cursor: int,
+        landmark_indices: np.ndarray
+    ):
+        """
+        Replaces the recorded configurations, e.g. when restoring an
+        instance from a snapshot. Cached results are not restored.
+
+        :param states: The positions of the landmarks per configuration.
+        :param cursor: The index of the current configuration.
+        :param landmark_indices: The dataset positions of the landmarks.
+        """
+        if not -1 <= cursor < len(states):
+            raise ValueError(f"Invalid history cursor: {cursor}")
+        self._landmark_indices = np.array(landmark_indices, dtype=np.int64)
+        self._states = [
+            np.array(positions, dtype=np.float64) for positions in states
+        ]
+        self._cursor = cursor
+        self._cache.clear()
+
+    @property
+    def cache_size(self) -> int:
+        return sum(len(data) for data in self._cache.values())
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "states": len(self._states),
+            "cursor": self._cursor,
+            "can_undo": self.can_undo,
+            "can_redo": self.can_redo,
+            "cached_results": len(self._cache),
+            "cache_size": self.cache_size
+        }
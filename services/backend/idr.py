@@ -1,8 +1,8 @@
-import os
 import numpy as np
-from typing import Any, List
+from typing import Any, List, Sequence
 
-from inference import Predictor
+from models import LoadedModel, ModelRegistry
+from compute_dtype import DEFAULT_COMPUTE_DTYPE, compute_dtype
 
 
 class InverseDimensionaltyReduction:
@@ -11,39 +11,86 @@ class InverseDimensionaltyReduction:
     OTHER_NAMES: List[str] = ["none", "trivial"]
     VALID_NAMES: List[str] = OTHER_NAMES + NEURAL_NETWORK_NAMES
 
-    DOCKER_PATH: str = "/server/models"
-    LOCAL_PATH: str = "./volumes/models"
-
     _name: str
+    _model_name: str
     _distance_metric: str
     _is_neural_network: bool
+    _dtype: type
 
-    _model_path: str
+    @classmethod
+    def preload_models(cls) -> List[LoadedModel]:
+        return ModelRegistry.preload(cls.NEURAL_NETWORK_NAMES)
 
-    def __init__(self, name: str, distance_metric: str):
+    def __init__(
+        self,
+        name: str,
+        distance_metric: str,
+        dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
+    ):
+        """
+        :param name: The name of the iDR algorithm.
+        :param distance_metric: The distance metric of the dataset.
+        :param dtype: The dtype of the returned matrices.
+        """
         self._name = name
+        self._model_name = name
         self._distance_metric = distance_metric
         self._is_neural_network = name in self.NEURAL_NETWORK_NAMES
+        self._dtype = dtype
         if self._is_neural_network:
             self._name += f"_{distance_metric}"
 
-            inside_docker = bool(os.environ.get('INSIDE_DOCKER', False))
-
-            self._model_path = os.path.join(
-                self.DOCKER_PATH if inside_docker else self.LOCAL_PATH,
-                self._name
-            )
-
     def inference(
         self, distance_matrix: Any, old_delta_n: Any
     ) -> np.ndarray:
         if self._name in self.OTHER_NAMES:
-            return self._other_inference(distance_matrix, old_delta_n)
+            delta_n = self._other_inference(distance_matrix, old_delta_n)
         else:
-            return self._neural_network_inference(distance_matrix)
+            delta_n = self._neural_network_inference(distance_matrix)
+        return np.asarray(delta_n, dtype=self._dtype)
+
+    def batch_inference(
+        self,
+        distance_matrices: Sequence[np.ndarray],
+        old_delta_ns: Sequence[np.ndarray]
+    ) -> List[np.ndarray]:
+        """
+        Applies the iDR to many landmark configurations at once. Neural
+        networks evaluate all of them in a single forward pass.
+
+        :param distance_matrices: The 2D landmark distance matrices, one
+            per configuration. Their sizes may differ.
+        :param old_delta_ns: The squared high dimensional landmark distance
+            matrices of the configurations.
+
+        :return: The squared distance matrices, one per configuration.
+        """
+        if len(distance_matrices) != len(old_delta_ns):
+            raise ValueError(
+                "Every distance matrix needs an old delta n matrix!"
+            )
+        if self._name in self.OTHER_NAMES:
+            return [
+                np.asarray(
+                    self._other_inference(distance_matrix, old_delta_n),
+                    dtype=self._dtype
+                )
+                for distance_matrix, old_delta_n in zip(
+                    distance_matrices, old_delta_ns
+                )
+            ]
+        predictor = ModelRegistry.get(
+            self._model_name, self._distance_metric
+        )
+        return [
+            np.asarray(result ** 2, dtype=self._dtype)
+            for result in predictor.batch_inference(distance_matrices)
+        ]
 
     def _neural_network_inference(self, distance_matrix: Any) -> np.ndarray:
-        predictor = Predictor(model_path=self._model_path)
+        predictor = ModelRegistry.get(
+            self._model_name, self._distance_metric
+        )
         return predictor.inference(distance_matrix) ** 2
 
     def _other_inference(
@@ -3,22 +3,67 @@ import os
 import yaml
 
 import numpy as np
-from typing import List
+from typing import List, Sequence
 
-from data_loading import process_single_input
 import neural_network
+from preprocessing import (
+    pad_upper_triangles, unpad_upper_triangle, upper_triangle_size
+)
 
 
 class Predictor:
-    def __init__(self, model_path: str):
+    """
+    Runs one of the trained iDR networks. The network runs in one of
+    these modes:
+
+    - "eager": the plain PyTorch module.
+    - "compiled": a traced and frozen TorchScript graph.
+    - "quantized": like "compiled", but the linear layers are dynamically
+      quantized to int8 first.
+    """
+
+    MODES: List[str] = ["eager", "compiled", "quantized"]
+
+    def __init__(self, model_path: str, mode: str = "eager"):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid inference mode: {mode}")
         self.nn, max_landmarks = self.load_nn(model_path)
+        self.nn.eval()
         self.max_landmarks = max_landmarks
+        self.mode = mode
+        self.module = self.compile_nn(self.nn, mode)
+
+    @property
+    def input_size(self) -> int:
+        return upper_triangle_size(self.max_landmarks)
+
+    @property
+    def nbytes(self) -> int:
+        tensors = list(self.nn.parameters()) + list(self.nn.buffers())
+        if self.mode != "quantized":
+            return sum(
+                tensor.numel() * tensor.element_size() for tensor in tensors
+            )
+        # Quantized linear layers keep their weights as int8
+        linear_weights = {
+            id(module.weight) for module in self.nn.modules()
+            if isinstance(module, torch.nn.Linear)
+        }
+        return sum(
+            tensor.numel() * (
+                1 if id(tensor) in linear_weights else tensor.element_size()
+            )
+            for tensor in tensors
+        )
 
     def load_nn(self, model_path: str):
         # Load the model from checkpoints/best
         model_folder = model_path
-        weights = torch.load(os.path.join(model_folder, 'model.ckpt'))
-        params = yaml.safe_load(open(os.path.join(model_folder, 'params.yml')))
+        weights = torch.load(
+            os.path.join(model_folder, 'model.ckpt'), map_location='cpu'
+        )
+        with open(os.path.join(model_folder, 'params.yml')) as file:
+            params = yaml.safe_load(file)
         if params["model_name"] == "OneLayerModel":
             nn = neural_network.OneLayerModel(
                 params["max_input_size"],
@@ -39,24 +84,65 @@ class Predictor:
         nn.load_state_dict(weights)
         return nn, params["max_landmarks"]
 
-    def inference(self, distance_matrix):
-        # Process the distance matrix
-        nn_input = process_single_input(
-            distance_matrix, max_landmarks=self.max_landmarks
-        )
-        # Get a distance matrix and call self.model(distance_matrix)
+    def compile_nn(self, nn: torch.nn.Module, mode: str) -> torch.nn.Module:
+        if mode == "eager":
+            return nn
+        if mode == "quantized":
+            nn = torch.ao.quantization.quantize_dynamic(
+                nn, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        example = torch.zeros((1, self.input_size))
         with torch.no_grad():
-            upper_triangle = self.nn.forward(nn_input)
-        # Return the result to matrix form
-        return self.unprocess(upper_triangle, distance_matrix.shape[0])
+            return torch.jit.freeze(torch.jit.trace(nn, example).eval())
+
+    def process(
+        self, distance_matrices: Sequence[np.ndarray]
+    ) -> torch.Tensor:
+        """
+        Pads the distance matrices with -1 to the maximal amount of
+        landmarks and returns their upper triangles as a
+        (len(distance_matrices), input_size) tensor.
+        """
+        return torch.from_numpy(
+            pad_upper_triangles(distance_matrices, self.max_landmarks)
+        )
+
+    def inference(self, distance_matrix):
+        return self.batch_inference([distance_matrix])[0]
 
-    def unprocess(self, result: List[float], num_landmarks: int) -> np.ndarray:
+    def batch_inference(
+        self, distance_matrices: Sequence[np.ndarray]
+    ) -> List[np.ndarray]:
+        """
+        Runs the network once for a whole stack of distance matrices.
+
+        :param distance_matrices: Square distance matrices, possibly with
+            different amounts of landmarks.
+
+        :return: The predicted distance matrices with the shapes of the
+            inputs.
+        """
+        if len(distance_matrices) == 0:
+            return []
+        distance_matrices = [
+            np.asarray(distance_matrix)
+            for distance_matrix in distance_matrices
+        ]
+        # Pad all distance matrices into one batch
+        nn_input = self.process(distance_matrices)
+        with torch.inference_mode():
+            upper_triangles = self.module(nn_input).numpy()
+        # Return the results to matrix form
+        return [
+            self.unprocess(upper_triangle, distance_matrix.shape[0])
+            for upper_triangle, distance_matrix in zip(
+                upper_triangles, distance_matrices
+            )
+        ]
+
+    def unprocess(self, result: np.ndarray, num_landmarks: int) -> np.ndarray:
         # We need to construct the distance matrix from the upper triangle
-        size = self.max_landmarks
-        square = np.zeros((size, size))
-        indices = np.triu_indices(size, k=1)
-        square[indices] = result
-        square.T[indices] = result
-
-        # We need to remove any used padding
-        return square[:num_landmarks, :num_landmarks]
+        # and remove any used padding
+        return unpad_upper_triangle(
+            result, num_landmarks, self.max_landmarks
+        )
@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class InstanceState:
+    """
+    The compact per-instance state of a dimensionality reduction. It only
+    holds index arrays, a landmark mask and the low dimensional positions.
+    All arrays are indexed like the rows of the dataset, which is shared
+    between instances instead of being copied.
+    """
+
+    INDEX_DTYPE: type = np.int32
+    POSITION_DTYPE: type = np.float32
+
+    __slots__ = (
+        "landmark_indices",
+        "other_indices",
+        "landmark_mask",
+        "positions"
+    )
+
+    landmark_indices: np.ndarray
+    other_indices: np.ndarray
+    landmark_mask: np.ndarray
+    positions: np.ndarray
+
+    def __init__(
+        self,
+        datapoint_amount: int,
+        landmark_indices: np.ndarray,
+        dimension: int = 2
+    ):
+        self.landmark_indices = np.asarray(
+            landmark_indices, dtype=self.INDEX_DTYPE
+        )
+        self.landmark_mask = np.zeros(datapoint_amount, dtype=bool)
+        self.landmark_mask[self.landmark_indices] = True
+        self.other_indices = np.flatnonzero(
+            ~self.landmark_mask
+        ).astype(self.INDEX_DTYPE)
+        self.positions = np.zeros(
+            (datapoint_amount, dimension), dtype=self.POSITION_DTYPE
+        )
+
+    @property
+    def datapoint_amount(self) -> int:
+        return len(self.landmark_mask)
+
+    @property
+    def landmark_positions(self) -> np.ndarray:
+        return self.positions[self.landmark_indices]
+
+    @landmark_positions.setter
+    def landmark_positions(self, positions: np.ndarray):
+        self.positions[self.landmark_indices] = positions
+
+    @property
+    def other_positions(self) -> np.ndarray:
+        return self.positions[self.other_indices]
+
+    @other_positions.setter
+    def other_positions(self, positions: np.ndarray):
+        self.positions[self.other_indices] = positions
+
+    @property
+    def ordered_indices(self) -> np.ndarray:
+        """
+        Returns the indices of all datapoints, landmarks first.
+        """
+        return np.concatenate([self.landmark_indices, self.other_indices])
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.landmark_indices.nbytes + self.other_indices.nbytes
+            + self.landmark_mask.nbytes + self.positions.nbytes
+        )
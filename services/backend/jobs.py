@@ -0,0 +1,286 @@
+import json
+import time
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+ProgressCallback = Callable[[float, str], None]
+
+
+def no_progress(progress: float, stage: str):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    PENDING: str = "pending"
+    RUNNING: str = "running"
+    DONE: str = "done"
+    FAILED: str = "failed"
+    CANCELLED: str = "cancelled"
+
+    FINISHED_STATES: Tuple[str, ...] = (DONE, FAILED, CANCELLED)
+
+    _id: str
+    _instance_id: str
+    _kind: str
+    _status: str
+    _progress: float
+    _stage: str
+    _result: Any
+    _result_size: int
+    _result_dropped: bool
+    _finished_at: float | None
+    _error: str | None
+    _cancel_event: threading.Event
+
+    def __init__(self, instance_id: str, kind: str):
+        self._id = uuid.uuid4().hex
+        self._instance_id = instance_id
+        self._kind = kind
+        self._status = self.PENDING
+        self._progress = 0.0
+        self._stage = "queued"
+        self._result = None
+        self._result_size = 0
+        self._result_dropped = False
+        self._finished_at = None
+        self._error = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    @property
+    def instance_id(self) -> str:
+        return self._instance_id
+
+    @property
+    def kind(self) -> str:
+        return self._kind
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @property
+    def finished(self) -> bool:
+        return self._status in self.FINISHED_STATES
+
+    @property
+    def finished_at(self) -> float | None:
+        """
+        The `time.monotonic` time the job finished at.
+        """
+        return self._finished_at
+
+    @property
+    def result_size(self) -> int:
+        """
+        The size of the serialized result in bytes, 0 once it is dropped.
+        """
+        return self._result_size
+
+    def drop_result(self):
+        """
+        Frees the result of a finished job, its status stays.
+        """
+        if self._status == self.DONE and not self._result_dropped:
+            self._result = None
+            self._result_size = 0
+            self._result_dropped = True
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self._status == self.PENDING:
+            self._finish(self.CANCELLED)
+
+    def _finish(self, status: str):
+        self._finished_at = time.monotonic()
+        self._status = status
+
+    def report(self, progress: float, stage: str):
+        """
+        Progress callback handed to the computation. It is also the point
+        where a cancelled job stops.
+
+        :param progress: The progress of the job in [0, 1].
+        :param stage: A short description of the current stage.
+        """
+        if self.cancel_requested:
+            raise JobCancelled()
+        self._progress = min(max(progress, 0.0), 1.0)
+        self._stage = stage
+
+    def run(self, func: Callable[[ProgressCallback], Any]):
+        if self.cancel_requested:
+            self._finish(self.CANCELLED)
+            return
+        self._status = self.RUNNING
+        try:
+            self._result = func(self.report)
+            self._result_size = len(json.dumps(self._result))
+        except JobCancelled:
+            self._result = None
+            self._finish(self.CANCELLED)
+            return
+        except Exception as error:
+            traceback.print_exc()
+            self._result = None
+            self._error = str(error)
+            self._finish(self.FAILED)
+            return
+        self._progress = 1.0
+        self._stage = "done"
+        self._finish(self.DONE)
+
+    def to_json(self) -> Dict[str, Any]:
+        json = {
+            "id": self._id,
+            "instance_id": self._instance_id,
+            "kind": self._kind,
+            "status": self._status,
+            "progress": self._progress,
+            "stage": self._stage
+        }
+        if self._status == self.DONE:
+            if self._result_dropped:
+                json["result_dropped"] = True
+            else:
+                json["result"] = self._result
+        elif self._status == self.FAILED:
+            json["error"] = self._error
+        return json
+
+
+class JobManager:
+    """
+    Runs computations for instances on a worker pool. Submitting a job
+    supersedes the unfinished job of the same kind for the same instance,
+    which gets cancelled. Jobs lock the instance they work on themselves.
+
+    Finished jobs are kept for polling, their results only until they are
+    fetched, for `MAX_RESULT_AGE` seconds and while all kept results fit
+    into `MAX_RESULT_BYTES`, oldest first.
+    """
+
+    DEFAULT_MAX_WORKERS: int = 4
+    MAX_FINISHED_JOBS: int = 256
+    MAX_RESULT_AGE: float = 600.0
+    # Serialized size of all kept results
+    MAX_RESULT_BYTES: int = 256 * 2 ** 20
+
+    _executor: ThreadPoolExecutor
+    _lock: threading.Lock
+    _jobs: "OrderedDict[str, Job]"
+    _latest: Dict[Tuple[str, str], Job]
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._latest = {}
+
+    def submit(
+        self,
+        instance_id: str,
+        kind: str,
+        func: Callable[[ProgressCallback], Any]
+    ) -> Job:
+        """
+        Submits a job for the given instance.
+
+        :param instance_id: The id of the instance the job works on.
+        :param kind: The kind of the job, e.g. "datapoints" or "metrics".
+        :param func: The computation. It gets the progress callback of the
+            job and returns a json serializable result.
+
+        :return: The submitted job.
+        """
+        job = Job(instance_id, kind)
+        with self._lock:
+            previous = self._latest.get((instance_id, kind))
+            if previous is not None and not previous.finished:
+                previous.cancel()
+            self._latest[(instance_id, kind)] = job
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._executor.submit(job.run, func)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._forget_finished_jobs()
+            return self._jobs.get(job_id)
+
+    def fetch(self, job_id: str) -> Dict[str, Any] | None:
+        """
+        Returns the json of a job like `Job.to_json` and drops the result
+        of a done job, later fetches only get its status.
+        """
+        with self._lock:
+            self._forget_finished_jobs()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job_json = job.to_json()
+            job.drop_result()
+            return job_json
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cancel_instance(self, instance_id: str):
+        """
+        Cancels all unfinished jobs of the given instance and drops the
+        results of its finished jobs.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.instance_id != instance_id:
+                    continue
+                if job.finished:
+                    job.drop_result()
+                else:
+                    job.cancel()
+            for key in [key for key in self._latest if key[0] == instance_id]:
+                del self._latest[key]
+
+    def _forget_finished_jobs(self):
+        # Only unfinished jobs can be superseded
+        for key in [
+            key for key, job in self._latest.items() if job.finished
+        ]:
+            del self._latest[key]
+
+        finished = [job for job in self._jobs.values() if job.finished]
+        expired = time.monotonic() - self.MAX_RESULT_AGE
+        result_bytes = sum(job.result_size for job in finished)
+        for job in sorted(finished, key=lambda job: job.finished_at):
+            if (
+                job.finished_at < expired
+                or result_bytes > self.MAX_RESULT_BYTES
+            ):
+                result_bytes -= job.result_size
+                job.drop_result()
+
+        surplus = len(finished) - self.MAX_FINISHED_JOBS
+        for job in finished[:max(0, surplus)]:
+            del self._jobs[job.id]
@@ -1,8 +1,12 @@
-import pandas as pd
 from typing import List, Tuple, Dict, Any
 import numpy as np
 
-from neighbors import Neighbors, ComputedNeighbors, CachedNeighbors
+from neighbors import (
+    Neighbors, ComputedNeighbors, CachedNeighbors, TopKNeighbors
+)
+from approximate_neighbors import low_dimensional_neighbors
+from compute_dtype import DEFAULT_COMPUTE_DTYPE, compute_dtype
+from jobs import ProgressCallback, no_progress
 
 # The metrics are based on: "Toward a Quantitative Survey of Dimension
 # Reduction Techniques" (DOI: 10.1109/TVCG.2019.2944182)
@@ -12,142 +16,237 @@ from neighbors import Neighbors, ComputedNeighbors, CachedNeighbors
 
 class Metrics:
 
+    # The sorted distances of the stress and the local error are computed
+    # in blocks of rows with about this many values
+    BLOCK_VALUES: int = 2 ** 22
+    # Top-K neighbors interpolate the distances beyond the K nearest
+    # neighbors from their samples, they are compared at this many ranks
+    TAIL_RANKS: int = 1024
+
     def __init__(
-        self, distance_metric: str, neighbors: CachedNeighbors
+        self,
+        distance_metric: str,
+        neighbors: CachedNeighbors | TopKNeighbors,
+        dtype: type = compute_dtype(DEFAULT_COMPUTE_DTYPE)
     ) -> None:
         self.hd_neighbors = neighbors
         self.distance_metric = distance_metric
+        # The blocks of the sorted distances are only converted if the
+        # neighbor files store another dtype
+        self.dtype = dtype
         self.ld_neighbors = None
-        self.data = None
+        self.labels = None
         self.N = None
-        self.metrics = {}
+
+    @property
+    def max_k(self) -> int:
+        """
+        Returns the largest supported number of neighbors, approximate high
+        dimensional neighbors only store K of them.
+        """
+        if isinstance(self.hd_neighbors, TopKNeighbors):
+            return self.hd_neighbors.k
+        return self.hd_neighbors.datapoint_amount - 1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns the size of the low dimensional neighbors that are kept
+        from the last calculation.
+        """
+        if self.ld_neighbors is None:
+            return 0
+        return self.ld_neighbors.nbytes
 
     def calculate_all_metrics(
         self,
-        data: pd.DataFrame,
-        idr_algorithm: str,
-        hashed_landmarks: int,
-        k: int = 7
+        positions: np.ndarray,
+        labels: np.ndarray,
+        k: int = 7,
+        progress: ProgressCallback = no_progress
     ) -> Dict[str, Any]:
-        if (idr_algorithm, hashed_landmarks, k) in self.metrics:
-            return self.metrics[(idr_algorithm, hashed_landmarks, k)]
-
-        self.data = data
-        self.N = len(data)
-
-        self.ld_neighbors = ComputedNeighbors(
-            distance_metric=self.distance_metric,
-            dimensions=Neighbors.DIMENSIONS_2D,
-            dataset=data
-        )
-        ld_dist, hd_dist = self.get_distance_matrices()
-        ld_knn = [
-            [
-                neighbor[0] for neighbor
-                in self.ld_neighbors.get_k_neighbors(i, k)
-            ] for i in range(self.N)
-        ]
-        hd_knn = [
-            [
-                neighbor[0] for neighbor
-                in self.hd_neighbors.get_k_neighbors(i, k)
-            ] for i in range(self.N)
-        ]
+        """
+        :param positions: The (N, 2) low dimensional positions of all
+            datapoints in dataset order.
+        :param labels: The labels of all datapoints in dataset order.
+        :param progress: Called with the progress in [0, 1] and the
+            current stage.
+
+        With approximate high dimensional neighbors only the K nearest
+        neighbors are exact, the high dimensional ranks and distances
+        beyond them are estimated from a sample of distances. The low
+        dimensional neighbors are then approximated the same way, so no
+        (N, N) neighbors are built on either side.
+        """
+        if not 1 <= k <= self.max_k:
+            raise ValueError(f"k must be in [1, {self.max_k}]")
+        self.labels = labels
+        self.N = len(positions)
+
+        progress(0.0, "low dimensional neighbors")
+        self.ld_neighbors = self.get_low_dimensional_neighbors(positions)
+        progress(0.2, "nearest neighbors")
+        ld_knn = self.ld_neighbors.distance_index_pairs()["index"][:, 1:k + 1]
+        hd_knn = self.hd_neighbors.distance_index_pairs()["index"][:, 1:k + 1]
+        progress(0.3, "trustworthiness and continuity")
         trustworthiness, continuity = self.get_trustworthiness_and_continuity(
             k, ld_knn, hd_knn
         )
+        progress(0.4, "stress and local error")
+        normalized_stress, average_local_error = (
+            self.get_stress_and_local_error(progress)
+        )
         metric = {
             "trustworthiness": trustworthiness,
             "continuity": continuity,
-            "normalized_stress": self.normalized_stress(ld_dist, hd_dist),
+            "normalized_stress": normalized_stress,
             "neighborhood_hit": self.neighborhood_hit(ld_knn),
-            "average_local_error": self.average_local_error(ld_dist, hd_dist),
+            "average_local_error": average_local_error,
         }
-        self.metrics[(idr_algorithm, hashed_landmarks, k)] = metric
         return metric
 
-    def get_distance_matrices(self) -> Tuple[np.ndarray, np.ndarray]:
+    def get_low_dimensional_neighbors(
+        self, positions: np.ndarray
+    ) -> ComputedNeighbors | TopKNeighbors:
+        if isinstance(self.hd_neighbors, TopKNeighbors):
+            return low_dimensional_neighbors(
+                positions, self.distance_metric, self.hd_neighbors.k,
+                self.hd_neighbors.sample_amount
+            )
+        return ComputedNeighbors(
+            distance_metric=self.distance_metric,
+            dimensions=Neighbors.DIMENSIONS_2D,
+            positions=positions
+        )
+
+    def get_stress_and_local_error(
+        self, progress: ProgressCallback = no_progress
+    ) -> Tuple[float, List[float]]:
         """
-        This function returns the distance matrices for the low and high
-        dimensional space. The matrices are of the form: self.N * (self.N - 1)
+        Compares the distances of every point to all other points ordered
+        by distance in the low and high dimensional space. They are read
+        in blocks of rows, so at most `BLOCK_VALUES` of them are held at a
+        time instead of the (N, N - 1) matrices.
         """
-        ld_dist = np.asarray(
-            [
-                [
-                    neighbor[1] for neighbor
-                    in self.ld_neighbors.get_neighbors(i)
-                ] for i in range(self.N)
-            ]
-        )
-        hd_dist = np.asarray(
-            [
-                [
-                    neighbor[1] for neighbor
-                    in self.hd_neighbors.get_neighbors(i)
-                ] for i in range(self.N)
-            ]
+        ranks, weights = self.compared_ranks(self.hd_neighbors)
+        block_size = max(1, self.BLOCK_VALUES // (
+            self.N - 1 if ranks is None else len(ranks)
+        ))
+        stress_numerator = 0.0
+        stress_denominator = 0.0
+        local_errors = np.empty(self.N)
+        for start in range(0, self.N, block_size):
+            rows = np.arange(start, min(start + block_size, self.N))
+            ld_dist = self.ld_neighbors.sorted_distances(rows, ranks).astype(
+                self.dtype, copy=False
+            )
+            hd_dist = self.hd_neighbors.sorted_distances(rows, ranks).astype(
+                self.dtype, copy=False
+            )
+            numerator, denominator, local_errors[rows] = (
+                self.sorted_distance_sums(ld_dist, hd_dist, weights)
+            )
+            stress_numerator += numerator
+            stress_denominator += denominator
+            progress(
+                0.4 + 0.6 * rows[-1] / self.N, "stress and local error"
+            )
+        return (
+            stress_numerator / stress_denominator, local_errors.tolist()
         )
-        return (ld_dist, hd_dist)
 
     def get_trustworthiness_and_continuity(
-        self, k: int, ld_knn: List[List[int]], hd_knn: List[List[int]]
+        self, k: int, ld_knn: np.ndarray, hd_knn: np.ndarray
     ) -> Tuple[float, float]:
-        # Get the rank matrix in the high and low dimensional space
-        ld_rank = self.ld_neighbors.get_ranks()
-        hd_rank = self.hd_neighbors.get_ranks()
-
-        t_outer_sum = 0
-        c_outer_sum = 0
         # In this formula the paper and code differ. The paper has a small n
         # at (2*n-3*k-1). The code version was choosen.
         factor = 2/(self.N * k * (2*self.N - 3*k - 1))
-        for i in range(self.N):
-            ld_point_knn = ld_knn[i]
-            hd_point_knn = hd_knn[i]
-            hd_nn = next(hd_rank)
-            ld_nn = next(ld_rank)
-
-            # Again paper and code differ. The paper defines r as the rank the
-            # point j has in regards to i in the low dimensional space,
-            # while the code version uses the rank in the high dimensional
-            # space. The code version was choosen.
-            U = set(ld_point_knn) - set(hd_point_knn)
-            t_outer_sum += sum(hd_nn[j] - k for j in U)
-
-            U_hat = set(hd_point_knn) - set(ld_point_knn)
-            c_outer_sum += sum(ld_nn[j] - k for j in U_hat)
-
-        return (1 - factor * t_outer_sum, 1 - factor * c_outer_sum)
-
-    def normalized_stress(
-        self, ld_dist: np.ndarray, hd_dist: np.ndarray
-    ) -> float:
-        return np.sum((hd_dist - ld_dist)**2) / np.sum(hd_dist**2)
-
-    def neighborhood_hit(self, ld_knn: List[List[int]]) -> float:
-        labels = list(self.data['label'])
+
+        # Again paper and code differ. The paper defines r as the rank the
+        # point j has in regards to i in the low dimensional space,
+        # while the code version uses the rank in the high dimensional
+        # space. The code version was choosen.
+        # U are the k nearest low dimensional neighbors that are not among
+        # the k nearest high dimensional neighbors, i.e. whose high
+        # dimensional rank is not in 1..k.
+        hd_ranks_of_ld_knn = self.hd_neighbors.ranks_of(ld_knn).astype(
+            np.int64
+        )
+        in_U = (hd_ranks_of_ld_knn < 1) | (hd_ranks_of_ld_knn > k)
+        t_outer_sum = np.sum((hd_ranks_of_ld_knn - k)[in_U])
+
+        ld_ranks_of_hd_knn = self.ld_neighbors.ranks_of(hd_knn).astype(
+            np.int64
+        )
+        in_U_hat = (ld_ranks_of_hd_knn < 1) | (ld_ranks_of_hd_knn > k)
+        c_outer_sum = np.sum((ld_ranks_of_hd_knn - k)[in_U_hat])
+
+        return (
+            float(1 - factor * t_outer_sum), float(1 - factor * c_outer_sum)
+        )
+
+    def neighborhood_hit(self, ld_knn: np.ndarray) -> float:
+        labels = np.asarray(self.labels)
         # Pseudocode: mean(mean(1 if label(j) == label(i) else 0 for j in
         # neighbors(i)) for i in range(N)
-        return np.mean(
-            [
-                np.mean(
-                    [1 if labels[j] == labels[i] else 0 for j in ld_knn[i]]
-                ) for i in range(self.N)
-            ]
-        )
+        return float(np.mean(labels[ld_knn] == labels[:, np.newaxis]))
 
-    def average_local_error(
-        self, ld_dist: np.ndarray, hd_dist: np.ndarray
-    ) -> List[float]:
+    @classmethod
+    def compared_ranks(
+        cls, neighbors: CachedNeighbors | TopKNeighbors
+    ) -> Tuple[np.ndarray | None, np.ndarray | None]:
+        """
+        Returns the ranks at which the sorted distances are compared and
+        how many ranks each of them stands for, or None for all ranks.
+        Beyond the K nearest neighbors top-K neighbors only interpolate
+        between their distance samples, there `TAIL_RANKS` evenly spaced
+        ranks stand for all others, so the work grows with N instead of N².
+        """
+        if not isinstance(neighbors, TopKNeighbors):
+            return None, None
+        N = neighbors.datapoint_amount
+        if N - 1 - neighbors.k <= cls.TAIL_RANKS:
+            return None, None
+        tail = np.unique(np.linspace(
+            neighbors.k + 1, N - 1, cls.TAIL_RANKS
+        ).round().astype(np.int64))
+        ranks = np.concatenate([np.arange(1, neighbors.k + 1), tail])
+        weights = np.concatenate([
+            np.ones(neighbors.k),
+            np.full(len(tail), (N - 1 - neighbors.k) / len(tail))
+        ])
+        return ranks, weights
+
+    @staticmethod
+    def sorted_distance_sums(
+        ld_dist: np.ndarray,
+        hd_dist: np.ndarray,
+        weights: np.ndarray | None = None
+    ) -> Tuple[float, float, np.ndarray]:
+        """
+        Returns the numerator and denominator of the normalized stress and
+        the local errors of a block of rows of sorted distances.
+
+        :param ld_dist: The (n, m) sorted low dimensional distances.
+        :param hd_dist: The (n, m) sorted high dimensional distances.
+        :param weights: The (m,) amount of ranks every column stands for,
+            see `compared_ranks`, or None if the columns are all ranks.
+        """
         # Averaged sum of difference normalized distances between the low
-        # and high dimensional space
-        return [
-            np.mean(
-                [
-                    np.abs(
-                        ld_dist[i] / max(ld_dist[i])
-                        - hd_dist[i] / max(hd_dist[i])
-                    )
-                ]
-            ) for i in range(self.N)
-        ]
+        # and high dimensional space. The largest distance is in the last
+        # column, which is always compared.
+        errors = np.abs(
+            ld_dist / ld_dist.max(axis=1, keepdims=True)
+            - hd_dist / hd_dist.max(axis=1, keepdims=True)
+        )
+        if weights is None:
+            return (
+                float(np.sum((hd_dist - ld_dist)**2)),
+                float(np.sum(hd_dist**2)),
+                np.mean(errors, axis=1)
+            )
+        return (
+            float(np.sum((hd_dist - ld_dist)**2 @ weights)),
+            float(np.sum(hd_dist**2 @ weights)),
+            errors @ weights / np.sum(weights)
+        )
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import os
+import time
+import threading
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List, Tuple
+
+if TYPE_CHECKING:
+    from inference import Predictor
+
+
+class LoadedModel:
+    __slots__ = ("name", "distance_metric", "predictor", "load_time")
+
+    name: str
+    distance_metric: str
+    predictor: Predictor
+    load_time: float
+
+    def __init__(
+        self,
+        name: str,
+        distance_metric: str,
+        predictor: Predictor,
+        load_time: float
+    ):
+        self.name = name
+        self.distance_metric = distance_metric
+        self.predictor = predictor
+        self.load_time = load_time
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "distance_metric": self.distance_metric,
+            "mode": self.predictor.mode,
+            "load_time": self.load_time,
+            "memory": self.predictor.nbytes
+        }
+
+
+class ModelRegistry:
+    """
+    Process wide registry of the neural iDR models, keyed by model name and
+    distance metric. Every model is loaded from disk once, put into eval
+    mode and shared by all instances afterwards. The inference mode of the
+    predictors is taken from `IDR_INFERENCE_MODE`.
+
+    Loaded models are looked up without locking. Loading holds a lock per
+    model, so a cold load never blocks requests for other models.
+    """
+
+    DOCKER_PATH: str = "/server/models"
+    LOCAL_PATH: str = "./volumes/models"
+
+    MODEL_FILENAME: str = "model.ckpt"
+    DEFAULT_INFERENCE_MODE: str = "compiled"
+
+    _models: ClassVar[Dict[Tuple[str, str], LoadedModel]] = {}
+    _loading_locks: ClassVar[Dict[Tuple[str, str], threading.Lock]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def directory(cls) -> str:
+        inside_docker = bool(os.environ.get('INSIDE_DOCKER', False))
+        return cls.DOCKER_PATH if inside_docker else cls.LOCAL_PATH
+
+    @classmethod
+    def inference_mode(cls) -> str:
+        return os.environ.get(
+            'IDR_INFERENCE_MODE', cls.DEFAULT_INFERENCE_MODE
+        )
+
+    @classmethod
+    def model_path(cls, name: str, distance_metric: str) -> str:
+        return os.path.join(cls.directory(), f"{name}_{distance_metric}")
+
+    @classmethod
+    def get(cls, name: str, distance_metric: str) -> Predictor:
+        """
+        Returns the predictor of the given model, loading it on first use.
+
+        :param name: The name of the model, e.g. "nn_emotion_mds".
+        :param distance_metric: The distance metric the model was trained
+            for.
+
+        :return: The shared predictor.
+        """
+        model = cls._models.get((name, distance_metric))
+        if model is None:
+            model = cls._load(name, distance_metric)
+        return model.predictor
+
+    @classmethod
+    def _load(cls, name: str, distance_metric: str) -> LoadedModel:
+        key = (name, distance_metric)
+        with cls._lock:
+            loading_lock = cls._loading_locks.setdefault(
+                key, threading.Lock()
+            )
+        # Concurrent first requests for one model wait for a single load
+        with loading_lock:
+            model = cls._models.get(key)
+            if model is None:
+                # torch is only imported once the first model is needed
+                from inference import Predictor
+
+                start = time.perf_counter()
+                predictor = Predictor(
+                    model_path=cls.model_path(name, distance_metric),
+                    mode=cls.inference_mode()
+                )
+                model = LoadedModel(
+                    name, distance_metric, predictor,
+                    time.perf_counter() - start
+                )
+                with cls._lock:
+                    cls._models[key] = model
+        return model
+
+    @classmethod
+    def available(cls) -> List[Tuple[str, str]]:
+        """
+        Returns (name, distance metric) of all models in the model
+        directory.
+        """
+        directory = cls.directory()
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            tuple(folder.rsplit("_", 1))
+            for folder in os.listdir(directory)
+            if "_" in folder and os.path.isfile(
+                os.path.join(directory, folder, cls.MODEL_FILENAME)
+            )
+        )
+
+    @classmethod
+    def preload(cls, names: Iterable[str] | None = None) -> List[LoadedModel]:
+        """
+        Loads all models in the model directory up front so that no
+        request has to wait for disk I/O.
+
+        :param names: Only load models with these names if given.
+
+        :return: The loaded models.
+        """
+        if names is not None:
+            names = set(names)
+        return [
+            cls._load(name, distance_metric)
+            for name, distance_metric in cls.available()
+            if names is None or name in names
+        ]
+
+    @classmethod
+    def to_json(cls) -> List[Dict[str, Any]]:
+        with cls._lock:
+            return [model.to_json() for model in cls._models.values()]
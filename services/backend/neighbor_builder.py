@@ -0,0 +1,549 @@
+import os
+import json
+import struct
+import hashlib
+import threading
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from neighbors import ComputedNeighbors, Neighbors
+
+BuildProgressCallback = Callable[[int, int], None]
+
+TEMPORARY_SUFFIX: str = ".tmp"
+
+
+def no_build_progress(done: int, total: int):
+    pass
+
+
+def create_neighbors_file(
+    path: str,
+    distance_metric: str,
+    positions: np.ndarray,
+    position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE
+) -> int:
+    """
+    Creates a neighbors file with the parameters and the positions and
+    extends it to its full size. The neighbors and ranks are left empty.
+
+    :param path: The path of the file.
+    :param distance_metric: The distance metric of the neighbors.
+    :param positions: The (N, D) positions of the datapoints.
+    :param position_dtype: The dtype the positions are stored in.
+
+    :return: The offset of the (index, distance) pairs.
+    """
+    datapoint_amount, dimensions = positions.shape
+    stored_positions = np.ascontiguousarray(
+        positions, dtype=Neighbors.POSITION_DTYPES[position_dtype]
+    )
+    with open(path, 'wb') as file:
+        file.write(struct.pack(
+            Neighbors.PARAMETER_FORMAT,
+            ord(Neighbors.DISTANCE_METRICS[distance_metric]),
+            datapoint_amount,
+            dimensions,
+            ord(stored_positions.dtype.char)
+        ))
+        file.write(stored_positions.tobytes())
+        file.truncate(Neighbors.file_size(
+            datapoint_amount, dimensions, position_dtype
+        ))
+    return Neighbors.PARAMETER_SIZE + stored_positions.nbytes
+
+
+class NeighborsFile:
+    """
+    A neighbors file in the format of `CachedNeighbors` that is written
+    row by row through a memory map. The file is created under a temporary
+    name and only renamed to its final path by `commit`.
+    """
+
+    _path: str
+    _temporary_path: str
+    _datapoint_amount: int
+    _distance_index_pairs: np.memmap
+    _ranks: np.memmap
+
+    def __init__(
+        self,
+        path: str,
+        distance_metric: str,
+        positions: np.ndarray,
+        position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE
+    ):
+        self._path = path
+        self._temporary_path = path + TEMPORARY_SUFFIX
+        datapoint_amount = len(positions)
+        self._datapoint_amount = datapoint_amount
+        offset = create_neighbors_file(
+            self._temporary_path, distance_metric, positions, position_dtype
+        )
+        shape = (datapoint_amount, datapoint_amount)
+        self._distance_index_pairs = np.memmap(
+            self._temporary_path, mode='r+', offset=offset, shape=shape,
+            dtype=Neighbors.DISTANCE_INDEX_PAIR_DTYPE
+        )
+        offset += self._distance_index_pairs.nbytes
+        self._ranks = np.memmap(
+            self._temporary_path, mode='r+', offset=offset, shape=shape,
+            dtype=Neighbors.INDEX_DTYPE
+        )
+
+    def write_rows(
+        self, start: int, order: np.ndarray, distances: np.ndarray
+    ):
+        """
+        Writes the neighbors of the rows [start, start + len(order)).
+
+        :param start: The first row.
+        :param order: The neighbor indices of each row sorted by distance.
+        :param distances: The distances to the neighbors in the same order.
+        """
+        end = start + len(order)
+        pairs = self._distance_index_pairs[start:end]
+        pairs["index"] = order
+        pairs["distance"] = distances
+        ranks = np.empty_like(order, dtype=Neighbors.INDEX_DTYPE)
+        np.put_along_axis(
+            ranks, order,
+            np.arange(self._datapoint_amount, dtype=Neighbors.INDEX_DTYPE)[
+                None, :
+            ],
+            axis=1
+        )
+        self._ranks[start:end] = ranks
+
+    def commit(self):
+        self._distance_index_pairs.flush()
+        self._ranks.flush()
+        del self._distance_index_pairs
+        del self._ranks
+        os.replace(self._temporary_path, self._path)
+
+
+class CombinedNeighborsBuilder:
+    """
+    Builds the euclidean and the cosine neighbors of the same embeddings
+    in one pass. Every block of rows needs one Gram matrix with all
+    datapoints, both distances follow from it and the norms in closed
+    form. On L2 normalized embeddings the euclidean distance is
+    sqrt(2 * cosine distance), so the cosine order is reused and only one
+    sort per row is needed.
+    """
+
+    DEFAULT_BLOCK_SIZE: int = 512
+    NORMALIZED_TOLERANCE: float = 1e-5
+
+    _embeddings: np.ndarray
+    _norms: np.ndarray
+    _normalized: bool
+    _block_size: int
+    _position_dtype: str
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE
+    ):
+        if not 0 < len(embeddings) <= np.iinfo(Neighbors.INDEX_DTYPE).max:
+            raise ValueError(
+                f"Invalid datapoint amount: {len(embeddings)}"
+            )
+        # float16 embeddings give the same neighbors as the engine, which
+        # computes on the stored positions
+        self._embeddings = np.ascontiguousarray(
+            embeddings, dtype=Neighbors.POSITION_DTYPES[position_dtype]
+        ).astype(np.float32)
+        self._norms = np.linalg.norm(self._embeddings, axis=1)
+        self._normalized = bool(np.all(
+            np.abs(self._norms - 1.0) < self.NORMALIZED_TOLERANCE
+        ))
+        self._block_size = block_size
+        self._position_dtype = position_dtype
+
+    @property
+    def normalized(self) -> bool:
+        return self._normalized
+
+    def _block_distances(
+        self, start: int, end: int
+    ) -> Dict[str, np.ndarray]:
+        block = self._embeddings[start:end]
+        gram = block @ self._embeddings.T
+        block_norms = self._norms[start:end, None]
+        cosine = 1.0 - gram / (block_norms * self._norms[None, :])
+        squared_euclidean = (
+            block_norms ** 2 + self._norms[None, :] ** 2 - 2.0 * gram
+        )
+        euclidean = np.sqrt(np.maximum(squared_euclidean, 0.0))
+        return {"cosine": cosine, "euclidean": euclidean}
+
+    @staticmethod
+    def _sort(start: int, distances: np.ndarray) -> np.ndarray:
+        # The point itself always comes first, even with duplicates
+        rows = np.arange(len(distances))
+        distances[rows, start + rows] = -np.inf
+        order = np.argsort(distances, axis=1, kind="stable")
+        distances[rows, start + rows] = 0.0
+        return order.astype(Neighbors.INDEX_DTYPE)
+
+    def build(
+        self,
+        paths: Dict[str, str],
+        progress: BuildProgressCallback = no_build_progress
+    ):
+        """
+        Builds the neighbor files of the given distance metrics.
+
+        :param paths: Maps the distance metrics to build to their output
+            paths.
+        :param progress: Called with the amount of finished rows and the
+            amount of all rows after every block.
+        """
+        files = {
+            distance_metric: NeighborsFile(
+                path, distance_metric, self._embeddings, self._position_dtype
+            )
+            for distance_metric, path in paths.items()
+        }
+        datapoint_amount = len(self._embeddings)
+        for start in range(0, datapoint_amount, self._block_size):
+            end = min(start + self._block_size, datapoint_amount)
+            distances = self._block_distances(start, end)
+            orders: Dict[str, np.ndarray] = {}
+            for distance_metric in files:
+                if self._normalized and orders:
+                    # The order of one metric is the order of the other
+                    orders[distance_metric] = next(iter(orders.values()))
+                    rows = np.arange(end - start)
+                    distances[distance_metric][rows, start + rows] = 0.0
+                else:
+                    orders[distance_metric] = self._sort(
+                        start, distances[distance_metric]
+                    )
+            for distance_metric, file in files.items():
+                order = orders[distance_metric]
+                file.write_rows(
+                    start, order,
+                    np.take_along_axis(
+                        distances[distance_metric], order, axis=1
+                    )
+                )
+            progress(end, datapoint_amount)
+        for file in files.values():
+            file.commit()
+
+
+class BuildJournal:
+    """
+    Records how many rows of a neighbors file under construction are
+    finished. The first line identifies the build, every further line is
+    the end of a finished row block. A journal of another build is
+    ignored.
+    """
+
+    _path: str
+    _identity: Dict[str, Any]
+
+    def __init__(self, path: str, identity: Dict[str, Any]):
+        self._path = path
+        self._identity = identity
+
+    def finished_rows(self) -> int:
+        if not os.path.exists(self._path):
+            return 0
+        with open(self._path, 'r') as file:
+            lines = file.read().splitlines()
+        try:
+            if not lines or json.loads(lines[0]) != self._identity:
+                return 0
+            # A line that was cut off by a crash is ignored
+            return max(
+                [int(line) for line in lines[1:] if line.isdigit()],
+                default=0
+            )
+        except json.JSONDecodeError:
+            return 0
+
+    def start(self):
+        with open(self._path, 'w') as file:
+            file.write(json.dumps(self._identity) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def record(self, end: int):
+        with open(self._path, 'a') as file:
+            file.write(f"{end}\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def remove(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+class EngineNeighborsBuild:
+    """
+    Builds one neighbors file with the engine in file mode: the parameters
+    and positions are written to a temporary file of the final size, the
+    engine maps it and writes the neighbors and ranks into it directly and
+    the file is renamed to its final path afterwards. Unlike
+    `ComputedNeighbors` no shared memory segment and no copy of the output
+    in Python are needed.
+
+    With a block size the engine computes one block of rows per run and
+    every finished block is recorded in a journal next to the file. Only
+    the pages of the current block are dirty at a time and an interrupted
+    build resumes after the last finished block.
+    """
+
+    JOURNAL_SUFFIX: str = ".journal"
+
+    _path: str
+    _distance_metric: str
+    _positions: np.ndarray
+    _position_dtype: str
+    _block_size: Optional[int]
+
+    def __init__(
+        self,
+        path: str,
+        distance_metric: str,
+        positions: np.ndarray,
+        position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE,
+        block_size: Optional[int] = None
+    ):
+        datapoint_amount, dimensions = positions.shape
+        # Validates the shape, metric and dtype before anything is written
+        Neighbors(
+            distance_metric, datapoint_amount, dimensions, position_dtype
+        )
+        if block_size is not None and block_size <= 0:
+            raise ValueError(f"Invalid block size: {block_size}")
+        self._path = path
+        self._distance_metric = distance_metric
+        self._positions = positions
+        self._position_dtype = position_dtype
+        self._block_size = block_size
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def temporary_path(self) -> str:
+        return self._path + TEMPORARY_SUFFIX
+
+    @property
+    def journal_path(self) -> str:
+        return self._path + self.JOURNAL_SUFFIX
+
+    @property
+    def memory_estimate(self) -> int:
+        """
+        The memory the build needs at its peak in bytes: the mapped rows
+        that are written at once and the float32 copy of the positions
+        inside the engine.
+        """
+        datapoint_amount, dimensions = self._positions.shape
+        rows = min(self._block_size or datapoint_amount, datapoint_amount)
+        return (
+            (Neighbors.DISTANCE_INDEX_PAIR_SIZE + Neighbors.INDEX_SIZE)
+            * rows * datapoint_amount
+            + np.dtype(np.float32).itemsize * datapoint_amount * dimensions
+        )
+
+    def _identity(self) -> Dict[str, Any]:
+        stored_positions = np.ascontiguousarray(
+            self._positions,
+            dtype=Neighbors.POSITION_DTYPES[self._position_dtype]
+        )
+        return {
+            "distance_metric": self._distance_metric,
+            "shape": list(stored_positions.shape),
+            "position_dtype": self._position_dtype,
+            "positions_sha256": hashlib.sha256(
+                stored_positions.tobytes()
+            ).hexdigest()
+        }
+
+    def _run_engine(self, *rows: int):
+        ComputedNeighbors.raise_for_engine()
+        process = subprocess.run(
+            [
+                ComputedNeighbors.NEIGHBORS_EXECUTABLE_PATH,
+                "--file", self.temporary_path,
+                *(str(row) for row in rows)
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f'{ComputedNeighbors.NEIGHBORS_EXECUTABLE_PATH} returned with '
+                f'code {process.returncode} for {self._path}!\n'
+                f'stderr:\n{process.stderr.decode("utf-8")}'
+            )
+
+    def run(self, progress: BuildProgressCallback = no_build_progress):
+        """
+        Builds the file.
+
+        :param progress: Called with the amount of finished rows and the
+            amount of all rows after every block.
+        """
+        if self._block_size is None:
+            create_neighbors_file(
+                self.temporary_path, self._distance_metric,
+                self._positions, self._position_dtype
+            )
+            try:
+                self._run_engine()
+            except RuntimeError:
+                os.remove(self.temporary_path)
+                raise
+            os.replace(self.temporary_path, self._path)
+            progress(len(self._positions), len(self._positions))
+            return
+        self._run_blocks(progress)
+
+    def _run_blocks(self, progress: BuildProgressCallback):
+        datapoint_amount, dimensions = self._positions.shape
+        journal = BuildJournal(self.journal_path, self._identity())
+        finished_rows = 0
+        if os.path.exists(self.temporary_path) and os.path.getsize(
+            self.temporary_path
+        ) == Neighbors.file_size(
+            datapoint_amount, dimensions, self._position_dtype
+        ):
+            finished_rows = journal.finished_rows()
+        if finished_rows == 0:
+            create_neighbors_file(
+                self.temporary_path, self._distance_metric,
+                self._positions, self._position_dtype
+            )
+            journal.start()
+        else:
+            print(f"Resuming {self._path} at row {finished_rows}")
+
+        # The engine writes a block back before it exits, so the journal
+        # never records rows that are not on disk
+        for start in range(finished_rows, datapoint_amount, self._block_size):
+            end = min(start + self._block_size, datapoint_amount)
+            self._run_engine(start, end)
+            journal.record(end)
+            progress(end, datapoint_amount)
+
+        os.replace(self.temporary_path, self._path)
+        journal.remove()
+
+
+class ConcurrentNeighborsBuilder:
+    """
+    Runs several `EngineNeighborsBuild`s at the same time while the sum of
+    their memory estimates stays within a budget. The largest builds are
+    started first. A build that exceeds the budget on its own runs alone.
+    """
+
+    DEFAULT_MAX_WORKERS: int = 4
+
+    _memory_budget: int
+    _max_workers: int
+    _builds: List[EngineNeighborsBuild]
+
+    _condition: threading.Condition
+    _memory_in_use: int
+    _running: int
+
+    @staticmethod
+    def default_memory_budget() -> int:
+        """
+        Half of the physical memory in bytes.
+        """
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+
+    def __init__(
+        self,
+        memory_budget: Optional[int] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        if memory_budget is None:
+            memory_budget = self.default_memory_budget()
+        if memory_budget <= 0:
+            raise ValueError(f"Invalid memory budget: {memory_budget}")
+        if max_workers <= 0:
+            raise ValueError(f"Invalid max workers: {max_workers}")
+        self._memory_budget = memory_budget
+        self._max_workers = max_workers
+        self._builds = []
+        self._condition = threading.Condition()
+        self._memory_in_use = 0
+        self._running = 0
+
+    def add(
+        self,
+        path: str,
+        distance_metric: str,
+        positions: np.ndarray,
+        position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE,
+        block_size: Optional[int] = None
+    ):
+        self._builds.append(EngineNeighborsBuild(
+            path, distance_metric, positions, position_dtype, block_size
+        ))
+
+    def _acquire(self, memory: int):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._running == 0
+                or self._memory_in_use + memory <= self._memory_budget
+            )
+            self._memory_in_use += memory
+            self._running += 1
+
+    def _release(self, memory: int):
+        with self._condition:
+            self._memory_in_use -= memory
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _run(self, build: EngineNeighborsBuild):
+        memory = build.memory_estimate
+        self._acquire(memory)
+        try:
+            build.run()
+        finally:
+            self._release(memory)
+
+    def build(self, progress: BuildProgressCallback = no_build_progress):
+        """
+        Runs all added builds and waits for them.
+
+        :param progress: Called with the amount of finished builds and the
+            amount of all builds after every build.
+
+        :raises RuntimeError: If a build failed. The other builds are
+            finished first.
+        """
+        builds = sorted(
+            self._builds, key=lambda build: build.memory_estimate,
+            reverse=True
+        )
+        self._builds = []
+        errors: List[str] = []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {
+                executor.submit(self._run, build): build for build in builds
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                error = future.exception()
+                if error is not None:
+                    errors.append(f"{futures[future].path}: {error}")
+                progress(done, len(builds))
+        if errors:
+            raise RuntimeError("\n".join(errors))
@@ -5,7 +5,7 @@ import mmap
 import struct
 import sysv_ipc
 import subprocess
-import pandas as pd
+import numpy as np
 from abc import ABC
 from itertools import islice
 from typing import Dict, Generator, Tuple, List
@@ -21,19 +21,32 @@ class Neighbors(ABC):
 
     DIMENSIONS_2D: int = 2
     DIMENSIONS_768: int = 768
+    MAX_DIMENSIONS: int = 2 ** 16 - 1
 
-    PARAMETER_FORMAT: str = "=bHH"
-    POSITION_2D_FORMAT: str = f"={DIMENSIONS_2D}f"
-    POSITION_768D_FORMAT: str = f"={DIMENSIONS_768}f"
+    # Distance metric, datapoint amount, dimensions and position type
+    PARAMETER_FORMAT: str = "=bHHb"
+    # Files written before the position type was added store float32
+    LEGACY_PARAMETER_FORMAT: str = "=bHH"
     DISTANCE_INDEX_PAIR_FORMAT: str = "=Hf"
     INDEX_FORMAT: str = "=H"
 
     PARAMETER_SIZE: int = struct.calcsize(PARAMETER_FORMAT)
-    POSITION_2D_SIZE: int = struct.calcsize(POSITION_2D_FORMAT)
-    POSITION_768D_SIZE: int = struct.calcsize(POSITION_768D_FORMAT)
+    LEGACY_PARAMETER_SIZE: int = struct.calcsize(LEGACY_PARAMETER_FORMAT)
     DISTANCE_INDEX_PAIR_SIZE: int = struct.calcsize(DISTANCE_INDEX_PAIR_FORMAT)
     INDEX_SIZE: int = struct.calcsize(INDEX_FORMAT)
 
+    # The type characters match the ones of the engine
+    POSITION_DTYPES: Dict[str, np.dtype] = {
+        "float32": np.dtype("<f4"),
+        "float16": np.dtype("<f2")
+    }
+    DEFAULT_POSITION_DTYPE: str = "float32"
+
+    DISTANCE_INDEX_PAIR_DTYPE: np.dtype = np.dtype(
+        [("index", "<u2"), ("distance", "<f4")]
+    )
+    INDEX_DTYPE: np.dtype = np.dtype("<u2")
+
     DISTANCE_METRICS: Dict[str, str] = {
         "euclidean": "e",
         "cosine": "c"
@@ -46,6 +59,8 @@ class Neighbors(ABC):
     _distance_metric: str
     _datapoint_amount: int
     _dimensions: int
+    _position_dtype: str
+    _parameter_size: int
 
     _memory_view: memoryview
 
@@ -61,11 +76,17 @@ class Neighbors(ABC):
     def dimensions(self) -> int:
         return self._dimensions
 
+    @property
+    def position_dtype(self) -> str:
+        return self._position_dtype
+
     def __init__(
         self,
         distance_metric: str,
         datapoint_amount: int,
-        dimensions: int
+        dimensions: int,
+        position_dtype: str = DEFAULT_POSITION_DTYPE,
+        parameter_size: int = PARAMETER_SIZE
     ):
         self._memory_view = None
         self._raise_for_distance_metric(distance_metric)
@@ -74,10 +95,19 @@ class Neighbors(ABC):
         self._datapoint_amount = datapoint_amount
         self._raise_for_dimensions(dimensions)
         self._dimensions = dimensions
+        self._raise_for_position_dtype(position_dtype)
+        self._position_dtype = position_dtype
+        self._parameter_size = parameter_size
 
     def __del__(self):
         if self._memory_view is not None:
-            self._memory_view.release()
+            try:
+                self._memory_view.release()
+            except BufferError:
+                # Arrays returned by `positions`, `ranks` or
+                # `distance_index_pairs` still view the buffer, it is
+                # freed together with the last of them
+                pass
 
     def _raise_for_distance_metric(self, distance_metric: str):
         if distance_metric not in self.DISTANCE_METRICS:
@@ -94,19 +124,51 @@ class Neighbors(ABC):
             )
 
     def _raise_for_dimensions(self, dimensions: int):
-        if dimensions not in (self.DIMENSIONS_2D, self.DIMENSIONS_768):
+        if not 0 < dimensions <= self.MAX_DIMENSIONS:
             raise ValueError(
                 f"Invalid dimensions: {dimensions}. "
-                f"Valid dimensions: {self.DIMENSIONS_2D},"
-                f" {self.DIMENSIONS_768}"
+                f"Dimensions must be in (0, {self.MAX_DIMENSIONS}]."
+            )
+
+    def _raise_for_position_dtype(self, position_dtype: str):
+        if position_dtype not in self.POSITION_DTYPES:
+            raise ValueError(
+                f"Invalid position dtype: {position_dtype}. "
+                f"Valid position dtypes: {self.POSITION_DTYPES.keys()}"
             )
 
+    @classmethod
+    def file_size(
+        cls,
+        datapoint_amount: int,
+        dimensions: int,
+        position_dtype: str = DEFAULT_POSITION_DTYPE,
+        parameter_size: int = PARAMETER_SIZE
+    ) -> int:
+        """
+        Returns the size of the neighbors of the given shape in bytes.
+        """
+        return (
+            parameter_size
+            + cls.POSITION_DTYPES[position_dtype].itemsize
+            * dimensions * datapoint_amount
+            + (cls.DISTANCE_INDEX_PAIR_SIZE + cls.INDEX_SIZE)
+            * datapoint_amount ** 2
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._parameter_size + self._positions_size
+            + self._distance_index_pairs_size + self._ranks_size
+        )
+
     @property
     def _position_size(self) -> int:
-        if self._dimensions == self.DIMENSIONS_2D:
-            return self.POSITION_2D_SIZE
-        elif self._dimensions == self.DIMENSIONS_768:
-            return self.POSITION_768D_SIZE
+        return (
+            self.POSITION_DTYPES[self._position_dtype].itemsize
+            * self._dimensions
+        )
 
     @property
     def _positions_size(self) -> int:
@@ -125,7 +187,7 @@ class Neighbors(ABC):
 
     @property
     def _positions_offset(self) -> int:
-        return self.PARAMETER_SIZE
+        return self._parameter_size
 
     def _get_distance_index_pairs_offset(self, index: int) -> int:
         return (
@@ -155,19 +217,19 @@ class Neighbors(ABC):
         :return: The position of the datapoint as tuple of floats.
         """
         self._raise_for_index(index)
-        offset = self._positions_offset + self._position_size * index
-        position_format = (
-            self.POSITION_2D_FORMAT
-            if self._dimensions == self.DIMENSIONS_2D
-            else self.POSITION_768D_FORMAT
-        )
-        position = struct.unpack(
-            position_format,
-            self._memory_view[
-                offset: offset + self._position_size
-            ]
-        )
-        return position
+        return tuple(self.positions()[index].tolist())
+
+    def positions(self) -> np.ndarray:
+        """
+        Returns the positions of all datapoints as a zero-copy (N, D) array
+        in their stored dtype.
+        """
+        return np.frombuffer(
+            self._memory_view,
+            dtype=self.POSITION_DTYPES[self._position_dtype],
+            count=self._datapoint_amount * self._dimensions,
+            offset=self._positions_offset
+        ).reshape(self._datapoint_amount, self._dimensions)
 
     def get_neighbors(self, index: int) -> DistanceIndexPairGenerator:
         """
@@ -211,6 +273,59 @@ class Neighbors(ABC):
         ]
         return ranks
 
+    def distance_index_pairs(self) -> np.ndarray:
+        """
+        Returns the sorted (index, distance) pairs of all datapoints as a
+        zero-copy (N, N) structured array with the fields `index` and
+        `distance`. Column 0 refers to the point itself.
+        """
+        return np.frombuffer(
+            self._memory_view,
+            dtype=self.DISTANCE_INDEX_PAIR_DTYPE,
+            count=self._datapoint_amount ** 2,
+            offset=self._get_distance_index_pairs_offset(0)
+        ).reshape(self._datapoint_amount, self._datapoint_amount)
+
+    def ranks(self) -> np.ndarray:
+        """
+        Returns the ranks of all datapoints as a zero-copy (N, N) array.
+        Entry (i, j) is the rank of point j in regards to point i.
+        """
+        return np.frombuffer(
+            self._memory_view,
+            dtype=self.INDEX_DTYPE,
+            count=self._datapoint_amount ** 2,
+            offset=self._get_ranks_offset(0)
+        ).reshape(self._datapoint_amount, self._datapoint_amount)
+
+    def ranks_of(
+        self, columns: np.ndarray, rows: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Returns the rank of the datapoint columns[i, j] in regards to the
+        datapoint rows[i] for (n, k) columns. Rows default to all N
+        datapoints.
+        """
+        if rows is None:
+            rows = np.arange(self._datapoint_amount)
+        return self.ranks()[rows[:, np.newaxis], columns]
+
+    def sorted_distances(
+        self,
+        rows: np.ndarray | None = None,
+        ranks: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Returns the (n, N - 1) distances of the datapoints `rows`, all by
+        default, to all other datapoints in ascending order. Only the
+        distances at the ascending `ranks` in [1, N - 1] are returned if
+        they are given.
+        """
+        distances = self.distance_index_pairs()["distance"][:, 1:]
+        if rows is not None:
+            distances = distances[rows]
+        return distances if ranks is None else distances[:, ranks - 1]
+
     def get_ranks(self) -> RanksGenerator:
         """
         Returns the ranks of all datapoints.
@@ -232,24 +347,57 @@ class ComputedNeighbors(Neighbors):
     NEIGHBORS_EXECUTABLE_PATH: str = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), "neighbors", "neighbors"
     )
+    ENGINE_SOURCE_SUFFIXES: Tuple[str, ...] = (".cpp", ".hpp")
 
-    _dataset: pd.DataFrame
+    _positions: np.ndarray
 
     _shared_memory: sysv_ipc.SharedMemory
 
+    @classmethod
+    def engine_is_current(cls) -> bool:
+        """
+        Whether the engine is built and newer than all of its sources.
+        """
+        if not os.path.exists(cls.NEIGHBORS_EXECUTABLE_PATH):
+            return False
+        directory = os.path.dirname(cls.NEIGHBORS_EXECUTABLE_PATH)
+        source_mtime = max(
+            os.stat(os.path.join(directory, filename)).st_mtime_ns
+            for filename in os.listdir(directory)
+            if filename.endswith(cls.ENGINE_SOURCE_SUFFIXES)
+        )
+        return (
+            os.stat(cls.NEIGHBORS_EXECUTABLE_PATH).st_mtime_ns
+            >= source_mtime
+        )
+
+    @classmethod
+    def raise_for_engine(cls):
+        """
+        Raises if the engine is missing or older than its sources, an old
+        engine does not understand the current file and memory layout.
+        """
+        if not cls.engine_is_current():
+            raise RuntimeError(
+                f"{cls.NEIGHBORS_EXECUTABLE_PATH} is missing or older than "
+                "its sources, build it with ./compile-neighbors!"
+            )
+
     def __init__(
         self,
         distance_metric: str,
         dimensions: int,
-        dataset: pd.DataFrame
+        positions: np.ndarray,
+        position_dtype: str = Neighbors.DEFAULT_POSITION_DTYPE
     ):
-        self._raise_for_dataset(dataset, dimensions)
-        self._dataset = dataset
+        self._raise_for_positions(positions, dimensions)
+        self._positions = positions
 
         super().__init__(
             distance_metric,
-            len(dataset),
-            dimensions
+            len(positions),
+            dimensions,
+            position_dtype
         )
 
         self._shared_memory = sysv_ipc.SharedMemory(
@@ -281,27 +429,12 @@ class ComputedNeighbors(Neighbors):
     def _shared_memory_size(self) -> int:
         return self._input_size + self._output_size
 
-    def _raise_for_dataset(self, dataset: pd.DataFrame, dimensions: int):
-        if dimensions == self.DIMENSIONS_2D:
-            if 'position' not in dataset.columns:
-                raise ValueError(
-                    "Invalid dataset: position column missing."
-                )
-            if len(dataset['position'][0]) != self.DIMENSIONS_2D:
-                raise ValueError(
-                    "Invalid dataset: positions must have "
-                    f"{self.DIMENSIONS_2D} dimensions."
-                )
-        elif dimensions == self.DIMENSIONS_768:
-            if 'embeddings' not in dataset.columns:
-                raise ValueError(
-                    "Invalid dataset: embedding column missing."
-                )
-            if len(dataset['embeddings'][0]) != self.DIMENSIONS_768:
-                raise ValueError(
-                    "Invalid dataset: embeddings must have "
-                    f"{self.DIMENSIONS_768} dimensions."
-                )
+    def _raise_for_positions(self, positions: np.ndarray, dimensions: int):
+        if positions.ndim != 2 or positions.shape[1] != dimensions:
+            raise ValueError(
+                f"Invalid positions: expected shape (N, {dimensions}), "
+                f"got {positions.shape}."
+            )
 
     def _write_shared_memory(self):
         buffer = bytearray(self._input_size)
@@ -311,29 +444,16 @@ class ComputedNeighbors(Neighbors):
             0,
             ord(self.DISTANCE_METRICS[self._distance_metric]),
             self._datapoint_amount,
-            self._dimensions
-        )
-        position_key = (
-            'position'
-            if self._dimensions == self.DIMENSIONS_2D
-            else 'embeddings'
+            self._dimensions,
+            ord(self.POSITION_DTYPES[self._position_dtype].char)
         )
-        position_format = (
-            self.POSITION_2D_FORMAT
-            if self._dimensions == self.DIMENSIONS_2D
-            else self.POSITION_768D_FORMAT
-        )
-        for i, row in self._dataset.iterrows():
-            offset = self._positions_offset + self._position_size * i
-            struct.pack_into(
-                position_format,
-                buffer,
-                offset,
-                *row[position_key]
-            )
+        buffer[self._positions_offset:] = np.ascontiguousarray(
+            self._positions, dtype=self.POSITION_DTYPES[self._position_dtype]
+        ).tobytes()
         self._shared_memory.write(buffer)
 
     def _compute_neighbors(self):
+        self.raise_for_engine()
         process = subprocess.Popen(
             [
                 self.NEIGHBORS_EXECUTABLE_PATH,
@@ -396,19 +516,43 @@ class CachedNeighbors(Neighbors):
     def __del__(self):
         super().__del__()
         if self._memory_map is not None:
-            self._memory_map.close()
+            try:
+                self._memory_map.close()
+            except BufferError:
+                # Still exported by views, it is unmapped with the last one
+                pass
         if self._file is not None:
             self._file.close()
         gc.collect()
 
-    def _read_parameters(self) -> Tuple[str, int, int, int]:
+    def _read_parameters(self) -> Tuple[str, int, int, str, int]:
         buffer = self._file.read(self.PARAMETER_SIZE)
-        paremeters = struct.unpack(self.PARAMETER_FORMAT, buffer)
-        parameters = (
-            self.REVERSE_DISTANCE_METRICS[chr(paremeters[0])],
-            *paremeters[1:]
+        metric, datapoint_amount, dimensions, position_type = struct.unpack(
+            self.PARAMETER_FORMAT, buffer
+        )
+        distance_metric = self.REVERSE_DISTANCE_METRICS[chr(metric)]
+        file_size = os.fstat(self._file.fileno()).st_size
+        legacy_file_size = self.file_size(
+            datapoint_amount, dimensions,
+            parameter_size=self.LEGACY_PARAMETER_SIZE
+        )
+        if file_size == legacy_file_size:
+            return (
+                distance_metric, datapoint_amount, dimensions,
+                self.DEFAULT_POSITION_DTYPE, self.LEGACY_PARAMETER_SIZE
+            )
+        position_dtypes = {
+            dtype.char: name for name, dtype in self.POSITION_DTYPES.items()
+        }
+        if chr(position_type) not in position_dtypes:
+            raise ValueError(
+                f"Invalid position type in {self._file.name}: "
+                f"{chr(position_type)!r}"
+            )
+        return (
+            distance_metric, datapoint_amount, dimensions,
+            position_dtypes[chr(position_type)], self.PARAMETER_SIZE
         )
-        return parameters
 
     def _map_file(self):
         self._memory_map = mmap.mmap(
@@ -417,3 +561,328 @@ class CachedNeighbors(Neighbors):
             access=mmap.ACCESS_READ
         )
         self._memory_view = memoryview(self._memory_map)
+
+    def prefetch(self) -> bool:
+        """
+        Asks the kernel to read the whole file into the page cache in the
+        background so that later accesses do not fault on cold pages.
+
+        :return: Whether the platform supports prefetching.
+        """
+        if not hasattr(mmap, "MADV_WILLNEED"):
+            return False
+        self._memory_map.madvise(mmap.MADV_WILLNEED)
+        return True
+
+
+class TopKNeighbors:
+    """
+    The K nearest neighbors of every datapoint as written by an
+    approximate nearest neighbor index. Unlike `CachedNeighbors` the file
+    holds only K + 1 (index, distance) pairs per datapoint and a sorted
+    sample of the distances of every datapoint to Q other datapoints, so
+    it grows with N * (K + Q + D) instead of N². The sample estimates the
+    ranks and distances beyond the K nearest neighbors. Indices are
+    uint32, so the datapoint amount is not limited to uint16.
+    """
+
+    # Distance metric, datapoint amount, dimensions, pairs per datapoint
+    # and distance samples per datapoint
+    PARAMETER_FORMAT: str = "=bIHHH"
+    PARAMETER_SIZE: int = struct.calcsize(PARAMETER_FORMAT)
+    DISTANCE_INDEX_PAIR_DTYPE: np.dtype = np.dtype(
+        [("index", "<u4"), ("distance", "<f4")]
+    )
+    FLOAT_DTYPE: np.dtype = np.dtype("<f4")
+    FILENAME_SUFFIX: str = "_topk"
+
+    _distance_metric: str
+    _datapoint_amount: int
+    _dimensions: int
+    _pair_amount: int
+    _sample_amount: int
+    # Neighbors of `from_arrays` are held in bytes
+    _memory_map: mmap.mmap | bytes
+
+    @classmethod
+    def dump(
+        cls,
+        filename: str,
+        distance_metric: str,
+        positions: np.ndarray,
+        indices: np.ndarray,
+        distances: np.ndarray,
+        distance_samples: np.ndarray
+    ):
+        """
+        Writes the neighbors to a file.
+
+        :param filename: The path of the file.
+        :param distance_metric: The distance metric of the neighbors.
+        :param positions: The (N, D) positions of the datapoints.
+        :param indices: The (N, K + 1) neighbor indices sorted by distance.
+            Column 0 refers to the point itself.
+        :param distances: The (N, K + 1) distances in the same order.
+        :param distance_samples: The (N, Q) distances of every datapoint
+            to the same Q random datapoints, sorted per datapoint.
+        """
+        temporary_filename = filename + ".tmp"
+        with open(temporary_filename, 'wb') as file:
+            cls._write(
+                file, distance_metric, positions, indices, distances,
+                distance_samples
+            )
+        os.replace(temporary_filename, filename)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        distance_metric: str,
+        positions: np.ndarray,
+        indices: np.ndarray,
+        distances: np.ndarray,
+        distance_samples: np.ndarray
+    ) -> "TopKNeighbors":
+        """
+        Returns the neighbors in memory instead of in a file, see `dump`
+        for the parameters.
+        """
+        buffer = io.BytesIO()
+        cls._write(
+            buffer, distance_metric, positions, indices, distances,
+            distance_samples
+        )
+        neighbors = cls.__new__(cls)
+        neighbors._read_parameters(buffer.getvalue())
+        return neighbors
+
+    @classmethod
+    def _write(
+        cls,
+        file: io.RawIOBase,
+        distance_metric: str,
+        positions: np.ndarray,
+        indices: np.ndarray,
+        distances: np.ndarray,
+        distance_samples: np.ndarray
+    ):
+        if distance_metric not in Neighbors.DISTANCE_METRICS:
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+        datapoint_amount, dimensions = positions.shape
+        if (
+            indices.shape != distances.shape or indices.ndim != 2
+            or len(indices) != datapoint_amount
+            or len(distance_samples) != datapoint_amount
+        ):
+            raise ValueError(
+                f"Invalid shapes: {positions.shape}, {indices.shape}, "
+                f"{distances.shape} and {distance_samples.shape}"
+            )
+        pairs = np.empty(indices.shape, dtype=cls.DISTANCE_INDEX_PAIR_DTYPE)
+        pairs["index"] = indices
+        pairs["distance"] = distances
+        file.write(struct.pack(
+            cls.PARAMETER_FORMAT,
+            ord(Neighbors.DISTANCE_METRICS[distance_metric]),
+            datapoint_amount,
+            dimensions,
+            indices.shape[1],
+            distance_samples.shape[1]
+        ))
+        file.write(np.ascontiguousarray(
+            positions, dtype=cls.FLOAT_DTYPE
+        ).tobytes())
+        file.write(pairs.tobytes())
+        file.write(np.ascontiguousarray(
+            distance_samples, dtype=cls.FLOAT_DTYPE
+        ).tobytes())
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as file:
+            # The map stays valid after the file is closed
+            self._read_parameters(mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ))
+
+    def _read_parameters(self, buffer: mmap.mmap | bytes):
+        (
+            metric, datapoint_amount, dimensions,
+            pair_amount, sample_amount
+        ) = struct.unpack_from(self.PARAMETER_FORMAT, buffer)
+        self._memory_map = buffer
+        self._distance_metric = Neighbors.REVERSE_DISTANCE_METRICS[
+            chr(metric)
+        ]
+        self._datapoint_amount = datapoint_amount
+        self._dimensions = dimensions
+        self._pair_amount = pair_amount
+        self._sample_amount = sample_amount
+
+    @property
+    def distance_metric(self) -> str:
+        return self._distance_metric
+
+    @property
+    def datapoint_amount(self) -> int:
+        return self._datapoint_amount
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    @property
+    def k(self) -> int:
+        """
+        The amount of neighbors per datapoint without the point itself.
+        """
+        return self._pair_amount - 1
+
+    @property
+    def sample_amount(self) -> int:
+        return self._sample_amount
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._memory_map)
+
+    def _array(
+        self, dtype: np.dtype, offset: int, columns: int
+    ) -> np.ndarray:
+        return np.frombuffer(
+            self._memory_map,
+            dtype=dtype,
+            count=self._datapoint_amount * columns,
+            offset=offset
+        ).reshape(self._datapoint_amount, columns)
+
+    def positions(self) -> np.ndarray:
+        """
+        Returns the positions of all datapoints as a zero-copy (N, D)
+        array.
+        """
+        return self._array(
+            self.FLOAT_DTYPE, self.PARAMETER_SIZE, self._dimensions
+        )
+
+    def distance_index_pairs(self) -> np.ndarray:
+        """
+        Returns the sorted (index, distance) pairs of all datapoints as a
+        zero-copy (N, K + 1) structured array with the fields `index` and
+        `distance`. Column 0 refers to the point itself.
+        """
+        return self._array(
+            self.DISTANCE_INDEX_PAIR_DTYPE,
+            self.PARAMETER_SIZE + self.positions().nbytes,
+            self._pair_amount
+        )
+
+    def distance_samples(self) -> np.ndarray:
+        """
+        Returns the sorted sampled distances of all datapoints as a
+        zero-copy (N, Q) array.
+        """
+        return self._array(
+            self.FLOAT_DTYPE,
+            self.PARAMETER_SIZE + self.positions().nbytes
+            + self.distance_index_pairs().nbytes,
+            self._sample_amount
+        )
+
+    def _distances(
+        self, rows: np.ndarray, others: np.ndarray
+    ) -> np.ndarray:
+        positions = self.positions()
+        points = positions[rows].astype(np.float64)
+        others = positions[others].astype(np.float64)
+        if self._distance_metric == "cosine":
+            return 1.0 - np.sum(points * others, axis=1) / (
+                np.linalg.norm(points, axis=1)
+                * np.linalg.norm(others, axis=1)
+            )
+        return np.linalg.norm(points - others, axis=1)
+
+    def _estimated_ranks(
+        self, rows: np.ndarray, distances: np.ndarray
+    ) -> np.ndarray:
+        closer = np.sum(
+            self.distance_samples()[rows] < distances[:, np.newaxis], axis=1
+        )
+        return np.rint(
+            closer / self._sample_amount * (self._datapoint_amount - 1)
+        ).astype(np.int64)
+
+    def ranks_of(
+        self, columns: np.ndarray, rows: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Returns the rank of the datapoint columns[i, j] in regards to the
+        datapoint rows[i] for (n, k) columns. Rows default to all N
+        datapoints. Ranks beyond the K nearest neighbors are estimated
+        from the distance samples and are at least K + 1.
+        """
+        if rows is None:
+            rows = np.arange(self._datapoint_amount)
+        indices = self.distance_index_pairs()["index"][rows]
+        matches = indices[:, None, :] == columns[:, :, None]
+        found = matches.any(axis=2)
+        ranks = matches.argmax(axis=2)
+        if not found.all():
+            missing, cols = np.nonzero(~found)
+            distances = self._distances(
+                rows[missing], columns[missing, cols]
+            )
+            ranks[missing, cols] = np.maximum(
+                self._estimated_ranks(rows[missing], distances),
+                self._pair_amount
+            )
+        return ranks
+
+    def sorted_distances(
+        self,
+        rows: np.ndarray | None = None,
+        ranks: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Returns the (n, N - 1) distances of the datapoints `rows`, all by
+        default, to all other datapoints in ascending order, like the
+        distances of `distance_index_pairs` of `Neighbors` without column
+        0. The first K columns are exact, the others are interpolated from
+        the distance samples.
+
+        :param rows: The datapoints, all by default.
+        :param ranks: Only the distances at these ascending ranks in
+            [1, N - 1] are returned, all by default.
+        """
+        if rows is None:
+            rows = slice(None)
+        if ranks is None:
+            ranks = np.arange(1, self._datapoint_amount)
+        distances = self.distance_index_pairs()["distance"][rows]
+        head = distances[:, ranks[ranks < self._pair_amount]]
+        # Sample q is the distance at rank (q + 0.5) / Q * (N - 1), the
+        # interpolation weights are the same for all datapoints
+        samples = self.distance_samples()[rows]
+        positions = np.clip(
+            ranks[ranks >= self._pair_amount]
+            / (self._datapoint_amount - 1) * self._sample_amount - 0.5,
+            0, self._sample_amount - 1
+        )
+        left = np.minimum(
+            positions.astype(np.int64), self._sample_amount - 2
+        ).clip(0)
+        right = np.minimum(left + 1, self._sample_amount - 1)
+        weights = (positions - left).astype(self.FLOAT_DTYPE)
+        tail = (
+            samples[:, left] * (1 - weights) + samples[:, right] * weights
+        )
+        # Estimated distances never undercut the exact K nearest ones
+        tail = np.maximum(tail, distances[:, -1:])
+        return np.concatenate([head, tail], axis=1)
+
+    def prefetch(self) -> bool:
+        if not hasattr(mmap, "MADV_WILLNEED") or not isinstance(
+            self._memory_map, mmap.mmap
+        ):
+            return False
+        self._memory_map.madvise(mmap.MADV_WILLNEED)
+        return True
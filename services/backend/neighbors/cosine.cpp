@@ -10,21 +10,24 @@
 
 typedef struct {
     size_t offset;
+    size_t end;
     DistanceIndexPair *distanceIndexPairs;
     Index *ranks;
-    size_t coreAmount;
     size_t datapointAmount;
+    const Position2D *positions;
     std::vector<std::pair<Position2D*, float>> *positionAngles;
+    const std::vector<Index> *anglePositions;
 } CosineThreadArgs2D;
 
 typedef struct {
     size_t offset;
-    Position768D *positions;
+    size_t end;
+    const float *positions;
+    size_t dimensions;
     DistanceIndexPair *distanceIndexPairs;
     Index *ranks;
-    size_t coreAmount;
     size_t datapointAmount;
-} CosineThreadArgs768D;
+} CosineThreadArgsND;
 
 float positionAngle2D(const Position2D *a) {
     return atan2f(a->y, a->x);
@@ -37,14 +40,14 @@ float cosineDistance2D(const Position2D *a, const Position2D *b) {
     return 1.0f - dotAB / sqrtf(dotAA * dotBB);
 }
 
-float cosineDistance768D(const Position768D *a, const Position768D *b) {
+float cosineDistanceND(const float *a, const float *b, size_t dimensions) {
     float dotAA = 0.0f;
     float dotBB = 0.0f;
     float dotAB = 0.0f;
-    for (size_t i = 0; i < DIMENSIONS_768; ++i) {
-        dotAA += a->values[i] * a->values[i];
-        dotBB += b->values[i] * b->values[i];
-        dotAB += a->values[i] * b->values[i];
+    for (size_t i = 0; i < dimensions; ++i) {
+        dotAA += a[i] * a[i];
+        dotBB += b[i] * b[i];
+        dotAB += a[i] * b[i];
     }
     return 1.0f - dotAB / sqrtf(dotAA * dotBB);
 }
@@ -60,36 +63,35 @@ void * cosineThreadHandler2D(void *args) {
     const size_t start = threadArgs->offset;
     DistanceIndexPair *distanceIndexPairs = threadArgs->distanceIndexPairs;
     Index *ranks = threadArgs->ranks;
-    const size_t coreAmount = threadArgs->coreAmount;
     const size_t datapointAmount = threadArgs->datapointAmount;
+    const Position2D *positions = threadArgs->positions;
     const std::vector<std::pair<Position2D*, float>> *positionAngles = threadArgs->positionAngles;
+    const std::vector<Index> *anglePositions = threadArgs->anglePositions;
 
-    size_t end = (
-        start
-        + (datapointAmount / coreAmount)
-        + (datapointAmount % coreAmount != 0)
-    );
-    if (end > datapointAmount) end = datapointAmount;
+    const size_t end = threadArgs->end;
 
+    // Rows and neighbor indices are in dataset order, the walk over the
+    // neighbors of a row starts at its place in the angle order.
     for (size_t i = start; i < end; ++i) {
-        auto [position, angle] = (*positionAngles)[i];
-        Index leftIndex = i;
-        Index rightIndex = (i == datapointAmount - 1) ? 0 : i + 1;
+        const Index anglePosition = (*anglePositions)[i];
+        auto [position, angle] = (*positionAngles)[anglePosition];
+        Index leftIndex = anglePosition;
+        Index rightIndex = (anglePosition == datapointAmount - 1) ? 0 : anglePosition + 1;
         for (size_t j = 0; j < datapointAmount; ++j) {
             const float leftAngle = (*positionAngles)[leftIndex].second;
             const float rightAngle = (*positionAngles)[rightIndex].second;
             if (relativeAngle(leftAngle, angle) < relativeAngle(rightAngle, angle)) {
-                float distance = cosineDistance2D(position, (*positionAngles)[leftIndex].first);
+                const Position2D *neighbor = (*positionAngles)[leftIndex].first;
                 distanceIndexPairs[i * datapointAmount + j] = (DistanceIndexPair){
-                    .index = leftIndex,
-                    .distance = distance
+                    .index = (Index)(neighbor - positions),
+                    .distance = cosineDistance2D(position, neighbor)
                 };
                 leftIndex = (leftIndex == 0) ? datapointAmount - 1 : leftIndex - 1;
             } else {
-                float distance = cosineDistance2D(position, (*positionAngles)[rightIndex].first);
+                const Position2D *neighbor = (*positionAngles)[rightIndex].first;
                 distanceIndexPairs[i * datapointAmount + j] = (DistanceIndexPair){
-                    .index = rightIndex,
-                    .distance = distance
+                    .index = (Index)(neighbor - positions),
+                    .distance = cosineDistance2D(position, neighbor)
                 };
                 rightIndex = (rightIndex == datapointAmount - 1) ? 0 : rightIndex + 1;
             }
@@ -102,27 +104,26 @@ void * cosineThreadHandler2D(void *args) {
     return nullptr;
 }
 
-void * cosineThreadHandler768D(void *args) {
-    const CosineThreadArgs768D *threadArgs = (CosineThreadArgs768D*)args;
+void * cosineThreadHandlerND(void *args) {
+    const CosineThreadArgsND *threadArgs = (CosineThreadArgsND*)args;
     const size_t start = threadArgs->offset;
-    const Position768D *positions = threadArgs->positions;
+    const float *positions = threadArgs->positions;
+    const size_t dimensions = threadArgs->dimensions;
     DistanceIndexPair *distanceIndexPairs = threadArgs->distanceIndexPairs;
     Index *ranks = threadArgs->ranks;
-    const size_t coreAmount = threadArgs->coreAmount;
     const size_t datapointAmount = threadArgs->datapointAmount;
 
-    size_t end = (
-        start
-        + (datapointAmount / coreAmount)
-        + (datapointAmount % coreAmount != 0)
-    );
-    if (end > datapointAmount) end = datapointAmount;
+    const size_t end = threadArgs->end;
 
     for (size_t i = start; i < end; ++i) {
         for (size_t j = 0; j < datapointAmount; ++j) {
             distanceIndexPairs[i * datapointAmount + j] = (DistanceIndexPair){
                 .index = (Index)j,
-                .distance = cosineDistance768D(positions + i, positions + j)
+                .distance = cosineDistanceND(
+                    positions + i * dimensions,
+                    positions + j * dimensions,
+                    dimensions
+                )
             };
         }
         qsort(
@@ -142,6 +143,8 @@ void * cosineThreadHandler768D(void *args) {
 void findCosineNeighbors2D(
     Position2D *positions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 ) {
@@ -154,23 +157,33 @@ void findCosineNeighbors2D(
     std::stable_sort(positionAngles.begin(), positionAngles.end(), [](const std::pair<Position2D*, float> &a, const std::pair<Position2D*, float> &b) {
         return a.second < b.second;
     });
+    std::vector<Index> anglePositions(datapointAmount);
+    for (size_t i = 0; i < datapointAmount; ++i) {
+        anglePositions[positionAngles[i].first - positions] = i;
+    }
 
+    const size_t rowAmount = rowEnd - rowStart;
     size_t coreAmount = get_nprocs();
-    if (coreAmount > datapointAmount) coreAmount = datapointAmount;
+    if (coreAmount > rowAmount) coreAmount = rowAmount;
+    const size_t rowsPerCore = (
+        (rowAmount / coreAmount)
+        + (rowAmount % coreAmount != 0)
+    );
     pthread_t threads[coreAmount];
     CosineThreadArgs2D threadArgs[coreAmount];
 
     for (size_t i = 0; i < coreAmount; ++i) {
+        size_t end = rowStart + (i + 1) * rowsPerCore;
+        if (end > rowEnd) end = rowEnd;
         threadArgs[i] = (CosineThreadArgs2D) {
-            .offset = i * (
-                (datapointAmount / coreAmount)
-                + (datapointAmount % coreAmount != 0)
-            ),
+            .offset = rowStart + i * rowsPerCore,
+            .end = end,
             .distanceIndexPairs = distanceIndexPairs,
             .ranks = ranks,
-            .coreAmount = coreAmount,
             .datapointAmount = datapointAmount,
-            .positionAngles = &positionAngles
+            .positions = positions,
+            .positionAngles = &positionAngles,
+            .anglePositions = &anglePositions
         };
         pthread_create(&threads[i], NULL, cosineThreadHandler2D, &threadArgs[i]);
     }
@@ -180,30 +193,38 @@ void findCosineNeighbors2D(
     }
 }
 
-void findCosineNeighbors768D(
-    Position768D *positions,
+void findCosineNeighborsND(
+    const float *positions,
+    size_t dimensions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 ) {
+    const size_t rowAmount = rowEnd - rowStart;
     size_t coreAmount = get_nprocs();
-    if (coreAmount > datapointAmount) coreAmount = datapointAmount;
+    if (coreAmount > rowAmount) coreAmount = rowAmount;
+    const size_t rowsPerCore = (
+        (rowAmount / coreAmount)
+        + (rowAmount % coreAmount != 0)
+    );
     pthread_t threads[coreAmount];
-    CosineThreadArgs768D threadArgs[coreAmount];
+    CosineThreadArgsND threadArgs[coreAmount];
 
     for (size_t i = 0; i < coreAmount; ++i) {
-        threadArgs[i] = (CosineThreadArgs768D) {
-            .offset = i * (
-                (datapointAmount / coreAmount)
-                + (datapointAmount % coreAmount != 0)
-            ),
+        size_t end = rowStart + (i + 1) * rowsPerCore;
+        if (end > rowEnd) end = rowEnd;
+        threadArgs[i] = (CosineThreadArgsND) {
+            .offset = rowStart + i * rowsPerCore,
+            .end = end,
             .positions = positions,
+            .dimensions = dimensions,
             .distanceIndexPairs = distanceIndexPairs,
             .ranks = ranks,
-            .coreAmount = coreAmount,
             .datapointAmount = datapointAmount
         };
-        pthread_create(&threads[i], NULL, cosineThreadHandler768D, &threadArgs[i]);
+        pthread_create(&threads[i], NULL, cosineThreadHandlerND, &threadArgs[i]);
     }
 
     for (size_t i = 0; i < coreAmount; ++i) {
@@ -8,12 +8,17 @@
 void findCosineNeighbors2D(
     Position2D *positions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 );
-void findCosineNeighbors768D(
-    Position768D *positions,
+void findCosineNeighborsND(
+    const float *positions,
+    size_t dimensions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 );
@@ -7,21 +7,22 @@
 
 typedef struct {
     size_t offset;
+    size_t end;
     Position2D *positions;
     DistanceIndexPair *distanceIndexPairs;
     Index *ranks;
-    size_t coreAmount;
     size_t datapointAmount;
 } EuclideanThreadArgs2D;
 
 typedef struct {
     size_t offset;
-    Position768D *positions;
+    size_t end;
+    const float *positions;
+    size_t dimensions;
     DistanceIndexPair *distanceIndexPairs;
     Index *ranks;
-    size_t coreAmount;
     size_t datapointAmount;
-} EuclideanThreadArgs768D;
+} EuclideanThreadArgsND;
 
 float euclideanDistance2D(const Position2D *a, const Position2D *b) {
     Position2D difference = (Position2D){
@@ -31,10 +32,10 @@ float euclideanDistance2D(const Position2D *a, const Position2D *b) {
     return hypotf(difference.x, difference.y);
 }
 
-float euclideanDistance768D(const Position768D *a, const Position768D *b) {
+float euclideanDistanceND(const float *a, const float *b, size_t dimensions) {
     float sum = 0.0f;
-    for (size_t i = 0; i < DIMENSIONS_768; ++i) {
-        float difference = a->values[i] - b->values[i];
+    for (size_t i = 0; i < dimensions; ++i) {
+        float difference = a[i] - b[i];
         sum += difference * difference;
     }
     return sqrtf(sum);
@@ -46,15 +47,9 @@ void * euclideanThreadHandler2D(void *args) {
     const Position2D *positions = threadArgs->positions;
     DistanceIndexPair *distanceIndexPairs = threadArgs->distanceIndexPairs;
     Index *ranks = threadArgs->ranks;
-    const size_t coreAmount = threadArgs->coreAmount;
     const size_t datapointAmount = threadArgs->datapointAmount;
 
-    size_t end = (
-        start
-        + (datapointAmount / coreAmount)
-        + (datapointAmount % coreAmount != 0)
-    );
-    if (end > datapointAmount) end = datapointAmount;
+    const size_t end = threadArgs->end;
 
     for (size_t i = start; i < end; ++i) {
         for (size_t j = 0; j < datapointAmount; ++j) {
@@ -77,27 +72,26 @@ void * euclideanThreadHandler2D(void *args) {
     return nullptr;
 }
 
-void * euclideanThreadHandler768D(void *args) {
-    const EuclideanThreadArgs768D *threadArgs = (EuclideanThreadArgs768D*)args;
+void * euclideanThreadHandlerND(void *args) {
+    const EuclideanThreadArgsND *threadArgs = (EuclideanThreadArgsND*)args;
     const size_t start = threadArgs->offset;
-    const Position768D *positions = threadArgs->positions;
+    const float *positions = threadArgs->positions;
+    const size_t dimensions = threadArgs->dimensions;
     DistanceIndexPair *distanceIndexPairs = threadArgs->distanceIndexPairs;
     Index *ranks = threadArgs->ranks;
-    const size_t coreAmount = threadArgs->coreAmount;
     const size_t datapointAmount = threadArgs->datapointAmount;
 
-    size_t end = (
-        start
-        + (datapointAmount / coreAmount)
-        + (datapointAmount % coreAmount != 0)
-    );
-    if (end > datapointAmount) end = datapointAmount;
+    const size_t end = threadArgs->end;
 
     for (size_t i = start; i < end; ++i) {
         for (size_t j = 0; j < datapointAmount; ++j) {
             distanceIndexPairs[i * datapointAmount + j] = (DistanceIndexPair){
                 .index = (Index)j,
-                .distance = euclideanDistance768D(positions + i, positions + j)
+                .distance = euclideanDistanceND(
+                    positions + i * dimensions,
+                    positions + j * dimensions,
+                    dimensions
+                )
             };
         }
         qsort(
@@ -117,24 +111,30 @@ void * euclideanThreadHandler768D(void *args) {
 void findEuclideanNeighbors2D(
     Position2D *positions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 ) {
+    const size_t rowAmount = rowEnd - rowStart;
     size_t coreAmount = get_nprocs();
-    if (coreAmount > datapointAmount) coreAmount = datapointAmount;
+    if (coreAmount > rowAmount) coreAmount = rowAmount;
+    const size_t rowsPerCore = (
+        (rowAmount / coreAmount)
+        + (rowAmount % coreAmount != 0)
+    );
     pthread_t threads[coreAmount];
     EuclideanThreadArgs2D threadArgs[coreAmount];
 
     for (size_t i = 0; i < coreAmount; ++i) {
+        size_t end = rowStart + (i + 1) * rowsPerCore;
+        if (end > rowEnd) end = rowEnd;
         threadArgs[i] = (EuclideanThreadArgs2D) {
-            .offset = i * (
-                (datapointAmount / coreAmount)
-                + (datapointAmount % coreAmount != 0)
-            ),
+            .offset = rowStart + i * rowsPerCore,
+            .end = end,
             .positions = positions,
             .distanceIndexPairs = distanceIndexPairs,
             .ranks = ranks,
-            .coreAmount = coreAmount,
             .datapointAmount = datapointAmount
         };
         pthread_create(&threads[i], NULL, euclideanThreadHandler2D, &threadArgs[i]);
@@ -145,30 +145,38 @@ void findEuclideanNeighbors2D(
     }
 }
 
-void findEuclideanNeighbors768D(
-    Position768D *positions,
+void findEuclideanNeighborsND(
+    const float *positions,
+    size_t dimensions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 ) {
+    const size_t rowAmount = rowEnd - rowStart;
     size_t coreAmount = get_nprocs();
-    if (coreAmount > datapointAmount) coreAmount = datapointAmount;
+    if (coreAmount > rowAmount) coreAmount = rowAmount;
+    const size_t rowsPerCore = (
+        (rowAmount / coreAmount)
+        + (rowAmount % coreAmount != 0)
+    );
     pthread_t threads[coreAmount];
-    EuclideanThreadArgs768D threadArgs[coreAmount];
+    EuclideanThreadArgsND threadArgs[coreAmount];
 
     for (size_t i = 0; i < coreAmount; ++i) {
-        threadArgs[i] = (EuclideanThreadArgs768D) {
-            .offset = i * (
-                (datapointAmount / coreAmount)
-                + (datapointAmount % coreAmount != 0)
-            ),
+        size_t end = rowStart + (i + 1) * rowsPerCore;
+        if (end > rowEnd) end = rowEnd;
+        threadArgs[i] = (EuclideanThreadArgsND) {
+            .offset = rowStart + i * rowsPerCore,
+            .end = end,
             .positions = positions,
+            .dimensions = dimensions,
             .distanceIndexPairs = distanceIndexPairs,
             .ranks = ranks,
-            .coreAmount = coreAmount,
             .datapointAmount = datapointAmount
         };
-        pthread_create(&threads[i], NULL, euclideanThreadHandler768D, &threadArgs[i]);
+        pthread_create(&threads[i], NULL, euclideanThreadHandlerND, &threadArgs[i]);
     }
 
     for (size_t i = 0; i < coreAmount; ++i) {
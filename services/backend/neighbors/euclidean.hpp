@@ -8,12 +8,17 @@
 void findEuclideanNeighbors2D(
     Position2D *positions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 );
-void findEuclideanNeighbors768D(
-    Position768D *positions,
+void findEuclideanNeighborsND(
+    const float *positions,
+    size_t dimensions,
     size_t datapointAmount,
+    size_t rowStart,
+    size_t rowEnd,
     DistanceIndexPair *distanceIndexPairs,
     Index *ranks
 );
@@ -1,7 +1,13 @@
 #include <sys/shm.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
 #include <errno.h>
+#include <string.h>
 
 #include <iostream>
+#include <vector>
 
 #include "types.hpp"
 #include "euclidean.hpp"
@@ -10,8 +16,41 @@
 
 #define ARGUMENT_COUNT (2)
 #define ARGUMENT_BASE (10)
+#define FILE_OPTION ("--file")
+#define FILE_ARGUMENT_COUNT (2)
+#define FILE_ROWS_ARGUMENT_COUNT (4)
+#define ALL_ROWS (SIZE_MAX)
 #define SHARED_MEMORY_ACCESS_FLAGS (0666)
 #define SHARED_MEMORY_ERROR (-1)
+#define FILE_ERROR (-1)
+
+bool isFileMode(int argc, char *argv[]) {
+    return argc > 1 && strcmp(argv[1], FILE_OPTION) == 0;
+}
+
+// --file <path> [<first row> <end row>]
+bool parseFileArguments(
+    int argc,
+    char *argv[],
+    const char **path,
+    size_t *rowStart,
+    size_t *rowEnd
+) {
+    if (argc - 1 == FILE_ARGUMENT_COUNT) {
+        *path = argv[2];
+        *rowStart = 0;
+        *rowEnd = ALL_ROWS;
+        return true;
+    }
+    if (argc - 1 != FILE_ROWS_ARGUMENT_COUNT) return false;
+    *path = argv[2];
+    errno = 0;
+    *rowStart = strtoull(argv[3], NULL, ARGUMENT_BASE);
+    if (errno != 0) return false;
+    *rowEnd = strtoull(argv[4], NULL, ARGUMENT_BASE);
+    if (errno != 0) return false;
+    return true;
+}
 
 bool parseArguments(
     int argc,
@@ -40,31 +79,83 @@ bool detachSharedMemory(void *sharedMemory) {
     return shmdt(sharedMemory) != SHARED_MEMORY_ERROR;
 }
 
-bool computeNeighbors2D(
+// The file already holds the parameters and positions and is sized for
+// the output, which the page cache writes back without an extra copy
+bool mapFile(const char *path, size_t *fileSize, void **fileMemory) {
+    int file = open(path, O_RDWR);
+    if (file == FILE_ERROR) return false;
+    struct stat fileStatus;
+    if (fstat(file, &fileStatus) == FILE_ERROR) {
+        close(file);
+        return false;
+    }
+    *fileSize = fileStatus.st_size;
+    *fileMemory = mmap(
+        NULL, *fileSize, PROT_READ | PROT_WRITE, MAP_SHARED, file, 0
+    );
+    close(file);
+    return *fileMemory != MAP_FAILED;
+}
+
+bool unmapFile(void *fileMemory, size_t fileSize) {
+    if (msync(fileMemory, fileSize, MS_SYNC) == FILE_ERROR) return false;
+    return munmap(fileMemory, fileSize) != FILE_ERROR;
+}
+
+bool computeNeighbors(
     DistanceMetric distanceMetric,
     size_t datapointAmount,
-    void *sharedMemory
+    size_t dimensions,
+    size_t rowStart,
+    size_t rowEnd,
+    float *positions,
+    DistanceIndexPair *distanceIndexPairs,
+    Index *ranks
 ) {
-    Position2D *positions = (Position2D*)sharedMemory;
-    DistanceIndexPair *distanceIndexPairs = (DistanceIndexPair*)(positions + datapointAmount);
-    Index *ranks = (Index*)(distanceIndexPairs + datapointAmount * datapointAmount);
-
     switch (distanceMetric) {
         case EUCLIDEAN_DISTANCE_METRIC:
-            findEuclideanNeighbors2D(
-                positions,
-                datapointAmount,
-                distanceIndexPairs,
-                ranks
-            );
+            if (dimensions == DIMENSIONS_2) {
+                findEuclideanNeighbors2D(
+                    (Position2D*)positions,
+                    datapointAmount,
+                    rowStart,
+                    rowEnd,
+                    distanceIndexPairs,
+                    ranks
+                );
+            } else {
+                findEuclideanNeighborsND(
+                    positions,
+                    dimensions,
+                    datapointAmount,
+                    rowStart,
+                    rowEnd,
+                    distanceIndexPairs,
+                    ranks
+                );
+            }
             break;
         case COSINE_DISTANCE_METRIC:
-            findCosineNeighbors2D(
-                positions,
-                datapointAmount,
-                distanceIndexPairs,
-                ranks
-            );
+            if (dimensions == DIMENSIONS_2) {
+                findCosineNeighbors2D(
+                    (Position2D*)positions,
+                    datapointAmount,
+                    rowStart,
+                    rowEnd,
+                    distanceIndexPairs,
+                    ranks
+                );
+            } else {
+                findCosineNeighborsND(
+                    positions,
+                    dimensions,
+                    datapointAmount,
+                    rowStart,
+                    rowEnd,
+                    distanceIndexPairs,
+                    ranks
+                );
+            }
             break;
         default:
             return false;
@@ -73,40 +164,94 @@ bool computeNeighbors2D(
     return true;
 }
 
-bool computeNeighbors768D(
-    DistanceMetric distanceMetric,
-    size_t datapointAmount,
-    void *sharedMemory
+// Only the rows [rowStart, rowEnd) of the output are computed
+bool processMemory(
+    void *memory, size_t memorySize, size_t rowStart, size_t rowEnd
 ) {
-    Position768D *positions = (Position768D*)sharedMemory;
-    DistanceIndexPair *distanceIndexPairs = (DistanceIndexPair*)(positions + datapointAmount);
-    Index *ranks = (Index*)(distanceIndexPairs + datapointAmount * datapointAmount);
+    Parameters *parameters = (Parameters*)memory;
+    DistanceMetric distanceMetric = parameters->distanceMetric;
+    Index datapointAmount = parameters->datapointAmount;
+    DimensionCount dimensions = parameters->dimensions;
+    PositionType positionType = parameters->positionType;
 
-    switch (distanceMetric) {
-        case EUCLIDEAN_DISTANCE_METRIC:
-            findEuclideanNeighbors768D(
-                positions,
-                datapointAmount,
-                distanceIndexPairs,
-                ranks
-            );
-            break;
-        case COSINE_DISTANCE_METRIC:
-            findCosineNeighbors768D(
-                positions,
-                datapointAmount,
-                distanceIndexPairs,
-                ranks
-            );
-            break;
-        default:
-            return false;
+    void *data = (void*)(parameters + 1);
+
+    const size_t positionTypeSize_ = positionTypeSize(positionType);
+    if (positionTypeSize_ == 0) {
+        printError("Invalid position type");
+        return false;
+    }
+    if (dimensions == 0) {
+        printError("Invalid dimensions");
+        return false;
+    }
+    if (rowEnd == ALL_ROWS) rowEnd = datapointAmount;
+    if (rowStart >= rowEnd || rowEnd > datapointAmount) {
+        printError("Invalid rows");
+        return false;
+    }
+
+    const size_t valueAmount = (size_t)datapointAmount * dimensions;
+    const size_t requiredSize = (
+        sizeof(Parameters)
+        + valueAmount * positionTypeSize_
+        + (size_t)datapointAmount * datapointAmount
+        * (sizeof(DistanceIndexPair) + sizeof(Index))
+    );
+    if (memorySize < requiredSize) {
+        printError("Memory too small");
+        return false;
     }
 
+    // The positions are converted to aligned float32 values
+    std::vector<float> positions(valueAmount);
+    readPositions(data, positionType, valueAmount, positions.data());
+
+    DistanceIndexPair *distanceIndexPairs = (DistanceIndexPair*)(
+        (uint8_t*)data + valueAmount * positionTypeSize_
+    );
+    Index *ranks = (Index*)(
+        distanceIndexPairs + (size_t)datapointAmount * datapointAmount
+    );
+
+    if (!computeNeighbors(
+        distanceMetric, datapointAmount, dimensions, rowStart, rowEnd,
+        positions.data(), distanceIndexPairs, ranks
+    )) {
+        printError("Invalid distance metric");
+        return false;
+    }
     return true;
 }
 
+int processFile(const char *path, size_t rowStart, size_t rowEnd) {
+    size_t fileSize;
+    void *fileMemory;
+    if (!mapFile(path, &fileSize, &fileMemory)) {
+        printError("Failed to map file");
+        return EXIT_FAILURE;
+    }
+
+    bool success = processMemory(fileMemory, fileSize, rowStart, rowEnd);
+
+    if (!unmapFile(fileMemory, fileSize)) {
+        printError("Failed to write back file");
+        return EXIT_FAILURE;
+    }
+    return success ? EXIT_SUCCESS : EXIT_FAILURE;
+}
+
 int main(int argc, char *argv[]) {
+    if (isFileMode(argc, argv)) {
+        const char *path;
+        size_t rowStart, rowEnd;
+        if (!parseFileArguments(argc, argv, &path, &rowStart, &rowEnd)) {
+            printError("Invalid arguments");
+            return EXIT_FAILURE;
+        }
+        return processFile(path, rowStart, rowEnd);
+    }
+
     key_t sharedMemoryKey;
     size_t sharedMemorySize;
     if (!parseArguments(
@@ -123,35 +268,13 @@ int main(int argc, char *argv[]) {
         return EXIT_FAILURE;
     }
 
-    Parameters *parameters = (Parameters*)sharedMemory;
-    DistanceMetric distanceMetric = parameters->distanceMetric;
-    Index datapointAmount = parameters->datapointAmount;
-    DimensionCount dimensions = parameters->dimensions;
-
-    void *originalSharedMemory = sharedMemory;
-    sharedMemory = (void*)(parameters + 1);
-
-    switch (dimensions) {
-        case DIMENSIONS_2:
-            if (!computeNeighbors2D(distanceMetric, datapointAmount, sharedMemory)) {
-                printError("Invalid distance metric");
-                return EXIT_FAILURE;
-            }
-            break;
-        case DIMENSIONS_768:
-            if (!computeNeighbors768D(distanceMetric, datapointAmount, sharedMemory)) {
-                printError("Invalid distance metric");
-                return EXIT_FAILURE;
-            }
-            break;
-        default:
-            printError("Invalid dimensions");
-            return EXIT_FAILURE;
-    }
+    bool success = processMemory(
+        sharedMemory, sharedMemorySize, 0, ALL_ROWS
+    );
 
-    if (!detachSharedMemory(originalSharedMemory)) {
+    if (!detachSharedMemory(sharedMemory)) {
         printError("Failed to detach shared memory");
         return EXIT_FAILURE;
     }
-    return EXIT_SUCCESS;
+    return success ? EXIT_SUCCESS : EXIT_FAILURE;
 }
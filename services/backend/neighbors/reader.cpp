@@ -26,27 +26,15 @@ bool readIndexAndK(Index *index, Index *k, Index datapointAmount) {
     return true;
 }
 
-void printPosition(Position2D *positions2D, Position768D *positions768D, DimensionCount dimensions, Index index) {
-    switch (dimensions) {
-        case DIMENSIONS_2: {
-            Position2D position2D = positions2D[index];
-            std::cout << "(" << position2D.x << ", " << position2D.y << ")" << std::endl;
-            break;
-        }
-
-        case DIMENSIONS_768: {
-            Position768D position768D = positions768D[index];
-            std::cout << "(";
-            for (size_t i = 0; i < DIMENSIONS_768; ++i) {
-                std::cout << position768D.values[i];
-                if (i != DIMENSIONS_768 - 1) {
-                    std::cout << ", ";
-                }
-            }
-            std::cout << ")" << std::endl;
-            break;
+void printPosition(float *positions, DimensionCount dimensions, Index index) {
+    std::cout << "(";
+    for (size_t i = 0; i < dimensions; ++i) {
+        std::cout << positions[(size_t)index * dimensions + i];
+        if (i != (size_t)dimensions - 1) {
+            std::cout << ", ";
         }
     }
+    std::cout << ")" << std::endl;
 }
 
 void printDistances(DistanceIndexPair *distanceIndexPairs, Index datapointAmount, Index index, Index k) {
@@ -108,35 +96,28 @@ int main(int argc, char *argv[]) {
     std::cout << "Distance metric: " << distanceMetric << std::endl;
     std::cout << "Datapoint amount: " << datapointAmount << std::endl;
     std::cout << "Dimensions: " << dimensions << std::endl;
+    std::cout << "Position type: " << parameters.positionType << std::endl;
     std::cout << std::endl;
 
-    Position2D *positions2D = NULL;
-    Position768D *positions768D = NULL;
+    const size_t positionTypeSize_ = positionTypeSize(parameters.positionType);
+    if (positionTypeSize_ == 0) {
+        std::cerr << "Invalid position type" << std::endl;
+        return EXIT_FAILURE;
+    }
 
-    if (dimensions == DIMENSIONS_2) {
-        positions2D = (Position2D*)malloc(sizeof(Position2D) * datapointAmount);
-        if (positions2D == NULL) {
-            std::cerr << "Failed to allocate memory" << std::endl;
-            return EXIT_FAILURE;
-        }
-        if (fread(positions2D, sizeof(Position2D), datapointAmount, file) != datapointAmount) {
-            std::cerr << "Failed to read positions" << std::endl;
-            return EXIT_FAILURE;
-        }
-    } else if (dimensions == DIMENSIONS_768) {
-        positions768D = (Position768D*)malloc(sizeof(Position768D) * datapointAmount);
-        if (positions768D == NULL) {
-            std::cerr << "Failed to allocate memory" << std::endl;
-            return EXIT_FAILURE;
-        }
-        if (fread(positions768D, sizeof(Position768D), datapointAmount, file) != datapointAmount) {
-            std::cerr << "Failed to read positions" << std::endl;
-            return EXIT_FAILURE;
-        }
-    } else {
-        std::cerr << "Invalid dimensions" << std::endl;
+    const size_t valueAmount = (size_t)datapointAmount * dimensions;
+    void *storedPositions = malloc(positionTypeSize_ * valueAmount);
+    float *positions = (float*)malloc(sizeof(float) * valueAmount);
+    if (storedPositions == NULL || positions == NULL) {
+        std::cerr << "Failed to allocate memory" << std::endl;
+        return EXIT_FAILURE;
+    }
+    if (fread(storedPositions, positionTypeSize_, valueAmount, file) != valueAmount) {
+        std::cerr << "Failed to read positions" << std::endl;
         return EXIT_FAILURE;
     }
+    readPositions(storedPositions, parameters.positionType, valueAmount, positions);
+    free(storedPositions);
 
     DistanceIndexPair *distanceIndexPairs = (DistanceIndexPair*)malloc(sizeof(DistanceIndexPair) * datapointAmount * datapointAmount);
     if (distanceIndexPairs == NULL) {
@@ -176,7 +157,7 @@ int main(int argc, char *argv[]) {
 
             case 'p':
                 if (readIndex(&index, datapointAmount)) {
-                    printPosition(positions2D, positions768D, dimensions, index);
+                    printPosition(positions, dimensions, index);
                 }
                 break;
 
@@ -194,8 +175,7 @@ int main(int argc, char *argv[]) {
         }
     }
 
-    free(positions2D);
-    free(positions768D);
+    free(positions);
     free(distanceIndexPairs);
     free(ranks);
     return EXIT_SUCCESS;
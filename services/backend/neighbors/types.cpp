@@ -1,8 +1,53 @@
 #include "types.hpp"
 
+#include <cmath>
+#include <cstring>
+
 int compareDistanceIndexPair(const void *a, const void *b) {
     const DistanceIndexPair *distanceIndexPairA = (const DistanceIndexPair*)a;
     const DistanceIndexPair *distanceIndexPairB = (const DistanceIndexPair*)b;
     const float difference = distanceIndexPairA->distance - distanceIndexPairB->distance;
     return (difference > 0.0f) - (difference < 0.0f);
+}
+
+size_t positionTypeSize(PositionType positionType) {
+    switch (positionType) {
+        case FLOAT32_POSITION_TYPE: return sizeof(float);
+        case FLOAT16_POSITION_TYPE: return sizeof(uint16_t);
+        default: return 0;
+    }
+}
+
+float halfToFloat(uint16_t half) {
+    const float sign = (half & 0x8000) ? -1.0f : 1.0f;
+    const int exponent = (half >> 10) & 0x1f;
+    const int mantissa = half & 0x3ff;
+    if (exponent == 0) return sign * ldexpf((float)mantissa, -24);
+    if (exponent == 0x1f) return mantissa ? NAN : sign * INFINITY;
+    return sign * ldexpf((float)(mantissa | 0x400), exponent - 25);
+}
+
+bool readPositions(
+    const void *source,
+    PositionType positionType,
+    size_t valueAmount,
+    float *positions
+) {
+    switch (positionType) {
+        case FLOAT32_POSITION_TYPE:
+            // The source is not necessarily aligned
+            memcpy(positions, source, valueAmount * sizeof(float));
+            return true;
+        case FLOAT16_POSITION_TYPE: {
+            const uint8_t *bytes = (const uint8_t*)source;
+            for (size_t i = 0; i < valueAmount; ++i) {
+                uint16_t half;
+                memcpy(&half, bytes + i * sizeof(uint16_t), sizeof(uint16_t));
+                positions[i] = halfToFloat(half);
+            }
+            return true;
+        }
+        default:
+            return false;
+    }
 }
\ No newline at end of file
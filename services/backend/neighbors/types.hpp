@@ -1,22 +1,28 @@
 #ifndef __TYPES_HPP__
 #define __TYPES_HPP__
 
+#include <cstddef>
 #include <cstdint>
 
 #define DIMENSIONS_2 (2)
-#define DIMENSIONS_768 (768)
 
 #define EUCLIDEAN_DISTANCE_METRIC ('e')
 #define COSINE_DISTANCE_METRIC ('c')
 
+// Same as the numpy type characters
+#define FLOAT32_POSITION_TYPE ('f')
+#define FLOAT16_POSITION_TYPE ('e')
+
 typedef int8_t DistanceMetric;
 typedef uint16_t Index;
 typedef uint16_t DimensionCount;
+typedef int8_t PositionType;
 
 typedef struct __attribute__((packed)) {
     DistanceMetric distanceMetric;
     Index datapointAmount;
     DimensionCount dimensions;
+    PositionType positionType;
 } Parameters;
 
 typedef struct __attribute__((packed)) {
@@ -24,10 +30,6 @@ typedef struct __attribute__((packed)) {
     float y;
 } Position2D;
 
-typedef struct __attribute__((packed)) {
-    float values[DIMENSIONS_768];
-} Position768D;
-
 typedef struct __attribute__((packed)) {
     Index index;
     float distance;
@@ -35,4 +37,12 @@ typedef struct __attribute__((packed)) {
 
 int compareDistanceIndexPair(const void *a, const void *b);
 
+size_t positionTypeSize(PositionType positionType);
+bool readPositions(
+    const void *source,
+    PositionType positionType,
+    size_t valueAmount,
+    float *positions
+);
+
 #endif // __TYPES_HPP__
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import time
+import threading
+import traceback
+import numpy as np
+from typing import Any, Dict, List
+
+from dataset import Dataset
+from idr import InverseDimensionaltyReduction
+
+
+class Preloader:
+    """
+    Warms the resources of the backend in a background thread so that the
+    first users do not pay for them: it loads datasets and their
+    embeddings, prefetches the neighbor files into the page cache and
+    loads and runs the iDR models once.
+    """
+
+    PENDING: str = "pending"
+    RUNNING: str = "running"
+    DONE: str = "done"
+
+    WARMUP_LANDMARK_AMOUNT: int = 10
+    WARMUP_RUNS: int = 3
+
+    _lock: threading.Lock
+    _status: str
+    _dataset_names: List[str]
+    _models: bool
+    _resources: Dict[str, Dict[str, Any]]
+    _errors: Dict[str, str]
+
+    @staticmethod
+    def parse_dataset_names(value: str) -> List[str]:
+        """
+        Parses a comma separated list of dataset names, "all" selects all
+        datasets.
+        """
+        if value.strip() == "all":
+            return list(Dataset.VALID_NAMES)
+        names = [name.strip() for name in value.split(",") if name.strip()]
+        for name in names:
+            if name not in Dataset.VALID_NAMES:
+                raise ValueError(f"Invalid dataset name: {name}")
+        return names
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = self.PENDING
+        self._dataset_names = []
+        self._models = False
+        self._resources = {}
+        self._errors = {}
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether all configured resources are warm. Nothing is configured
+        before `start` is called, so a server without a preload phase is
+        always ready.
+        """
+        with self._lock:
+            if self._status == self.PENDING:
+                return True
+            return self._status == self.DONE and not self._errors
+
+    def start(self, dataset_names: List[str], models: bool):
+        """
+        Starts the preload phase in a background thread.
+
+        :param dataset_names: The datasets to load.
+        :param models: Whether to load and warm the iDR models.
+        """
+        with self._lock:
+            if self._status != self.PENDING:
+                raise RuntimeError("The preload phase was already started!")
+            self._dataset_names = list(dataset_names)
+            self._models = models
+            self._status = self.RUNNING
+        threading.Thread(
+            target=self.run, name="preloader", daemon=True
+        ).start()
+
+    def run(self):
+        for name in self._dataset_names:
+            self._warm(f"dataset:{name}", self._warm_dataset, name)
+        if self._models:
+            self._warm("models", self._warm_models)
+        with self._lock:
+            self._status = self.DONE
+
+    def _warm(self, resource: str, func, *args):
+        start = time.perf_counter()
+        try:
+            details = func(*args)
+        except Exception as error:
+            traceback.print_exc()
+            with self._lock:
+                self._errors[resource] = str(error)
+            return
+        duration = time.perf_counter() - start
+        with self._lock:
+            self._resources[resource] = details | {"duration": duration}
+        print(f"Warmed {resource} in {duration:.2f}s")
+
+    def _warm_dataset(self, name: str) -> Dict[str, Any]:
+        dataset = Dataset.get(name)
+        embeddings = dataset.embeddings
+        prefetched = [
+            dataset.neighbors(distance_metric).prefetch()
+            for distance_metric in ("cosine", "euclidean")
+        ]
+        # Instances import their distance functions lazily
+        import sklearn.metrics.pairwise  # noqa: F401
+        return {
+            "datapoints": len(dataset),
+            "embeddings_size": embeddings.nbytes,
+            "neighbors_prefetched": all(prefetched)
+        }
+
+    def _warm_models(self) -> Dict[str, Any]:
+        models = InverseDimensionaltyReduction.preload_models()
+        amount = self.WARMUP_LANDMARK_AMOUNT
+        distance_matrix = np.ones((amount, amount)) - np.eye(amount)
+        # Compiled graphs are optimized during their first runs
+        for model in models:
+            for _ in range(self.WARMUP_RUNS):
+                model.predictor.inference(distance_matrix)
+        return {"models": [model.to_json() for model in models]}
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self._status,
+                "datasets": list(self._dataset_names),
+                "models": self._models,
+                "resources": dict(self._resources),
+                "errors": dict(self._errors)
+            }
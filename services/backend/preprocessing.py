@@ -0,0 +1,81 @@
+import numpy as np
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+# Inference time preprocessing of the iDR networks. This module must not
+# depend on torch or the training libraries.
+
+
+def upper_triangle_size(max_landmarks: int) -> int:
+    return max_landmarks * (max_landmarks - 1) // 2
+
+
+@lru_cache(maxsize=None)
+def triangle_indices(
+    max_landmarks: int, num_landmarks: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the upper triangle indices of a (num_landmarks, num_landmarks)
+    matrix together with their positions in the upper triangle vector of a
+    padded (max_landmarks, max_landmarks) matrix.
+
+    :param max_landmarks: The size of the padded matrix.
+    :param num_landmarks: The size of the unpadded matrix.
+
+    :return: The rows, columns and vector positions. The arrays are cached
+        and must not be modified.
+    """
+    rows, columns = np.triu_indices(num_landmarks, k=1)
+    positions = (
+        rows * max_landmarks - rows * (rows + 1) // 2 + columns - rows - 1
+    )
+    for array in (rows, columns, positions):
+        array.flags.writeable = False
+    return rows, columns, positions
+
+
+def pad_upper_triangles(
+    distance_matrices: Sequence[np.ndarray], max_landmarks: int
+) -> np.ndarray:
+    """
+    Pads the distance matrices with -1 to (max_landmarks, max_landmarks)
+    and takes their upper triangles.
+
+    :param distance_matrices: Square distance matrices, possibly with
+        different amounts of landmarks.
+    :param max_landmarks: The amount of landmarks to pad to.
+
+    :return: A (len(distance_matrices), upper triangle size) float32 array.
+    """
+    upper_triangles = np.full(
+        (len(distance_matrices), upper_triangle_size(max_landmarks)),
+        -1, dtype=np.float32
+    )
+    for row, distance_matrix in enumerate(distance_matrices):
+        distance_matrix = np.asarray(distance_matrix)
+        num_landmarks = distance_matrix.shape[0]
+        if num_landmarks > max_landmarks:
+            raise ValueError(
+                f"The model supports at most {max_landmarks} "
+                f"landmarks, got {num_landmarks}!"
+            )
+        rows, columns, positions = triangle_indices(
+            max_landmarks, num_landmarks
+        )
+        upper_triangles[row, positions] = distance_matrix[rows, columns]
+    return upper_triangles
+
+
+def unpad_upper_triangle(
+    upper_triangle: np.ndarray, num_landmarks: int, max_landmarks: int
+) -> np.ndarray:
+    """
+    Builds the symmetric (num_landmarks, num_landmarks) distance matrix
+    from a padded upper triangle, dropping the padding.
+    """
+    rows, columns, positions = triangle_indices(max_landmarks, num_landmarks)
+    values = np.asarray(upper_triangle)[positions]
+    square = np.zeros((num_landmarks, num_landmarks))
+    square[rows, columns] = values
+    square[columns, rows] = values
+    return square
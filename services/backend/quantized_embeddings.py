@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class QuantizedEmbeddings:
+    """
+    An int8 copy of an embedding matrix with one float32 scale per row.
+    Every row is divided by its scale, which maps its largest absolute
+    value to 127, and rounded. The codes take a quarter of the memory of
+    float32 embeddings, so distances to a few landmarks are bound by the
+    codes that have to be read instead of the float32 embeddings.
+    """
+
+    CODE_DTYPE: type = np.int8
+    FLOAT_DTYPE: type = np.float32
+    MAX_CODE: int = 127
+    # Rows per block, the float32 copy of a block stays in the cache
+    BLOCK_SIZE: int = 4096
+
+    _codes: np.ndarray
+    _scales: np.ndarray
+    _squared_norms: np.ndarray
+
+    def __init__(self, embeddings: np.ndarray):
+        """
+        :param embeddings: The (N, D) embeddings to quantize.
+        """
+        datapoint_amount, dimensions = embeddings.shape
+        self._codes = np.empty(
+            (datapoint_amount, dimensions), dtype=self.CODE_DTYPE
+        )
+        self._scales = np.empty(datapoint_amount, dtype=self.FLOAT_DTYPE)
+        self._squared_norms = np.empty(
+            datapoint_amount, dtype=self.FLOAT_DTYPE
+        )
+        for start in range(0, datapoint_amount, self.BLOCK_SIZE):
+            block = slice(start, start + self.BLOCK_SIZE)
+            rows = np.asarray(embeddings[block], dtype=self.FLOAT_DTYPE)
+            scales = np.abs(rows).max(axis=1) / self.MAX_CODE
+            scales[scales == 0] = 1
+            self._codes[block] = np.rint(rows / scales[:, np.newaxis])
+            self._scales[block] = scales
+            # The norms of the dequantized rows keep the distances of a
+            # row to itself at zero
+            dequantized = self.dequantize(block)
+            self._squared_norms[block] = np.einsum(
+                "nd,nd->n", dequantized, dequantized
+            )
+        self._codes.flags.writeable = False
+        self._scales.flags.writeable = False
+
+    @property
+    def datapoint_amount(self) -> int:
+        return len(self._codes)
+
+    @property
+    def dimensions(self) -> int:
+        return self._codes.shape[1]
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._scales
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._codes.nbytes + self._scales.nbytes
+            + self._squared_norms.nbytes
+        )
+
+    def dequantize(self, rows: slice | np.ndarray = slice(None)) -> np.ndarray:
+        """
+        Returns the float32 approximation of the given rows.
+        """
+        return (
+            self._codes[rows].astype(self.FLOAT_DTYPE)
+            * self._scales[rows, np.newaxis]
+        )
+
+    def landmark_distances(
+        self, landmarks: np.ndarray, distance_metric: str
+    ) -> np.ndarray:
+        """
+        Returns the distances of all datapoints to the landmarks.
+
+        :param landmarks: The (L, D) unquantized landmark embeddings.
+        :param distance_metric: "euclidean" or "cosine".
+
+        :return: The (N, L) float32 distances.
+        """
+        if distance_metric not in ("euclidean", "cosine"):
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+        landmarks = np.asarray(landmarks, dtype=self.FLOAT_DTYPE)
+        landmark_squared_norms = np.einsum("ld,ld->l", landmarks, landmarks)
+        distances = np.empty(
+            (self.datapoint_amount, len(landmarks)), dtype=self.FLOAT_DTYPE
+        )
+        for start in range(0, self.datapoint_amount, self.BLOCK_SIZE):
+            block = slice(start, start + self.BLOCK_SIZE)
+            # The scales are applied to the small (rows, L) products
+            # instead of the (rows, D) codes
+            dots = (
+                self._codes[block].astype(self.FLOAT_DTYPE) @ landmarks.T
+            ) * self._scales[block, np.newaxis]
+            squared_norms = self._squared_norms[block, np.newaxis]
+            if distance_metric == "euclidean":
+                distances[block] = np.sqrt(np.maximum(
+                    squared_norms + landmark_squared_norms - 2 * dots, 0
+                ))
+            else:
+                distances[block] = 1 - dots / np.maximum(
+                    np.sqrt(squared_norms * landmark_squared_norms),
+                    np.finfo(self.FLOAT_DTYPE).tiny
+                )
+        return distances
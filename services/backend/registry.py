@@ -0,0 +1,455 @@
+import sys
+import time
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from dr import DimensionalityReduction, StaleSnapshot
+from snapshots import SnapshotStore
+
+
+class ReadWriteLock:
+    """
+    A lock that allows many concurrent readers or one writer. Waiting
+    writers block new readers so that writers do not starve.
+    """
+
+    _condition: threading.Condition
+    _readers: int
+    _writer: bool
+    _waiting_writers: int
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers > 0:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers > 0:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def try_acquire_write(self) -> bool:
+        """
+        Acquires the write lock only if nobody holds or waits for the lock.
+        """
+        with self._condition:
+            if self._writer or self._readers > 0 or self._waiting_writers:
+                return False
+            self._writer = True
+            return True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class InstanceEntry:
+    __slots__ = (
+        "instance", "lock", "last_access", "evicted", "dirty", "nbytes",
+        "loaded"
+    )
+
+    instance: DimensionalityReduction | None
+    lock: ReadWriteLock
+    last_access: float
+    evicted: bool
+    dirty: bool
+    nbytes: int
+    loaded: threading.Event
+
+    def __init__(
+        self, instance: DimensionalityReduction | None, dirty: bool
+    ):
+        """
+        :param instance: The instance or None for a placeholder of an
+            instance that is being restored.
+        :param dirty: Whether the instance differs from its snapshot.
+        """
+        self.instance = instance
+        self.lock = ReadWriteLock()
+        self.last_access = time.monotonic()
+        self.evicted = False
+        self.dirty = dirty
+        # Only updated with the write lock held, so the memory budget can
+        # be checked without locking the instances
+        self.nbytes = 0 if instance is None else instance.nbytes
+        self.loaded = threading.Event()
+        if instance is not None:
+            self.loaded.set()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded.is_set()
+
+
+class InstanceRegistry:
+    """
+    Holds all instances of the server. The registry itself is guarded by a
+    lock and every instance comes with its own read/write lock. Reading
+    routes hold the read lock of an instance, routes that change or compute
+    anything on it hold the write lock.
+
+    The registry keeps at most `max_instances` instances using at most
+    `max_memory` bytes in memory. Instances that were idle for longer than
+    `ttl` seconds or that were used least recently beyond the budget are
+    spilled to the snapshot store. They are restored transparently on the
+    next access.
+
+    The snapshot store is the persistent copy of all instances. Changed
+    instances are written back on every sweep and on `flush`, so instances
+    of a previous process are picked up lazily after a restart. Snapshots
+    are only read and written without the registry lock, with the write
+    lock of the instance held, so disk I/O never blocks the other
+    instances.
+    """
+
+    DEFAULT_MAX_INSTANCES: int = 32
+    DEFAULT_MAX_MEMORY: int = 2 ** 30
+    DEFAULT_TTL: float = 60.0 * 60.0
+    DEFAULT_SWEEP_INTERVAL: float = 10.0
+
+    _lock: threading.Lock
+    _entries: "OrderedDict[str, InstanceEntry]"
+    _store: SnapshotStore | None
+    _max_instances: int
+    _max_memory: int
+    _ttl: float
+
+    def __init__(
+        self,
+        store: SnapshotStore | None = None,
+        max_instances: int = DEFAULT_MAX_INSTANCES,
+        max_memory: int = DEFAULT_MAX_MEMORY,
+        ttl: float = DEFAULT_TTL
+    ):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._store = store
+        self._max_instances = max_instances
+        self._max_memory = max_memory
+        self._ttl = ttl
+
+    def __contains__(self, instance_id: str) -> bool:
+        with self._lock:
+            return self._contains(instance_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _contains(self, instance_id: str) -> bool:
+        return instance_id in self._entries or (
+            self._store is not None and instance_id in self._store
+        )
+
+    def add(self, instance_id: str, instance: DimensionalityReduction):
+        with self._lock:
+            if self._contains(instance_id):
+                raise KeyError(f"Instance already exists: {instance_id}")
+            self._entries[instance_id] = InstanceEntry(instance, dirty=True)
+            victims = self._select_victims(keep=instance_id)
+        self._spill_all(victims)
+
+    def _get_entry(self, instance_id: str) -> InstanceEntry | None:
+        while True:
+            with self._lock:
+                entry = self._entries.get(instance_id)
+                if entry is not None:
+                    entry.last_access = time.monotonic()
+                    self._entries.move_to_end(instance_id)
+                    if entry.is_loaded:
+                        return entry
+                elif self._store is None or instance_id not in self._store:
+                    return None
+                else:
+                    # A placeholder makes concurrent accesses wait for
+                    # this restore instead of restoring again
+                    entry = InstanceEntry(None, dirty=False)
+                    self._entries[instance_id] = entry
+                    break
+            # Another thread restores the instance
+            entry.loaded.wait()
+
+        try:
+            instance = self._store.load(instance_id)
+        except BaseException as error:
+            with self._lock:
+                if self._entries.get(instance_id) is entry:
+                    del self._entries[instance_id]
+                # Instances of an old version of their dataset can not be
+                # restored anymore
+                if isinstance(error, StaleSnapshot):
+                    print(
+                        f"Dropping {instance_id}: {error}", file=sys.stderr
+                    )
+                    self._store.delete(instance_id)
+            entry.loaded.set()
+            if isinstance(error, StaleSnapshot):
+                return None
+            raise
+        with self._lock:
+            entry.instance = instance
+            entry.nbytes = instance.nbytes
+            entry.loaded.set()
+            if self._entries.get(instance_id) is not entry:
+                # Removed while it was restored
+                return None
+            victims = self._select_victims(keep=instance_id)
+        self._spill_all(victims)
+        return entry
+
+    @contextmanager
+    def reading(
+        self, instance_id: str
+    ) -> Iterator[DimensionalityReduction | None]:
+        """
+        Yields the instance with its read lock held or None if there is no
+        such instance. Spilled instances are restored first.
+        """
+        while True:
+            entry = self._get_entry(instance_id)
+            if entry is None:
+                yield None
+                return
+            entry.lock.acquire_read()
+            if not entry.evicted:
+                break
+            entry.lock.release_read()
+        try:
+            yield entry.instance
+        finally:
+            entry.lock.release_read()
+
+    @contextmanager
+    def writing(
+        self, instance_id: str
+    ) -> Iterator[DimensionalityReduction | None]:
+        """
+        Yields the instance with its write lock held or None if there is no
+        such instance. Spilled instances are restored first. The instance
+        is only written back if its version changed.
+        """
+        while True:
+            entry = self._get_entry(instance_id)
+            if entry is None:
+                yield None
+                return
+            entry.lock.acquire_write()
+            if not entry.evicted:
+                break
+            entry.lock.release_write()
+        version = entry.instance.version
+        try:
+            yield entry.instance
+        finally:
+            if entry.instance.version != version:
+                entry.dirty = True
+            entry.nbytes = entry.instance.nbytes
+            entry.lock.release_write()
+
+    def remove(self, instance_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(instance_id, None)
+            if entry is not None:
+                entry.evicted = True
+            stored = self._store is not None and instance_id in self._store
+            if stored:
+                self._store.delete(instance_id)
+            return entry is not None or stored
+
+    def items(self) -> List[Tuple[str, InstanceEntry]]:
+        """
+        Returns a snapshot of all (instance id, entry) pairs that are
+        currently held in memory.
+        """
+        with self._lock:
+            return [
+                (instance_id, entry)
+                for instance_id, entry in self._entries.items()
+                if entry.is_loaded
+            ]
+
+    def spilled_ids(self) -> List[str]:
+        if self._store is None:
+            return []
+        with self._lock:
+            return [
+                instance_id for instance_id in self._store.ids()
+                if instance_id not in self._entries
+                or not self._entries[instance_id].is_loaded
+            ]
+
+    def describe_spilled(self, instance_id: str) -> Optional[dict]:
+        """
+        Returns the description of a spilled instance, or None if it was
+        deleted or restored since `spilled_ids` or can not be restored.
+        """
+        try:
+            return self._store.describe(instance_id)
+        except (FileNotFoundError, StaleSnapshot):
+            return None
+
+    @property
+    def memory(self) -> int:
+        with self._lock:
+            return self._memory()
+
+    def _memory(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def sweep(self):
+        """
+        Writes back changed instances, spills idle instances and enforces
+        the memory and instance budget.
+        """
+        self._write_back()
+        with self._lock:
+            victims = self._select_victims()
+        self._spill_all(victims)
+
+    def flush(self):
+        """
+        Writes back all changed instances, waiting for instances in use.
+        """
+        self._write_back(wait=True)
+
+    def _write_back(self, wait: bool = False):
+        if self._store is None:
+            return
+        with self._lock:
+            dirty_entries = [
+                (instance_id, entry)
+                for instance_id, entry in self._entries.items()
+                if entry.is_loaded and entry.dirty
+            ]
+        for instance_id, entry in dirty_entries:
+            if wait:
+                entry.lock.acquire_write()
+            elif not entry.lock.try_acquire_write():
+                continue
+            try:
+                if entry.dirty and not entry.evicted:
+                    self._save(instance_id, entry)
+            except Exception:
+                # The instance stays dirty and is saved on the next try
+                print(f"Writing back {instance_id} failed:", file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                entry.lock.release_write()
+
+    def _save(self, instance_id: str, entry: InstanceEntry):
+        """
+        Saves the instance, the caller holds its write lock and not the
+        registry lock.
+        """
+        if entry.instance.landmarks_reduced:
+            self._store.save(instance_id, entry.instance)
+        entry.dirty = False
+        with self._lock:
+            # Removed during the save, which must not bring it back
+            if entry.evicted:
+                self._store.delete(instance_id)
+
+    def start_sweeper(self, interval: float = DEFAULT_SWEEP_INTERVAL):
+        def sweep_forever():
+            while True:
+                time.sleep(interval)
+                # A failed sweep, e.g. of a full disk, must not end the
+                # sweeper, the next one tries again
+                try:
+                    self.sweep()
+                except Exception:
+                    print("Instance sweep failed:", file=sys.stderr)
+                    traceback.print_exc()
+
+        threading.Thread(
+            target=sweep_forever, name="instance-sweeper", daemon=True
+        ).start()
+
+    def _select_victims(
+        self, keep: str | None = None
+    ) -> List[Tuple[str, InstanceEntry]]:
+        """
+        Selects the instances to spill, the caller holds the registry lock.
+        The write locks of the returned instances are held, instances that
+        are in use are skipped, they will be idle at one of the next
+        sweeps.
+        """
+        if self._store is None:
+            return []
+        now = time.monotonic()
+        amount = len(self._entries)
+        memory = self._memory()
+        victims = []
+        # Entries are ordered from least to most recently used
+        for instance_id, entry in self._entries.items():
+            if instance_id == keep or not entry.is_loaded:
+                continue
+            if (
+                now - entry.last_access <= self._ttl
+                and amount <= self._max_instances
+                and memory <= self._max_memory
+            ):
+                continue
+            if not entry.lock.try_acquire_write():
+                continue
+            victims.append((instance_id, entry))
+            amount -= 1
+            memory -= entry.nbytes
+        return victims
+
+    def _spill_all(self, victims: List[Tuple[str, InstanceEntry]]):
+        """
+        Saves the changed victims of `_select_victims` and removes them
+        from memory, without the registry lock. A victim that could not be
+        saved stays in memory.
+        """
+        for instance_id, entry in victims:
+            try:
+                if entry.dirty:
+                    self._save(instance_id, entry)
+                with self._lock:
+                    if self._entries.get(instance_id) is entry:
+                        del self._entries[instance_id]
+                    entry.evicted = True
+            except Exception:
+                print(f"Spilling {instance_id} failed:", file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                entry.lock.release_write()
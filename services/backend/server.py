@@ -2,40 +2,110 @@ from flask import Flask, request
 from flask_cors import CORS
 from dr import DimensionalityReduction
 from dataset import Dataset
+from compute_dtype import COMPUTE_DTYPES, DEFAULT_COMPUTE_DTYPE
+from shard_workers import ShardCoordinator
 from idr import InverseDimensionaltyReduction
+from jobs import JobManager, ProgressCallback
+from models import ModelRegistry
+from preload import Preloader
+from registry import InstanceRegistry
+from snapshots import SnapshotStore
 from typing import Dict, List, Any
 import human_readable_ids
-import pandas as pd
+import numpy as np
+import argparse
+import atexit
+import signal
+import sys
+import os
 
 
 DEFAULT_K: int = 7
 DEFAULT_NUM_LANDMARKS: int = 10
 DEFAULT_SEED: int = 42
+JOB_KINDS: List[str] = ["datapoints", "metrics"]
+
+DEFAULT_HOST: str = '0.0.0.0'
+DEFAULT_PORT: int = 5000
+DEFAULT_THREADS: int = 8
+
+
+def env_flag(name: str) -> bool:
+    """
+    Whether the environment variable is set to 1, true or yes.
+    """
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
 
 app = Flask(__name__)
 CORS(app)
 
 
-instances: Dict[str, DimensionalityReduction] = {}
+instances: InstanceRegistry = InstanceRegistry(
+    store=SnapshotStore.default(),
+    max_instances=int(os.environ.get(
+        'MAX_INSTANCES', InstanceRegistry.DEFAULT_MAX_INSTANCES
+    )),
+    max_memory=int(os.environ.get(
+        'MAX_INSTANCE_MEMORY', InstanceRegistry.DEFAULT_MAX_MEMORY
+    )),
+    ttl=float(os.environ.get('INSTANCE_TTL', InstanceRegistry.DEFAULT_TTL))
+)
+instances.start_sweeper(float(os.environ.get(
+    'SWEEP_INTERVAL', InstanceRegistry.DEFAULT_SWEEP_INTERVAL
+)))
+atexit.register(instances.flush)
+jobs: JobManager = JobManager()
+preloader: Preloader = Preloader()
+
+
+def shards_for(
+    instance: DimensionalityReduction
+) -> ShardCoordinator | None:
+    """
+    Returns the shard workers of SHARD_WORKER_URLS if they serve the
+    dataset of the instance.
+    """
+    shards = ShardCoordinator.shared()
+    if shards is None or not shards.covers(instance.dataset):
+        return None
+    return shards
 
 
-def dataframe_to_json(dataframe: pd.DataFrame) -> List[Dict[str, Any]]:
+def datapoints_to_json(
+    instance: DimensionalityReduction, indices: np.ndarray
+) -> List[Dict[str, Any]]:
+    dataframe = instance.dataset.dataframe
+    state = instance.state
+    ids = dataframe.index.to_numpy()[indices].tolist()
+    texts = dataframe["text"].to_numpy()[indices].tolist()
+    labels = dataframe["label"].to_numpy()[indices].tolist()
+    is_landmark = state.landmark_mask[indices].tolist()
+    positions = (
+        state.positions[indices].tolist()
+        if instance.landmarks_reduced
+        else [None] * len(indices)
+    )
     return [
         {
-            "id": int(index),
-            "text": series["text"],
-            "label": str(series["label"]),
-            "is_landmark": series["landmark"],
-            "position": (
-                series["position"]
-                if "position" in dataframe.columns
-                else None
-            )
+            "id": int(id),
+            "text": text,
+            "label": str(label),
+            "is_landmark": landmark,
+            "position": position
         }
-        for index, series in dataframe.iterrows()
+        for id, text, label, landmark, position in zip(
+            ids, texts, labels, is_landmark, positions
+        )
     ]
 
 
+def landmarks_to_json(
+    instance: DimensionalityReduction
+) -> List[Dict[str, Any]]:
+    return datapoints_to_json(instance, instance.state.landmark_indices)
+
+
 @app.route('/', methods=['GET'])
 def route_index():
     return {"message": "Hello, this is the backend!"}, 200
@@ -52,20 +122,47 @@ def route_constants():
         'max_landmark_amount': (
             DimensionalityReduction.LANDMARK_AMOUNT_RANGE[1]
         ),
+        'max_extended_landmark_amount': (
+            DimensionalityReduction.EXTENDED_LANDMARK_AMOUNT_RANGE[1]
+        ),
         'idr_algorithms': InverseDimensionaltyReduction.VALID_NAMES,
-        'dataset_names': Dataset.VALID_NAMES
+        'landmark_distance_precisions': (
+            DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS
+        ),
+        'dataset_names': Dataset.VALID_NAMES,
+        'compute_dtypes': list(COMPUTE_DTYPES)
     }, 200
 
 
+@app.route('/ready', methods=['GET'])
+def route_ready():
+    ready = preloader.ready
+    return {
+        'ready': ready,
+        'preload': preloader.to_json(),
+        'datasets': Dataset.loaded_names(),
+        'models': ModelRegistry.to_json()
+    }, 200 if ready else 503
+
+
+@app.route('/models', methods=['GET'])
+def route_models():
+    return {'models': ModelRegistry.to_json()}, 200
+
+
 @app.route('/instances', methods=['GET', 'POST'])
 def route_instances():
     if request.method == 'GET':
-        return {
-            'instances': [
-                instance.to_json() | {'id': id}
-                for id, instance in instances.items()
-            ]
-        }
+        instance_jsons = []
+        for id, entry in instances.items():
+            with entry.lock.read_locked():
+                instance_jsons.append(entry.instance.to_json() | {'id': id})
+        for id in instances.spilled_ids():
+            description = instances.describe_spilled(id)
+            # Skips instances deleted or restored since listing the ids
+            if description is not None:
+                instance_jsons.append(description | {'id': id})
+        return {'instances': instance_jsons}
 
     elif request.method == 'POST':
         heuristic = request.json.get(
@@ -79,87 +176,299 @@ def route_instances():
         )
         seed = request.json.get('seed', DEFAULT_SEED)
         dataset_name = request.json.get('dataset_name', Dataset.VALID_NAMES[0])
-        instance_ids = (
-            human_readable_ids.get_new_id().lower().replace(" ", "-")
+        compute_dtype = request.json.get(
+            'compute_dtype', DEFAULT_COMPUTE_DTYPE
+        )
+        if compute_dtype not in COMPUTE_DTYPES:
+            return {"message": f"Unknown compute dtype: {compute_dtype}"}, 400
+        min_amount, max_amount = (
+            DimensionalityReduction.EXTENDED_LANDMARK_AMOUNT_RANGE
         )
+        if not min_amount <= num_landmarks <= max_amount:
+            return {
+                "message": f"Invalid number of landmarks: {num_landmarks}"
+            }, 400
         instance = DimensionalityReduction(
             heuristic=heuristic,
             distance_metric=distance_metric,
             num_landmarks=num_landmarks,
-            dataset=Dataset(dataset_name)
+            dataset=Dataset.get(dataset_name),
+            compute_dtype_name=compute_dtype
         )
-        instances[instance_ids] = instance
         instance.select_landmarks(seed=seed)
         instance.reduce_landmarks()
-        return {'instance': instance.to_json() | {'id': instance_ids}}, 201
+        while True:
+            instance_id = (
+                human_readable_ids.get_new_id().lower().replace(" ", "-")
+            )
+            try:
+                instances.add(instance_id, instance)
+                break
+            except KeyError:
+                continue
+        return {'instance': instance.to_json() | {'id': instance_id}}, 201
 
 
 @app.route('/instances/<instance_id>', methods=['GET', 'DELETE'])
 def route_instance_id(instance_id: str):
     if request.method == 'GET':
-        instance = instances.get(instance_id)
-        if instance is None:
-            return {"message": f"Unknown instance: {instance_id}"}, 404
-        return {'instance': instance.to_json() | {'id': instance_id}}, 200
+        with instances.reading(instance_id) as instance:
+            if instance is None:
+                return {"message": f"Unknown instance: {instance_id}"}, 404
+            return {'instance': instance.to_json() | {'id': instance_id}}, 200
 
     elif request.method == 'DELETE':
-        if instance_id not in instances:
+        if not instances.remove(instance_id):
             return {"message": f"Unknown instance: {instance_id}"}, 404
-        del instances[instance_id]
+        jobs.cancel_instance(instance_id)
         return {}, 200
 
 
 @app.route('/instances/<instance_id>/landmarks', methods=['GET', 'PATCH'])
 def route_landmarks(instance_id: str):
-    instance = instances.get(instance_id)
-    if instance is None:
-        return {"message": f"Unknown instance: {instance_id}"}, 404
-
     if request.method == 'GET':
-        return {'landmarks': dataframe_to_json(instance.landmarks)}, 200
+        with instances.reading(instance_id) as instance:
+            if instance is None:
+                return {"message": f"Unknown instance: {instance_id}"}, 404
+            return {'landmarks': landmarks_to_json(instance)}, 200
 
     elif request.method == 'PATCH':
-        new_landmarks = pd.DataFrame(request.json['landmarks']).set_index('id')
-        landmarks = instance.landmarks
-        landmarks.update(new_landmarks[['position', 'label']])
-        instance.landmarks = landmarks
+        positions = {
+            int(landmark['id']): landmark['position']
+            for landmark in request.json['landmarks']
+        }
+        with instances.writing(instance_id) as instance:
+            if instance is None:
+                return {"message": f"Unknown instance: {instance_id}"}, 404
+            try:
+                instance.move_landmarks(positions)
+            except ValueError as error:
+                return {"message": str(error)}, 400
         return {}, 200
 
 
-@app.route('/instances/<instance_id>/datapoints', methods=['GET'])
-def route_datapoints(instance_id: str):
-    instance = instances.get(instance_id)
-    if instance is None:
-        return {"message": f"Unknown instance: {instance_id}"}, 404
+@app.route('/instances/<instance_id>/history', methods=['GET'])
+def route_history(instance_id: str):
+    with instances.reading(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
+        return {'history': instance.history.to_json()}, 200
+
+
+@app.route('/instances/<instance_id>/undo', methods=['POST'])
+def route_undo(instance_id: str):
+    with instances.writing(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
 
-    if not instance.landmarks_reduced:
-        return {"message": "Landmarks have not been reduced yet"}, 400
+        if not instance.history.can_undo:
+            return {"message": "Nothing to undo"}, 400
 
+        instance.undo()
+        return {
+            'landmarks': landmarks_to_json(instance),
+            'history': instance.history.to_json()
+        }, 200
+
+
+@app.route('/instances/<instance_id>/redo', methods=['POST'])
+def route_redo(instance_id: str):
+    with instances.writing(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
+
+        if not instance.history.can_redo:
+            return {"message": "Nothing to redo"}, 400
+
+        instance.redo()
+        return {
+            'landmarks': landmarks_to_json(instance),
+            'history': instance.history.to_json()
+        }, 200
+
+
+@app.route('/instances/<instance_id>/datapoints', methods=['GET'])
+def route_datapoints(instance_id: str):
     idr_algorithm = request.args.get(
         'idr_algorithm', InverseDimensionaltyReduction.VALID_NAMES[0]
     )
-    instance.calculate(idr_algorithm)
-    return {
-        'datapoints': dataframe_to_json(instance.all_points),
-        'instance': instance.to_json() | {'id': instance_id}
-    }, 200
+    precision = request.args.get(
+        'precision', DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS[0]
+    )
+    if precision not in DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS:
+        return {"message": f"Unknown precision: {precision}"}, 400
+    with instances.writing(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
+
+        if not instance.landmarks_reduced:
+            return {"message": "Landmarks have not been reduced yet"}, 400
+
+        if instance.num_landmarks > (
+            DimensionalityReduction.max_landmark_amount(idr_algorithm)
+        ):
+            return {
+                "message": f"Too many landmarks for {idr_algorithm}"
+            }, 400
+
+        instance.calculate(
+            idr_algorithm, precision=precision, shards=shards_for(instance)
+        )
+        return {
+            'datapoints': datapoints_to_json(
+                instance, instance.state.ordered_indices
+            ),
+            'instance': instance.to_json() | {'id': instance_id}
+        }, 200
 
 
 @app.route('/instances/<instance_id>/metrics', methods=['GET'])
 def route_instance_metrics(instance_id: str):
-    instance = instances.get(instance_id)
-    if instance is None:
-        return {"message": f"Unknown instance: {instance_id}"}, 404
+    k = request.args.get('k', DEFAULT_K, int)
+    with instances.writing(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
 
-    if not instance.landmarks_reduced:
-        return {"message": "Landmarks have not been reduced yet"}, 400
+        if not instance.landmarks_reduced:
+            return {"message": "Landmarks have not been reduced yet"}, 400
+
+        if not 1 <= k <= instance.max_metrics_k:
+            return {"message": f"Invalid k: {k}"}, 400
+
+        return {
+            'metrics': instance.compute_metrics(
+                k, shards=shards_for(instance)
+            ),
+            'instance': instance.to_json() | {'id': instance_id}
+        }, 200
+
+
+@app.route('/instances/<instance_id>/jobs', methods=['POST'])
+def route_instance_jobs(instance_id: str):
+    with instances.reading(instance_id) as instance:
+        if instance is None:
+            return {"message": f"Unknown instance: {instance_id}"}, 404
+
+        if not instance.landmarks_reduced:
+            return {"message": "Landmarks have not been reduced yet"}, 400
+        num_landmarks = instance.num_landmarks
+        max_metrics_k = instance.max_metrics_k
+
+    kind = request.json.get('kind', JOB_KINDS[0])
+    if kind == 'datapoints':
+        idr_algorithm = request.json.get(
+            'idr_algorithm', InverseDimensionaltyReduction.VALID_NAMES[0]
+        )
+        precision = request.json.get(
+            'precision',
+            DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS[0]
+        )
+        if precision not in (
+            DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS
+        ):
+            return {"message": f"Unknown precision: {precision}"}, 400
+        if num_landmarks > (
+            DimensionalityReduction.max_landmark_amount(idr_algorithm)
+        ):
+            return {
+                "message": f"Too many landmarks for {idr_algorithm}"
+            }, 400
+
+        def func(progress: ProgressCallback) -> Dict[str, Any]:
+            with instances.writing(instance_id) as instance:
+                if instance is None:
+                    raise KeyError(f"Unknown instance: {instance_id}")
+                instance.calculate(
+                    idr_algorithm, progress, precision,
+                    shards=shards_for(instance)
+                )
+                return {
+                    'datapoints': datapoints_to_json(
+                        instance, instance.state.ordered_indices
+                    ),
+                    'instance': instance.to_json() | {'id': instance_id}
+                }
+
+    elif kind == 'metrics':
+        k = int(request.json.get('k', DEFAULT_K))
+        if not 1 <= k <= max_metrics_k:
+            return {"message": f"Invalid k: {k}"}, 400
+
+        def func(progress: ProgressCallback) -> Dict[str, Any]:
+            with instances.writing(instance_id) as instance:
+                if instance is None:
+                    raise KeyError(f"Unknown instance: {instance_id}")
+                return {
+                    'metrics': instance.compute_metrics(
+                        k, progress, shards_for(instance)
+                    ),
+                    'instance': instance.to_json() | {'id': instance_id}
+                }
+
+    else:
+        return {"message": f"Unknown job kind: {kind}"}, 400
+
+    job = jobs.submit(instance_id, kind, func)
+    return {'job': job.to_json()}, 202
 
-    k = request.args.get('k', DEFAULT_K, int)
-    return {
-        'metrics': instance.compute_metrics(k),
-        'instance': instance.to_json() | {'id': instance_id}
-    }, 200
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def route_job_id(job_id: str):
+    if request.method == 'GET':
+        # The result is only returned once
+        job_json = jobs.fetch(job_id)
+        if job_json is None:
+            return {"message": f"Unknown job: {job_id}"}, 404
+        return {'job': job_json}, 200
+
+    elif request.method == 'DELETE':
+        job = jobs.cancel(job_id)
+        if job is None:
+            return {"message": f"Unknown job: {job_id}"}, 404
+        return {'job': job.to_json()}, 200
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the backend server")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=env_flag('PRODUCTION'),
+        help="Serve with a multi-threaded production WSGI server",
+    )
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.environ.get('SERVER_THREADS', DEFAULT_THREADS)),
+        help="Number of request threads in production mode",
+    )
+    parser.add_argument(
+        "--preload_models",
+        action="store_true",
+        default=env_flag('PRELOAD_MODELS'),
+        help="Load and warm all iDR models before serving",
+    )
+    parser.add_argument(
+        "--preload_datasets",
+        type=Preloader.parse_dataset_names,
+        default=os.environ.get('PRELOAD_DATASETS', ""),
+        help="Comma separated datasets to load before serving or 'all'",
+    )
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    args = parse_args()
+    # Exit normally on docker stop so that the instances get flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.preload_datasets or args.preload_models:
+        preloader.start(args.preload_datasets, args.preload_models)
+    if args.production:
+        import waitress
+        waitress.serve(
+            app, host=args.host, port=args.port, threads=args.threads
+        )
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
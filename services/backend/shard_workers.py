@@ -0,0 +1,525 @@
+from __future__ import annotations
+import io
+import os
+import sys
+import time
+import argparse
+import threading
+import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request
+from typing import Any, ClassVar, Dict, List, Tuple
+
+from compute_dtype import compute_dtype
+from dataset import Dataset, file_fingerprint, landmark_distances
+from neighbors import CachedNeighbors, TopKNeighbors
+from approximate_neighbors import low_dimensional_neighbors
+from metrics import Metrics
+
+# The protocol between a coordinator and its shard workers is plain HTTP.
+# Request and response bodies are uncompressed .npz archives without
+# pickled objects, parameters are 0-d arrays.
+CONTENT_TYPE: str = "application/octet-stream"
+
+
+def encode_arrays(arrays: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(
+        buffer, **{key: np.asarray(value) for key, value in arrays.items()}
+    )
+    return buffer.getvalue()
+
+
+def decode_arrays(body: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+        return {key: archive[key] for key in archive.files}
+
+
+class ShardUnavailable(RuntimeError):
+    """
+    Raised if a shard worker cannot be reached or fails a request.
+    """
+
+
+class ShardWorker:
+    """
+    Owns the rows [start, end) of a dataset on one node. It projects them
+    with the landmarks of a coordinator and returns the partial sums of the
+    metrics over them. The dataset is not loaded, the worker maps the .npy
+    caches of the embeddings and labels and the neighbor files and only
+    reads the rows of its shard and the labels of their neighbors.
+    """
+
+    # Rows per block of the low dimensional distances of the metrics
+    METRICS_BLOCK_SIZE: int = 1024
+    DISTANCE_METRICS: List[str] = ["euclidean", "cosine"]
+
+    _dataset_name: str
+    _datapoint_amount: int
+    _fingerprint: str
+    _start: int
+    _end: int
+    _embeddings: np.ndarray
+    _labels: np.ndarray
+    _neighbors: Dict[str, CachedNeighbors | TopKNeighbors]
+
+    def __init__(self, dataset_name: str, start: int, end: int):
+        """
+        :param dataset_name: One of `Dataset.VALID_NAMES`.
+        :param start: The first row of the shard.
+        :param end: The row after the shard.
+        """
+        self._neighbors = {
+            distance_metric: Dataset.open_neighbors(
+                dataset_name, distance_metric
+            )
+            for distance_metric in self.DISTANCE_METRICS
+        }
+        datapoint_amounts = {
+            neighbors.datapoint_amount
+            for neighbors in self._neighbors.values()
+        }
+        if len(datapoint_amounts) != 1:
+            raise ValueError(
+                "The neighbors of the distance metrics have different "
+                f"datapoint amounts: {sorted(datapoint_amounts)}"
+            )
+        datapoint_amount = datapoint_amounts.pop()
+        if not 0 <= start < end <= datapoint_amount:
+            raise ValueError(
+                f"Invalid rows: [{start}, {end}) of {datapoint_amount}"
+            )
+        self._dataset_name = dataset_name
+        self._datapoint_amount = datapoint_amount
+        self._start = start
+        self._end = end
+        embeddings_path = Dataset.data_path(
+            Dataset.embeddings_filename(dataset_name, datapoint_amount)
+        )
+        self._embeddings = self._load_cache(embeddings_path)[start:end]
+        self._fingerprint = file_fingerprint(embeddings_path)
+        self._labels = self._load_cache(Dataset.data_path(
+            Dataset.labels_filename(dataset_name, datapoint_amount)
+        ))
+
+    def _load_cache(self, path: str) -> np.ndarray:
+        if not Dataset.cache_is_current(
+            self._dataset_name, path, self._datapoint_amount
+        ):
+            raise FileNotFoundError(
+                f"{path} is missing or out of date. Write it with "
+                "Dataset.embeddings_file() and Dataset.labels_file()."
+            )
+        return np.load(path, mmap_mode='r')
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "dataset_name": self._dataset_name,
+            "datapoint_amount": self._datapoint_amount,
+            "fingerprint": self._fingerprint,
+            "start": self._start,
+            "end": self._end
+        }
+
+    def project(
+        self,
+        landmarks: np.ndarray,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        distance_metric: str,
+        dtype: type
+    ) -> np.ndarray:
+        """
+        Returns the (end - start, d) positions of the rows of the shard.
+        """
+        distance_to_landmarks = landmark_distances(
+            self._embeddings,
+            landmarks, distance_metric, dtype
+        ) ** 2
+        return -1 / 2 * (
+            (distance_to_landmarks - mean_distance).dot(L_sharp.T)
+        )
+
+    def metric_sums(
+        self, positions: np.ndarray, distance_metric: str, k: int
+    ) -> Dict[str, np.ndarray]:
+        """
+        Returns the sums of the metrics of `Metrics` over the rows of the
+        shard, computed from the (N, d) positions of all datapoints.
+        """
+        if distance_metric not in self._neighbors:
+            raise ValueError(f"Invalid distance metric: {distance_metric}")
+        hd_neighbors = self._neighbors[distance_metric]
+        labels = self._labels
+        # Like `Metrics`, approximate high dimensional neighbors are
+        # compared with approximate low dimensional ones. Their k-d tree
+        # is cheap enough to build over all positions on every worker.
+        ld_neighbors = None
+        if isinstance(hd_neighbors, TopKNeighbors):
+            ld_neighbors = low_dimensional_neighbors(
+                positions, distance_metric, hd_neighbors.k,
+                hd_neighbors.sample_amount
+            )
+        ranks, weights = Metrics.compared_ranks(hd_neighbors)
+        sums = {
+            "trustworthiness": 0, "continuity": 0,
+            "stress_numerator": 0.0, "stress_denominator": 0.0,
+            "neighborhood_hits": 0
+        }
+        local_errors = []
+        for start in range(self._start, self._end, self.METRICS_BLOCK_SIZE):
+            rows = np.arange(
+                start, min(start + self.METRICS_BLOCK_SIZE, self._end)
+            )
+            block_sums, block_errors = self._block_metric_sums(
+                rows, positions, hd_neighbors, ld_neighbors, labels,
+                distance_metric, k, ranks, weights
+            )
+            for key, value in block_sums.items():
+                sums[key] += value
+            local_errors.append(block_errors)
+        sums["average_local_error"] = np.concatenate(local_errors)
+        return sums
+
+    def _block_metric_sums(
+        self,
+        rows: np.ndarray,
+        positions: np.ndarray,
+        hd_neighbors,
+        ld_neighbors: TopKNeighbors | None,
+        labels: np.ndarray,
+        distance_metric: str,
+        k: int,
+        ranks: np.ndarray | None,
+        weights: np.ndarray | None
+    ) -> Tuple[Dict[str, Any], np.ndarray]:
+        hd_knn = hd_neighbors.distance_index_pairs()["index"][rows, 1:k + 1]
+        hd_dist = hd_neighbors.sorted_distances(rows, ranks).astype(
+            positions.dtype, copy=False
+        )
+        if ld_neighbors is not None:
+            ld_knn = ld_neighbors.distance_index_pairs()["index"][
+                rows, 1:k + 1
+            ]
+            ld_dist = ld_neighbors.sorted_distances(rows, ranks).astype(
+                positions.dtype, copy=False
+            )
+            ld_ranks_of_hd_knn = ld_neighbors.ranks_of(hd_knn, rows)
+        else:
+            ld_distances = landmark_distances(
+                positions[rows], positions, distance_metric, positions.dtype
+            )
+            # The point itself comes first, like in the neighbor files
+            ld_distances[np.arange(len(rows)), rows] = -np.inf
+            ld_order = np.argsort(ld_distances, axis=1, kind="stable")
+            ld_knn = ld_order[:, 1:k + 1]
+            ld_dist = np.take_along_axis(
+                ld_distances, ld_order[:, 1:], axis=1
+            )
+            ld_ranks = np.empty_like(ld_order)
+            np.put_along_axis(
+                ld_ranks, ld_order,
+                np.broadcast_to(
+                    np.arange(ld_order.shape[1]), ld_order.shape
+                ),
+                axis=1
+            )
+            ld_ranks_of_hd_knn = np.take_along_axis(
+                ld_ranks, hd_knn.astype(np.int64), axis=1
+            )
+        ld_ranks_of_hd_knn = ld_ranks_of_hd_knn.astype(np.int64)
+
+        # The same sums as Metrics.get_trustworthiness_and_continuity
+        hd_ranks_of_ld_knn = hd_neighbors.ranks_of(ld_knn, rows).astype(
+            np.int64
+        )
+        in_U = (hd_ranks_of_ld_knn < 1) | (hd_ranks_of_ld_knn > k)
+        in_U_hat = (ld_ranks_of_hd_knn < 1) | (ld_ranks_of_hd_knn > k)
+        stress_numerator, stress_denominator, local_errors = (
+            Metrics.sorted_distance_sums(ld_dist, hd_dist, weights)
+        )
+
+        sums = {
+            "trustworthiness": int(np.sum((hd_ranks_of_ld_knn - k)[in_U])),
+            "continuity": int(np.sum((ld_ranks_of_hd_knn - k)[in_U_hat])),
+            "stress_numerator": stress_numerator,
+            "stress_denominator": stress_denominator,
+            "neighborhood_hits": int(np.sum(
+                labels[ld_knn] == labels[rows, np.newaxis]
+            ))
+        }
+        return sums, local_errors
+
+
+def create_worker_app(worker: ShardWorker) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/shard', methods=['GET'])
+    def route_shard():
+        return worker.to_json(), 200
+
+    @app.route('/shard/positions', methods=['POST'])
+    def route_positions():
+        arrays = decode_arrays(request.get_data())
+        dtype = compute_dtype(str(arrays["compute_dtype"]))
+        positions = worker.project(
+            arrays["landmarks"].astype(dtype),
+            arrays["mean_distance"].astype(dtype),
+            arrays["L_sharp"].astype(dtype),
+            str(arrays["distance_metric"]),
+            dtype
+        )
+        return encode_arrays({"positions": positions}), 200, {
+            "Content-Type": CONTENT_TYPE
+        }
+
+    @app.route('/shard/metrics', methods=['POST'])
+    def route_metrics():
+        arrays = decode_arrays(request.get_data())
+        sums = worker.metric_sums(
+            arrays["positions"],
+            str(arrays["distance_metric"]),
+            int(arrays["k"])
+        )
+        return encode_arrays(sums), 200, {"Content-Type": CONTENT_TYPE}
+
+    return app
+
+
+class ShardCoordinator:
+    """
+    Splits the projection and the metrics of an instance across shard
+    workers, which together have to cover all rows of the dataset. All
+    workers are called at the same time. If a worker fails, the shared
+    coordinator is dropped and callers compute locally until the workers
+    are probed again.
+    """
+
+    DEFAULT_TIMEOUT: float = 600.0
+    PROBE_TIMEOUT: float = 5.0
+    RETRY_INTERVAL: float = 30.0
+
+    _shared: ClassVar[ShardCoordinator | None] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+    _retry_at: ClassVar[float] = 0.0
+
+    _urls: List[str]
+    _shards: List[Tuple[int, int]]
+    _dataset_name: str
+    _datapoint_amount: int
+    _fingerprint: str
+    _timeout: float
+
+    @classmethod
+    def shared(cls) -> ShardCoordinator | None:
+        """
+        Returns the process wide coordinator of the comma separated worker
+        URLs in SHARD_WORKER_URLS, connecting on first use, or None if it
+        is not set or the workers are unavailable. Unavailable workers are
+        probed again after `RETRY_INTERVAL` seconds.
+        """
+        urls = os.environ.get('SHARD_WORKER_URLS', "")
+        if not urls:
+            return None
+        with cls._shared_lock:
+            if cls._shared is None and time.monotonic() >= cls._retry_at:
+                try:
+                    cls._shared = cls([
+                        url.strip() for url in urls.split(",")
+                        if url.strip()
+                    ])
+                except (requests.RequestException, ValueError) as error:
+                    cls._retry_at = time.monotonic() + cls.RETRY_INTERVAL
+                    print(
+                        "Shard workers unavailable, computing locally: "
+                        f"{error}",
+                        file=sys.stderr
+                    )
+            return cls._shared
+
+    @classmethod
+    def _drop(cls, coordinator: ShardCoordinator):
+        with cls._shared_lock:
+            if cls._shared is coordinator:
+                cls._shared = None
+                cls._retry_at = time.monotonic() + cls.RETRY_INTERVAL
+
+    def __init__(self, urls: List[str], timeout: float = DEFAULT_TIMEOUT):
+        self._urls = [url.rstrip("/") for url in urls]
+        self._timeout = timeout
+        descriptions = []
+        for url in self._urls:
+            response = requests.get(
+                f"{url}/shard", timeout=min(timeout, self.PROBE_TIMEOUT)
+            )
+            response.raise_for_status()
+            descriptions.append(response.json())
+        dataset_names = {
+            description["dataset_name"] for description in descriptions
+        }
+        datapoint_amounts = {
+            description["datapoint_amount"] for description in descriptions
+        }
+        fingerprints = {
+            description["fingerprint"] for description in descriptions
+        }
+        if (
+            len(dataset_names) != 1 or len(datapoint_amounts) != 1
+            or len(fingerprints) != 1
+        ):
+            raise ValueError("All shard workers need the same dataset!")
+        order = sorted(
+            range(len(descriptions)),
+            key=lambda i: descriptions[i]["start"]
+        )
+        self._urls = [self._urls[i] for i in order]
+        self._shards = [
+            (descriptions[i]["start"], descriptions[i]["end"]) for i in order
+        ]
+        self._dataset_name = dataset_names.pop()
+        self._datapoint_amount = datapoint_amounts.pop()
+        self._fingerprint = fingerprints.pop()
+        ends = [0] + [end for _, end in self._shards]
+        if [start for start, _ in self._shards] != ends[:-1] or (
+            ends[-1] != self._datapoint_amount
+        ):
+            raise ValueError(
+                f"The shards {self._shards} do not cover the "
+                f"{self._datapoint_amount} datapoints!"
+            )
+
+    @property
+    def dataset_name(self) -> str:
+        return self._dataset_name
+
+    @property
+    def datapoint_amount(self) -> int:
+        return self._datapoint_amount
+
+    @property
+    def shards(self) -> List[Tuple[int, int]]:
+        return list(self._shards)
+
+    def covers(self, dataset: Dataset) -> bool:
+        """
+        Whether the workers serve the same revision of the dataset.
+        """
+        return (
+            dataset.name == self._dataset_name
+            and len(dataset) == self._datapoint_amount
+            and dataset.embeddings_fingerprint() == self._fingerprint
+        )
+
+    def _post_all(
+        self, path: str, arrays: Dict[str, Any]
+    ) -> List[Dict[str, np.ndarray]]:
+        body = encode_arrays(arrays)
+
+        def post(url: str) -> Dict[str, np.ndarray]:
+            try:
+                response = requests.post(
+                    f"{url}{path}", data=body, timeout=self._timeout,
+                    headers={"Content-Type": CONTENT_TYPE}
+                )
+            except requests.RequestException as error:
+                raise ShardUnavailable(f"{url}{path} failed: {error}")
+            if response.status_code != 200:
+                raise ShardUnavailable(
+                    f"{url}{path} returned {response.status_code}: "
+                    f"{response.text[:200]}"
+                )
+            return decode_arrays(response.content)
+
+        with ThreadPoolExecutor(max_workers=len(self._urls)) as executor:
+            try:
+                return list(executor.map(post, self._urls))
+            except ShardUnavailable:
+                self._drop(self)
+                raise
+
+    def project(
+        self,
+        landmarks: np.ndarray,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        distance_metric: str,
+        compute_dtype_name: str
+    ) -> np.ndarray:
+        """
+        Returns the (N, d) positions of all datapoints.
+        """
+        results = self._post_all("/shard/positions", {
+            "landmarks": landmarks,
+            "mean_distance": mean_distance,
+            "L_sharp": L_sharp,
+            "distance_metric": distance_metric,
+            "compute_dtype": compute_dtype_name
+        })
+        return np.concatenate([result["positions"] for result in results])
+
+    def calculate_all_metrics(
+        self, positions: np.ndarray, distance_metric: str, k: int
+    ) -> Dict[str, Any]:
+        """
+        Returns the metrics of `Metrics.calculate_all_metrics` from the
+        partial sums of the workers.
+        """
+        results = self._post_all("/shard/metrics", {
+            "positions": positions,
+            "distance_metric": distance_metric,
+            "k": k
+        })
+        N = self._datapoint_amount
+
+        def total(key: str) -> float:
+            return sum(result[key].item() for result in results)
+
+        factor = 2 / (N * k * (2 * N - 3 * k - 1))
+        return {
+            "trustworthiness": float(1 - factor * total("trustworthiness")),
+            "continuity": float(1 - factor * total("continuity")),
+            "normalized_stress": float(
+                total("stress_numerator") / total("stress_denominator")
+            ),
+            "neighborhood_hit": float(total("neighborhood_hits") / (N * k)),
+            "average_local_error": np.concatenate(
+                [result["average_local_error"] for result in results]
+            ).tolist()
+        }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Serve the rows [start, end) of a dataset to a coordinator"
+    )
+    parser.add_argument(
+        "dataset_name", type=str, choices=Dataset.VALID_NAMES
+    )
+    parser.add_argument("start", type=int, help="First row of the shard")
+    parser.add_argument("end", type=int, help="Row after the shard")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument(
+        "--threads", type=int, default=4, help="Number of request threads"
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    import waitress
+    waitress.serve(
+        create_worker_app(
+            ShardWorker(args.dataset_name, args.start, args.end)
+        ),
+        host=args.host, port=args.port, threads=args.threads
+    )
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import os
+import math
+import threading
+import multiprocessing
+import numpy as np
+import sysv_ipc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import ClassVar, Tuple
+
+from dataset import landmark_distances
+
+
+def _project_shard(
+    embeddings_path: str,
+    key: int,
+    shape: Tuple[int, int],
+    dtype: type,
+    rows: Tuple[int, int],
+    landmarks: np.ndarray,
+    mean_distance: np.ndarray,
+    L_sharp: np.ndarray,
+    distance_metric: str
+):
+    """
+    Projects the rows [start, end) of the embeddings in a worker process
+    and writes their positions into the shared output array.
+    """
+    start, end = rows
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    distance_to_landmarks = landmark_distances(
+        embeddings[start:end], landmarks, distance_metric, dtype
+    ) ** 2
+    memory = sysv_ipc.SharedMemory(key)
+    try:
+        positions = np.frombuffer(
+            memory, dtype=dtype, count=shape[0] * shape[1]
+        ).reshape(shape)
+        positions[start:end] = -1 / 2 * (
+            (distance_to_landmarks - mean_distance).dot(L_sharp.T)
+        )
+        del positions
+    finally:
+        memory.detach()
+
+
+class ShardedProjection:
+    """
+    Computes the landmark MDS positions of all datapoints in a pool of
+    worker processes. Every worker maps the .npy embeddings of the dataset,
+    computes the landmark distances and positions of its shard of rows and
+    writes them into an output array in shared memory, so neither the
+    embeddings nor the results are pickled.
+
+    The pool is started once per process with the "spawn" method, forking
+    the multithreaded server is not safe.
+    """
+
+    DEFAULT_SHARD_SIZE: int = 65536
+    SHARED_MEMORY_ACCESS_MODE: int = 0o600
+
+    _executor: ClassVar[ProcessPoolExecutor | None] = None
+    _executor_workers: ClassVar[int] = 0
+    _executor_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    _embeddings_path: str
+    _datapoint_amount: int
+    _distance_metric: str
+    _dtype: type
+    _workers: int
+    _shard_size: int
+
+    @classmethod
+    def default_workers(cls) -> int:
+        """
+        The number of worker processes of `calculate`, 0 projects in the
+        calling process.
+        """
+        return int(os.environ.get('PROJECTION_WORKERS', 0))
+
+    @classmethod
+    def executor(cls, workers: int) -> ProcessPoolExecutor:
+        """
+        Returns the shared pool, restarting it if the number of workers
+        changed.
+        """
+        with cls._executor_lock:
+            if cls._executor is None or cls._executor_workers != workers:
+                if cls._executor is not None:
+                    cls._executor.shutdown()
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                cls._executor_workers = workers
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        with cls._executor_lock:
+            if cls._executor is not None:
+                cls._executor.shutdown()
+                cls._executor = None
+                cls._executor_workers = 0
+
+    @classmethod
+    def _discard_executor(cls, executor: ProcessPoolExecutor):
+        """
+        Drops a broken pool, e.g. after a worker was killed, so that the
+        next projection starts a new one.
+        """
+        with cls._executor_lock:
+            if cls._executor is executor:
+                cls._executor = None
+                cls._executor_workers = 0
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def __init__(
+        self,
+        embeddings_path: str,
+        distance_metric: str,
+        dtype: type,
+        workers: int,
+        shard_size: int = DEFAULT_SHARD_SIZE
+    ):
+        """
+        :param embeddings_path: The .npy file of the (N, D) embeddings.
+        :param distance_metric: "euclidean" or "cosine".
+        :param dtype: The dtype to compute in.
+        :param workers: The number of worker processes.
+        :param shard_size: The maximum number of rows per task.
+        """
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers}")
+        self._embeddings_path = embeddings_path
+        self._datapoint_amount = len(
+            np.load(embeddings_path, mmap_mode='r')
+        )
+        self._distance_metric = distance_metric
+        self._dtype = dtype
+        self._workers = workers
+        # At least one shard per worker
+        self._shard_size = max(1, min(
+            shard_size, math.ceil(self._datapoint_amount / workers)
+        ))
+
+    def project(
+        self,
+        landmarks: np.ndarray,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray
+    ) -> np.ndarray:
+        """
+        :param landmarks: The (L, D) landmark embeddings.
+        :param mean_distance: The (L,) mean squared landmark distances.
+        :param L_sharp: The (d, L) pseudo-inverse of the landmark
+            positions.
+
+        :return: The (N, d) positions of all datapoints.
+        """
+        shape = (self._datapoint_amount, L_sharp.shape[0])
+        itemsize = np.dtype(self._dtype).itemsize
+        memory = sysv_ipc.SharedMemory(
+            None,
+            flags=sysv_ipc.IPC_CREX,
+            size=max(1, shape[0] * shape[1] * itemsize),
+            mode=self.SHARED_MEMORY_ACCESS_MODE
+        )
+        try:
+            executor = self.executor(self._workers)
+            futures = [
+                executor.submit(
+                    _project_shard, self._embeddings_path, memory.key,
+                    shape, self._dtype,
+                    (start, min(start + self._shard_size, shape[0])),
+                    np.asarray(landmarks, dtype=self._dtype),
+                    np.asarray(mean_distance, dtype=self._dtype),
+                    np.asarray(L_sharp, dtype=self._dtype),
+                    self._distance_metric
+                )
+                for start in range(0, shape[0], self._shard_size)
+            ]
+            for future in futures:
+                future.result()
+            positions = np.frombuffer(
+                memory.read(shape[0] * shape[1] * itemsize),
+                dtype=self._dtype
+            ).reshape(shape)
+        except BrokenProcessPool:
+            # Only raised by the futures of the executor
+            self._discard_executor(executor)
+            raise
+        finally:
+            memory.detach()
+            memory.remove()
+        return positions
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import os
+import numpy as np
+from typing import Any, Dict, List
+
+from dataset import Dataset
+from dr import DimensionalityReduction
+
+
+class SnapshotStore:
+    """
+    Stores instance snapshots as uncompressed `.npz` files in one
+    directory. Files are written to a temporary name first and then
+    renamed, so a crash never leaves a half written snapshot behind.
+    """
+
+    DOCKER_PATH: str = "/server/data/instances"
+    LOCAL_PATH: str = "./volumes/data/instances"
+
+    FILE_SUFFIX: str = ".npz"
+    TEMPORARY_SUFFIX: str = ".tmp"
+
+    _directory: str
+
+    @classmethod
+    def default(cls) -> SnapshotStore:
+        """
+        Returns the store on the data volume, which outlives restarts and
+        redeployments of the backend.
+        """
+        inside_docker = bool(os.environ.get('INSIDE_DOCKER', False))
+        return cls(cls.DOCKER_PATH if inside_docker else cls.LOCAL_PATH)
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _path(self, instance_id: str) -> str:
+        return os.path.join(
+            self._directory, f"{instance_id}{self.FILE_SUFFIX}"
+        )
+
+    def __contains__(self, instance_id: str) -> bool:
+        return os.path.exists(self._path(instance_id))
+
+    def ids(self) -> List[str]:
+        return sorted(
+            filename[:-len(self.FILE_SUFFIX)]
+            for filename in os.listdir(self._directory)
+            if filename.endswith(self.FILE_SUFFIX)
+        )
+
+    def save(self, instance_id: str, instance: DimensionalityReduction):
+        path = self._path(instance_id)
+        temporary_path = path + self.TEMPORARY_SUFFIX
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, **instance.snapshot())
+        os.replace(temporary_path, path)
+
+    def load(self, instance_id: str) -> DimensionalityReduction:
+        with np.load(self._path(instance_id), allow_pickle=False) as data:
+            return DimensionalityReduction.from_snapshot(data)
+
+    def describe(self, instance_id: str) -> Dict[str, Any]:
+        """
+        Returns the json description of a stored instance without
+        restoring it. Raises `StaleSnapshot` if its dataset is loaded and
+        has changed since; unloaded datasets are not loaded to check.
+        """
+        with np.load(self._path(instance_id), allow_pickle=False) as data:
+            meta = DimensionalityReduction.snapshot_meta(data)
+        if (
+            "datapoint_amount" in meta
+            and meta["dataset_name"] in Dataset.loaded_names()
+        ):
+            DimensionalityReduction.raise_for_stale_snapshot(
+                meta["datapoint_amount"], Dataset.get(meta["dataset_name"])
+            )
+        return meta["description"]
+
+    def delete(self, instance_id: str):
+        try:
+            os.remove(self._path(instance_id))
+        except FileNotFoundError:
+            pass
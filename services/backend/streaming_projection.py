@@ -0,0 +1,109 @@
+from __future__ import annotations
+import os
+import numpy as np
+
+from jobs import ProgressCallback, no_progress
+from dataset import landmark_distances
+
+
+class StreamingProjection:
+    """
+    Computes the landmark MDS positions of all datapoints out of core. The
+    .npy embeddings are mapped and walked in chunks of rows, the landmark
+    distances and positions of one chunk are computed at a time and the
+    positions are written into an output memmap. Apart from the output,
+    memory use only depends on the chunk size and not on the number of
+    datapoints.
+    """
+
+    DEFAULT_CHUNK_SIZE: int = 65536
+
+    _embeddings_path: str
+    _datapoint_amount: int
+    _distance_metric: str
+    _dtype: type
+    _chunk_size: int
+
+    @classmethod
+    def default_streaming(cls) -> bool:
+        """
+        Whether `calculate` streams the projection by default.
+        """
+        return os.environ.get(
+            'STREAMING_PROJECTION', ''
+        ).lower() in ('1', 'true', 'yes')
+
+    def __init__(
+        self,
+        embeddings_path: str,
+        distance_metric: str,
+        dtype: type,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ):
+        """
+        :param embeddings_path: The .npy file of the (N, D) embeddings.
+        :param distance_metric: "euclidean" or "cosine".
+        :param dtype: The dtype to compute in.
+        :param chunk_size: The number of rows held in memory at a time.
+        """
+        if chunk_size < 1:
+            raise ValueError(f"Invalid chunk size: {chunk_size}")
+        self._embeddings_path = embeddings_path
+        self._datapoint_amount = len(
+            np.load(embeddings_path, mmap_mode='r')
+        )
+        self._distance_metric = distance_metric
+        self._dtype = dtype
+        self._chunk_size = chunk_size
+
+    @property
+    def datapoint_amount(self) -> int:
+        return self._datapoint_amount
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    def project(
+        self,
+        landmarks: np.ndarray,
+        mean_distance: np.ndarray,
+        L_sharp: np.ndarray,
+        output_path: str,
+        progress: ProgressCallback = no_progress
+    ) -> np.memmap:
+        """
+        :param landmarks: The (L, D) landmark embeddings.
+        :param mean_distance: The (L,) mean squared landmark distances.
+        :param L_sharp: The (d, L) pseudo-inverse of the landmark
+            positions.
+        :param output_path: The .npy file the positions are written to.
+        :param progress: Receives the fraction of projected rows.
+
+        :return: The (N, d) positions of all datapoints, mapped from
+            `output_path`.
+        """
+        landmarks = np.asarray(landmarks, dtype=self._dtype)
+        mean_distance = np.asarray(mean_distance, dtype=self._dtype)
+        L_sharp = np.asarray(L_sharp, dtype=self._dtype)
+        embeddings = np.load(self._embeddings_path, mmap_mode='r')
+        positions = np.lib.format.open_memmap(
+            output_path, mode='w+', dtype=self._dtype,
+            shape=(self._datapoint_amount, L_sharp.shape[0])
+        )
+        for start in range(0, self._datapoint_amount, self._chunk_size):
+            chunk = slice(start, start + self._chunk_size)
+            distance_to_landmarks = landmark_distances(
+                embeddings[chunk], landmarks, self._distance_metric,
+                self._dtype
+            )
+            distance_to_landmarks **= 2
+            distance_to_landmarks -= mean_distance
+            positions[chunk] = -1 / 2 * distance_to_landmarks.dot(L_sharp.T)
+            progress(
+                min(start + self._chunk_size, self._datapoint_amount)
+                / self._datapoint_amount,
+                "streaming projection"
+            )
+        positions.flush()
+        return positions
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+from tqdm import tqdm
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from approximate_neighbors import RandomProjectionForest  # noqa: E402
+from dataset import Dataset  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Embed new rows and append them to a dataset without rebuilding "
+            "its neighbors"
+        )
+    )
+    parser.add_argument(
+        "dataset_name", type=str, choices=Dataset.VALID_NAMES,
+        help="Name of the dataset to append to",
+    )
+    parser.add_argument(
+        "csv_path", type=str,
+        help="CSV file with the text and label columns of the new rows",
+    )
+    parser.add_argument(
+        "-k", type=int, default=RandomProjectionForest.DEFAULT_K,
+        help="Neighbors per datapoint if the dataset has exact neighbors",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    dataset = Dataset(args.dataset_name, no_neighbors=True)
+    rows = pd.read_csv(args.csv_path)
+
+    model = SentenceTransformer("all-mpnet-base-v2")
+    rows["embeddings"] = None
+    for i in tqdm(range(len(rows)), desc="writing embeddings"):
+        rows.at[i, "embeddings"] = model.encode(rows.iloc[i]["text"])
+    rows = rows[rows["embeddings"].notnull()]
+
+    print(f"Appending {len(rows)} rows to {len(dataset)} datapoints...")
+    start = time.perf_counter()
+    dataset = dataset.append(rows, k=args.k)
+    print(
+        f"Done in {time.perf_counter() - start:.1f}s, "
+        f"{len(dataset)} datapoints!"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from approximate_neighbors import RandomProjectionForest  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from neighbors import Neighbors  # noqa: E402
+
+BLOCK_SIZE: int = 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the recall and build time of the approximate neighbors "
+            "with exact neighbors"
+        )
+    )
+    parser.add_argument(
+        "-d", "--datasets", type=str, nargs="*", default=Dataset.VALID_NAMES,
+        choices=Dataset.VALID_NAMES,
+        help="Bundled datasets, missing ones are skipped",
+    )
+    parser.add_argument(
+        "-s", "--synthetic", type=int, nargs="*", default=[],
+        help="Sizes of additional synthetic 768 dimensional datasets",
+    )
+    parser.add_argument(
+        "-m", "--distance_metrics", type=str, nargs="+",
+        default=list(Neighbors.DISTANCE_METRICS),
+        choices=list(Neighbors.DISTANCE_METRICS),
+    )
+    parser.add_argument("-k", type=int, default=10, help="Neighbors")
+    parser.add_argument(
+        "-r", "--recall_targets", type=float, nargs="+",
+        default=[0.8, 0.9, 0.95, 0.99],
+    )
+    parser.add_argument("--seed", default=42, type=int, help="Random seed")
+    return parser.parse_args()
+
+
+def load_embeddings(args) -> dict:
+    embeddings = {}
+    for name in args.datasets:
+        try:
+            embeddings[name] = Dataset(name, no_neighbors=True).embeddings
+        except FileNotFoundError:
+            print(f"Skipping {name}: no embeddings")
+    rng = np.random.default_rng(args.seed)
+    for size in args.synthetic:
+        centers = rng.normal(size=(64, 768))
+        labels = rng.integers(0, len(centers), size)
+        embeddings[f"synthetic_{size}"] = (
+            centers[labels] + 0.5 * rng.normal(size=(size, 768))
+        ).astype(np.float32)
+    return embeddings
+
+
+def exact_neighbors(
+    embeddings: np.ndarray, distance_metric: str, k: int
+) -> np.ndarray:
+    positions = embeddings.astype(np.float32)
+    if distance_metric == "cosine":
+        positions = positions / np.linalg.norm(positions, axis=1)[:, None]
+    squared_norms = np.einsum("nd,nd->n", positions, positions)
+    neighbors = np.empty((len(positions), k), dtype=np.int64)
+    for start in range(0, len(positions), BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, len(positions))
+        dots = positions[start:end] @ positions.T
+        if distance_metric == "cosine":
+            distances = 1.0 - dots
+        else:
+            distances = (
+                squared_norms[start:end, None] + squared_norms[None, :]
+                - 2.0 * dots
+            )
+        distances[np.arange(end - start), np.arange(start, end)] = np.inf
+        neighbors[start:end] = np.argpartition(
+            distances, k - 1, axis=1
+        )[:, :k]
+    return neighbors
+
+
+def recall(expected: np.ndarray, actual: np.ndarray) -> float:
+    hits = [
+        len(np.intersect1d(expected_row, actual_row))
+        for expected_row, actual_row in zip(expected, actual)
+    ]
+    return float(np.mean(hits)) / expected.shape[1]
+
+
+def main():
+    args = parse_args()
+    for name, embeddings in load_embeddings(args).items():
+        for distance_metric in args.distance_metrics:
+            start = time.perf_counter()
+            expected = exact_neighbors(embeddings, distance_metric, args.k)
+            exact_duration = time.perf_counter() - start
+            print(
+                f"{name} (N={len(embeddings)}) {distance_metric}: "
+                f"exact {exact_duration:.2f}s"
+            )
+            for recall_target in args.recall_targets:
+                start = time.perf_counter()
+                forest = RandomProjectionForest(
+                    embeddings, distance_metric, seed=args.seed
+                )
+                indices, _ = forest.build(
+                    k=args.k, recall_target=recall_target
+                )
+                duration = time.perf_counter() - start
+                print(
+                    f"  target {recall_target:.2f}: "
+                    f"build {duration:6.2f}s  trees {forest.tree_amount:3d}  "
+                    f"estimated {forest.estimated_recall:.3f}  "
+                    f"recall@{args.k} {recall(expected, indices[:, 1:]):.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
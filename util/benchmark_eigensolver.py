@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import euclidean_distances
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from dr import top_eigenpairs  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the landmark eigendecomposition with a full one of the "
+            "explicitly mean centered matrix for growing numbers of "
+            "landmarks"
+        )
+    )
+    parser.add_argument(
+        "-l", "--num_landmarks", type=int, nargs="+",
+        default=[30, 100, 300, 1000, 2000],
+    )
+    parser.add_argument("-d", "--dimension", type=int, default=2)
+    return parser.parse_args()
+
+
+def full_eigenpairs(delta_n: np.ndarray, dimension: int):
+    num_landmarks = len(delta_n)
+    H = -np.ones((num_landmarks, num_landmarks)) / num_landmarks
+    np.fill_diagonal(H, 1 - 1 / num_landmarks)
+    B = -1 / 2 * (H.dot(delta_n).dot(H))
+    eigenvalues, eigenvectors = np.linalg.eigh(B)
+    idx = eigenvalues.argsort()[::-1][:dimension]
+    return eigenvalues[idx], eigenvectors[:, idx]
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+    for num_landmarks in args.num_landmarks:
+        embeddings = rng.normal(size=(num_landmarks, 768))
+        delta_n = euclidean_distances(embeddings, embeddings) ** 2
+        start = time.perf_counter()
+        expected_values, expected_vectors = full_eigenpairs(
+            delta_n, args.dimension
+        )
+        full_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        values, vectors = top_eigenpairs(delta_n, args.dimension)
+        duration = time.perf_counter() - start
+        # Eigenvectors are only unique up to their sign
+        vector_difference = np.abs(
+            np.abs(vectors) - np.abs(expected_vectors)
+        ).max()
+        print(
+            f"L={num_landmarks:5d}  full {full_duration:.3f}s  "
+            f"top {args.dimension} {duration:.3f}s  max difference "
+            f"{np.abs(values - expected_values).max() / values[0]:.1e} "
+            f"(relative eigenvalues) {vector_difference:.1e} (eigenvectors)"
+        )
+
+
+if __name__ == "__main__":
+    main()
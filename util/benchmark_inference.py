@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from inference import Predictor  # noqa: E402
+
+MODELS_PATH: str = os.path.join(os.getcwd(), "volumes", "models")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the iDR inference latency of every model"
+    )
+    parser.add_argument(
+        "-n", "--num_landmarks", type=int, default=20,
+        help="Number of landmarks of the distance matrices",
+    )
+    parser.add_argument(
+        "-r", "--repetitions", type=int, default=1000,
+        help="Number of timed inferences per model and mode",
+    )
+    parser.add_argument(
+        "-b", "--batch_size", type=int, default=64,
+        help="Number of distance matrices per batched inference",
+    )
+    parser.add_argument(
+        "-m", "--modes", type=str, nargs="+", default=Predictor.MODES,
+        choices=Predictor.MODES, help="Inference modes to compare",
+    )
+    parser.add_argument("--seed", default=42, type=int, help="Random seed")
+    return parser.parse_args()
+
+
+def random_distance_matrix(
+    rng: np.random.Generator, num_landmarks: int
+) -> np.ndarray:
+    points = rng.normal(size=(num_landmarks, 2))
+    return np.linalg.norm(points[:, None] - points[None], axis=-1)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    distance_matrices = [
+        random_distance_matrix(rng, args.num_landmarks)
+        for _ in range(args.batch_size)
+    ]
+
+    for model_name in sorted(os.listdir(MODELS_PATH)):
+        model_path = os.path.join(MODELS_PATH, model_name)
+        reference = Predictor(model_path, mode="eager")
+        expected = [
+            reference.inference(matrix) for matrix in distance_matrices
+        ]
+        for mode in args.modes:
+            predictor = Predictor(model_path, mode=mode)
+            error = max(
+                np.abs(predictor.inference(matrix) - result).max()
+                for matrix, result in zip(distance_matrices, expected)
+            )
+            latencies = np.empty(args.repetitions)
+            for i in range(args.repetitions):
+                matrix = distance_matrices[i % len(distance_matrices)]
+                start = time.perf_counter()
+                predictor.inference(matrix)
+                latencies[i] = time.perf_counter() - start
+            latencies *= 1e6
+
+            batch_repetitions = max(1, args.repetitions // args.batch_size)
+            start = time.perf_counter()
+            for _ in range(batch_repetitions):
+                predictor.batch_inference(distance_matrices)
+            batch_latency = (
+                (time.perf_counter() - start) * 1e6
+                / (batch_repetitions * args.batch_size)
+            )
+            print(
+                f"{model_name:>24} {mode:>9}: "
+                f"p50 {np.percentile(latencies, 50):7.1f}us  "
+                f"p95 {np.percentile(latencies, 95):7.1f}us  "
+                f"batched {batch_latency:6.1f}us/matrix  "
+                f"memory {predictor.nbytes:>7}B  "
+                f"max error {error:.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from neighbors import ComputedNeighbors, Neighbors  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure build time and memory of the neighbor engine per "
+            "dimensionality and position dtype"
+        )
+    )
+    parser.add_argument(
+        "-n", "--datapoint_amount", type=int, default=2000,
+        help="Number of random datapoints",
+    )
+    parser.add_argument(
+        "-d", "--dimensions", type=int, nargs="+",
+        default=[2, 64, 384, 768, 1024],
+        help="Dimensionalities to compare",
+    )
+    parser.add_argument(
+        "-m", "--distance_metric", type=str, default="cosine",
+        choices=list(Neighbors.DISTANCE_METRICS),
+    )
+    parser.add_argument(
+        "-k", type=int, default=10,
+        help="Neighborhood size for the float16 recall",
+    )
+    parser.add_argument("--seed", default=42, type=int, help="Random seed")
+    return parser.parse_args()
+
+
+def build(
+    distance_metric: str, positions: np.ndarray, position_dtype: str
+) -> tuple:
+    start = time.perf_counter()
+    neighbors = ComputedNeighbors(
+        distance_metric,
+        positions.shape[1],
+        positions,
+        position_dtype=position_dtype,
+    )
+    return neighbors, time.perf_counter() - start
+
+
+def recall(expected: np.ndarray, actual: np.ndarray, k: int) -> float:
+    hits = [
+        len(np.intersect1d(expected_row, actual_row))
+        for expected_row, actual_row in zip(expected, actual)
+    ]
+    return float(np.mean(hits)) / k
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    for dimensions in args.dimensions:
+        positions = rng.normal(
+            size=(args.datapoint_amount, dimensions)
+        ).astype(np.float32)
+
+        reference, reference_time = build(
+            args.distance_metric, positions, "float32"
+        )
+        expected = reference.distance_index_pairs()["index"][:, 1:args.k + 1]
+        for position_dtype in Neighbors.POSITION_DTYPES:
+            if position_dtype == "float32":
+                neighbors, duration = reference, reference_time
+            else:
+                neighbors, duration = build(
+                    args.distance_metric, positions, position_dtype
+                )
+            actual = neighbors.distance_index_pairs()["index"][:, 1:args.k + 1]
+            positions_size = neighbors.positions().nbytes
+            print(
+                f"D={dimensions:>5} {position_dtype:>7}: "
+                f"build {duration:7.3f}s  "
+                f"positions {positions_size / 2**20:8.2f}MiB  "
+                f"file {neighbors.nbytes / 2**20:8.2f}MiB  "
+                f"recall@{args.k} {recall(expected, actual, args.k):.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
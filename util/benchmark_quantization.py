@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_distances, euclidean_distances
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from dataset import Dataset  # noqa: E402
+from dr import DimensionalityReduction  # noqa: E402
+from quantized_embeddings import QuantizedEmbeddings  # noqa: E402
+
+DISTANCE_FUNCTIONS = {
+    "euclidean": euclidean_distances,
+    "cosine": cosine_distances
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare int8 with float64 landmark distances in speed and in "
+            "their effect on the positions and metrics"
+        )
+    )
+    parser.add_argument(
+        "-d", "--datasets", type=str, nargs="*", default=Dataset.VALID_NAMES,
+        choices=Dataset.VALID_NAMES,
+        help="Datasets for the accuracy, missing ones are skipped",
+    )
+    parser.add_argument(
+        "-m", "--distance_metrics", type=str, nargs="+",
+        default=DimensionalityReduction.DISTANCE_METRICS,
+        choices=DimensionalityReduction.DISTANCE_METRICS,
+    )
+    parser.add_argument(
+        "-l", "--num_landmarks", type=int, default=20,
+        help="Landmarks per instance",
+    )
+    parser.add_argument(
+        "-n", "--datapoint_amount", type=int, default=200000,
+        help="Random 768 dimensional datapoints for the speed",
+    )
+    parser.add_argument("-k", type=int, default=10, help="Metrics k")
+    parser.add_argument(
+        "--seeds", type=int, nargs="+", default=[0, 1, 2],
+        help="Landmark selection seeds",
+    )
+    return parser.parse_args()
+
+
+def measure_speed(args):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(
+        size=(args.datapoint_amount, 768)
+    ).astype(np.float32)
+    landmarks = embeddings[:args.num_landmarks]
+    start = time.perf_counter()
+    quantized = QuantizedEmbeddings(embeddings)
+    quantize_duration = time.perf_counter() - start
+    print(
+        f"N={args.datapoint_amount}: float32 "
+        f"{embeddings.nbytes / 2**20:.0f}MiB, int8 "
+        f"{quantized.nbytes / 2**20:.0f}MiB, "
+        f"quantized in {quantize_duration:.2f}s"
+    )
+    for distance_metric in args.distance_metrics:
+        start = time.perf_counter()
+        expected = DISTANCE_FUNCTIONS[distance_metric](embeddings, landmarks)
+        float_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = quantized.landmark_distances(landmarks, distance_metric)
+        int8_duration = time.perf_counter() - start
+        print(
+            f"  {distance_metric}: float64 {float_duration:.3f}s, "
+            f"int8 {int8_duration:.3f}s, relative distance error "
+            f"{np.abs(actual - expected).max() / expected.max():.2e}"
+        )
+
+
+def measure_accuracy(args, dataset: Dataset):
+    for distance_metric in args.distance_metrics:
+        for seed in args.seeds:
+            instance = DimensionalityReduction(
+                "balanced", distance_metric, args.num_landmarks, dataset
+            )
+            instance.select_landmarks(seed)
+            instance.reduce_landmarks()
+            results = {}
+            for precision in ("float64", "int8"):
+                instance.calculate("none", precision=precision)
+                results[precision] = (
+                    instance.state.positions.copy(),
+                    instance.compute_metrics(args.k)
+                )
+            expected_positions, expected_metrics = results["float64"]
+            actual_positions, actual_metrics = results["int8"]
+            spread = np.ptp(expected_positions, axis=0).max()
+            displacement = np.linalg.norm(
+                actual_positions - expected_positions, axis=1
+            ) / spread
+            metric_differences = "  ".join(
+                f"{name} {actual_metrics[name] - value:+.4f}"
+                for name, value in expected_metrics.items()
+                if isinstance(value, float)
+            )
+            print(
+                f"  {distance_metric} seed {seed}: displacement mean "
+                f"{displacement.mean():.2e} max {displacement.max():.2e}  "
+                f"{metric_differences}"
+            )
+
+
+def main():
+    args = parse_args()
+    measure_speed(args)
+    for name in args.datasets:
+        try:
+            dataset = Dataset(name)
+        except FileNotFoundError:
+            print(f"Skipping {name}: no embeddings or neighbors")
+            continue
+        print(f"{name} (N={len(dataset)}), int8 - float64:")
+        measure_accuracy(args, dataset)
+
+
+if __name__ == "__main__":
+    main()
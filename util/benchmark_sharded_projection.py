@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from compute_dtype import COMPUTE_DTYPES, compute_dtype  # noqa: E402
+from dataset import landmark_distances  # noqa: E402
+from sharded_projection import ShardedProjection  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure the projection throughput in this process and in "
+            "worker processes"
+        )
+    )
+    parser.add_argument(
+        "-n", "--datapoint_amount", type=int, default=500000,
+        help="Random 768 dimensional datapoints",
+    )
+    parser.add_argument("-l", "--num_landmarks", type=int, default=30)
+    parser.add_argument(
+        "-w", "--workers", type=int, nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+        help="Numbers of worker processes to compare",
+    )
+    parser.add_argument(
+        "-m", "--distance_metric", type=str, default="cosine",
+        choices=["euclidean", "cosine"],
+    )
+    parser.add_argument(
+        "--compute_dtype", type=str, default="float32",
+        choices=list(COMPUTE_DTYPES),
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Best of this many runs"
+    )
+    return parser.parse_args()
+
+
+def best_duration(function, repeats: int) -> float:
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    args = parse_args()
+    dtype = compute_dtype(args.compute_dtype)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        embeddings = np.lib.format.open_memmap(
+            embeddings_path, mode="w+", dtype=np.float32,
+            shape=(args.datapoint_amount, 768)
+        )
+        for start in range(0, args.datapoint_amount, 65536):
+            block = embeddings[start:start + 65536]
+            block[:] = rng.normal(size=block.shape)
+        embeddings.flush()
+        landmarks = np.array(embeddings[:args.num_landmarks], dtype=dtype)
+        mean_distance = rng.random(args.num_landmarks).astype(dtype)
+        L_sharp = rng.normal(size=(2, args.num_landmarks)).astype(dtype)
+
+        def project_in_process() -> np.ndarray:
+            distance_to_landmarks = landmark_distances(
+                embeddings, landmarks, args.distance_metric, dtype
+            ) ** 2
+            return -1 / 2 * (
+                (distance_to_landmarks - mean_distance).dot(L_sharp.T)
+            )
+
+        expected = project_in_process()
+        duration = best_duration(project_in_process, args.repeats)
+        print(
+            f"N={args.datapoint_amount} L={args.num_landmarks} "
+            f"{args.distance_metric} {args.compute_dtype}, "
+            f"{os.cpu_count()} cores"
+        )
+        print(
+            f"  in process: {duration:.3f}s "
+            f"{args.datapoint_amount / duration / 1e6:.2f}M rows/s"
+        )
+        for workers in args.workers:
+            projection = ShardedProjection(
+                embeddings_path, args.distance_metric, dtype, workers
+            )
+            # The first run starts the workers
+            actual = projection.project(landmarks, mean_distance, L_sharp)
+            duration = best_duration(
+                lambda: projection.project(
+                    landmarks, mean_distance, L_sharp
+                ),
+                args.repeats
+            )
+            print(
+                f"  {workers:2d} workers: {duration:.3f}s "
+                f"{args.datapoint_amount / duration / 1e6:.2f}M rows/s  "
+                f"max difference {np.abs(actual - expected).max():.1e}"
+            )
+        ShardedProjection.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+HEAVY_MODULES = ["torch", "sklearn", "lightning", "datasets"]
+
+CHILD_SCRIPT: str = """
+import json, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {backend_path!r})
+import server
+duration = time.perf_counter() - start
+print(json.dumps({{
+    "duration": duration,
+    "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "heavy_modules": [
+        name for name in {heavy_modules!r} if name in sys.modules
+    ],
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the cold start time and memory of the backend"
+    )
+    parser.add_argument(
+        "-r", "--repetitions", type=int, default=5,
+        help="Number of fresh interpreters to start",
+    )
+    parser.add_argument(
+        "--backend_path", type=str, default=BACKEND_PATH,
+        help="Backend to import, e.g. of another checkout to compare with",
+    )
+    return parser.parse_args()
+
+
+def cold_start(backend_path: str) -> dict:
+    script = CHILD_SCRIPT.format(
+        backend_path=backend_path, heavy_modules=HEAVY_MODULES
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    results = [cold_start(args.backend_path) for _ in range(args.repetitions)]
+
+    durations = np.array([result["duration"] for result in results])
+    max_rss = np.array([result["max_rss"] for result in results]) / 2**20
+    print(
+        f"import server: median {np.median(durations):.2f}s  "
+        f"min {durations.min():.2f}s  max {durations.max():.2f}s"
+    )
+    print(f"max rss: median {np.median(max_rss):.1f}MiB")
+    print(f"heavy modules loaded: {results[0]['heavy_modules'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from compute_dtype import COMPUTE_DTYPES, compute_dtype  # noqa: E402
+from dataset import landmark_distances  # noqa: E402
+from streaming_projection import StreamingProjection  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the peak memory and duration of the in-process and the "
+            "streaming projection for growing numbers of datapoints"
+        )
+    )
+    parser.add_argument(
+        "-n", "--datapoint_amounts", type=int, nargs="+",
+        default=[100000, 200000, 400000],
+        help="Random 768 dimensional datapoints",
+    )
+    parser.add_argument("-l", "--num_landmarks", type=int, default=30)
+    parser.add_argument(
+        "-m", "--distance_metric", type=str, default="cosine",
+        choices=["euclidean", "cosine"],
+    )
+    parser.add_argument(
+        "--compute_dtype", type=str, default="float32",
+        choices=list(COMPUTE_DTYPES),
+    )
+    parser.add_argument(
+        "--chunk_size", type=int,
+        default=StreamingProjection.DEFAULT_CHUNK_SIZE,
+    )
+    return parser.parse_args()
+
+
+def measure(function):
+    """
+    Returns the result, duration and peak of traced allocations of a call.
+    Pages of memory mapped files are not allocations.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def write_embeddings(path: str, datapoint_amount: int, rng):
+    embeddings = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(datapoint_amount, 768)
+    )
+    for start in range(0, datapoint_amount, 65536):
+        block = embeddings[start:start + 65536]
+        block[:] = rng.normal(size=block.shape)
+    embeddings.flush()
+
+
+def main():
+    args = parse_args()
+    dtype = compute_dtype(args.compute_dtype)
+    rng = np.random.default_rng(0)
+    landmarks = rng.normal(size=(args.num_landmarks, 768)).astype(dtype)
+    mean_distance = rng.random(args.num_landmarks).astype(dtype)
+    L_sharp = rng.normal(size=(2, args.num_landmarks)).astype(dtype)
+    print(
+        f"L={args.num_landmarks} {args.distance_metric} "
+        f"{args.compute_dtype}, chunks of {args.chunk_size} rows"
+    )
+    for datapoint_amount in args.datapoint_amounts:
+        with tempfile.TemporaryDirectory() as directory:
+            embeddings_path = os.path.join(directory, "embeddings.npy")
+            write_embeddings(embeddings_path, datapoint_amount, rng)
+
+            def project_in_process() -> np.ndarray:
+                embeddings = np.load(embeddings_path)
+                distance_to_landmarks = landmark_distances(
+                    embeddings, landmarks, args.distance_metric, dtype
+                ) ** 2
+                return -1 / 2 * (
+                    (distance_to_landmarks - mean_distance).dot(L_sharp.T)
+                )
+
+            def project_streaming() -> np.ndarray:
+                return StreamingProjection(
+                    embeddings_path, args.distance_metric, dtype,
+                    args.chunk_size
+                ).project(
+                    landmarks, mean_distance, L_sharp,
+                    os.path.join(directory, "positions.npy")
+                )
+
+            expected, duration, peak = measure(project_in_process)
+            print(
+                f"N={datapoint_amount}\n"
+                f"  in process: {duration:.3f}s peak {peak / 2**20:.1f}MiB"
+            )
+            actual, duration, peak = measure(project_streaming)
+            print(
+                f"  streaming:  {duration:.3f}s peak {peak / 2**20:.1f}MiB "
+                f"max difference {np.abs(actual - expected).max():.1e}"
+            )
+            del actual
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import tracemalloc
+from typing import Set, Tuple
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from compute_dtype import COMPUTE_DTYPES  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from dr import DimensionalityReduction  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check that float32 projections and metrics create no float64 "
+            "temporaries of the size of the landmark distances or distance "
+            "matrices. Exits with 1 if they do."
+        )
+    )
+    parser.add_argument(
+        "-d", "--dataset", type=str, default="emotion",
+        choices=Dataset.VALID_NAMES,
+    )
+    parser.add_argument(
+        "-m", "--distance_metrics", type=str, nargs="+",
+        default=DimensionalityReduction.DISTANCE_METRICS,
+        choices=DimensionalityReduction.DISTANCE_METRICS,
+    )
+    parser.add_argument("-l", "--num_landmarks", type=int, default=20)
+    parser.add_argument("-k", type=int, default=7, help="Metrics k")
+    return parser.parse_args()
+
+
+class AllocationTracer:
+    """
+    Records the numpy arrays of the given sizes in bytes that are alive at
+    any bytecode of the backend, including temporaries that only live on
+    the stack of an expression. The sizes are those of the float64 arrays
+    to look for, a float32 array of the same shape has half the size.
+    """
+
+    _sizes: Set[int]
+    allocations: Set[Tuple[str, int]]
+
+    def __init__(self, sizes: Set[int]):
+        self._sizes = sizes
+        self.allocations = set()
+
+    def __enter__(self):
+        tracemalloc.start()
+        sys.settrace(self._trace_call)
+        return self
+
+    def __exit__(self, *_):
+        sys.settrace(None)
+        tracemalloc.stop()
+
+    def _trace_call(self, frame, event, _):
+        if not frame.f_code.co_filename.startswith(BACKEND_PATH):
+            return None
+        frame.f_trace_opcodes = True
+        return self._trace_opcode
+
+    def _trace_opcode(self, frame, event, _):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]
+        )
+        for trace in snapshot.traces:
+            if trace.size in self._sizes:
+                origin = trace.traceback[0]
+                self.allocations.add((
+                    f"{os.path.basename(origin.filename)}:{origin.lineno}",
+                    trace.size
+                ))
+        return self._trace_opcode
+
+
+def check(
+    dataset: Dataset, distance_metric: str, compute_dtype: str, args
+) -> Tuple[Set, Set]:
+    instance = DimensionalityReduction(
+        "balanced", distance_metric, args.num_landmarks, dataset,
+        compute_dtype_name=compute_dtype
+    )
+    instance.select_landmarks()
+    instance.reduce_landmarks()
+    landmark_distance_sizes = {
+        amount * args.num_landmarks * 8
+        for amount in (len(dataset), len(instance.state.other_indices))
+    }
+    with AllocationTracer(landmark_distance_sizes) as tracer:
+        for precision in DimensionalityReduction.LANDMARK_DISTANCE_PRECISIONS:
+            instance.calculate("none", precision=precision)
+    projection_allocations = tracer.allocations
+    with AllocationTracer({len(dataset) * (len(dataset) - 1) * 8}) as tracer:
+        instance.compute_metrics(args.k)
+    return projection_allocations, tracer.allocations
+
+
+def main():
+    args = parse_args()
+    dataset = Dataset(args.dataset)
+    # The shared embeddings are built before anything is traced
+    dataset.embeddings
+    dataset.quantized_embeddings
+    failed = False
+    for distance_metric in args.distance_metrics:
+        for compute_dtype in COMPUTE_DTYPES:
+            projection, metrics = check(
+                dataset, distance_metric, compute_dtype, args
+            )
+            print(
+                f"{distance_metric} {compute_dtype}: "
+                f"{len(projection)} (N, L) and {len(metrics)} (N, N - 1) "
+                "sized float64 allocations"
+            )
+            for location, size in sorted(projection | metrics):
+                print(f"  {location} {size / 2**10:.0f}KiB")
+            if compute_dtype == "float32" and (projection or metrics):
+                failed = True
+    print("FAILED" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
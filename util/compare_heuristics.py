@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from dataset import Dataset  # noqa: E402
+from dr import DimensionalityReduction  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the selection time and the projection quality of the "
+            "landmark heuristics"
+        )
+    )
+    parser.add_argument(
+        "-d", "--dataset", type=str, default="emotion",
+        choices=Dataset.VALID_NAMES,
+    )
+    parser.add_argument(
+        "-m", "--distance_metric", type=str, default="cosine",
+        choices=DimensionalityReduction.DISTANCE_METRICS,
+    )
+    parser.add_argument(
+        "-l", "--num_landmarks", type=int, nargs="+", default=[10, 20, 30]
+    )
+    parser.add_argument(
+        "--heuristics", type=str, nargs="+",
+        default=DimensionalityReduction.HEURISTICS,
+        choices=DimensionalityReduction.HEURISTICS,
+    )
+    parser.add_argument(
+        "-s", "--seeds", type=int, nargs="+", default=[0, 1, 2],
+        help="The metrics are averaged over these seeds",
+    )
+    parser.add_argument("-k", type=int, default=7, help="Metrics k")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    dataset = Dataset(args.dataset)
+    # The shared embeddings are built before anything is timed
+    dataset.embeddings
+    for num_landmarks in args.num_landmarks:
+        print(f"L={num_landmarks}")
+        for heuristic in args.heuristics:
+            durations = []
+            metrics = []
+            for seed in args.seeds:
+                instance = DimensionalityReduction(
+                    heuristic, args.distance_metric, num_landmarks, dataset
+                )
+                start = time.perf_counter()
+                instance.select_landmarks(seed)
+                durations.append(time.perf_counter() - start)
+                instance.reduce_landmarks()
+                instance.calculate("none")
+                metrics.append(instance.compute_metrics(args.k))
+            print(
+                f"  {heuristic:9s} {np.mean(durations) * 1e3:7.1f}ms  "
+                + "  ".join(
+                    f"{name} {np.mean([m[name] for m in metrics]):.3f}"
+                    for name, value in metrics[0].items()
+                    if np.ndim(value) == 0
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
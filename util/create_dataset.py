@@ -12,8 +12,13 @@ import numpy as np
 sys.path.append(
     path.dirname(path.dirname(path.abspath(__file__))) + "/services/backend"
 )
-from dr import DimensionalityReduction  # noqa: E402
+from dr import DimensionalityReduction, set_distances  # noqa: E402
 from dataset import Dataset  # noqa: E402
+from compute_dtype import compute_dtype  # noqa: E402
+
+# The training data is always computed in the reference dtype, whatever
+# COMPUTE_DTYPE the server uses
+DATASET_COMPUTE_DTYPE: str = "float64"
 
 
 def parse_args():
@@ -124,22 +129,27 @@ def generate_data(
         num_landmarks=num_landmarks,
         dataset=dataset,
         create_dataset=True,
+        compute_dtype_name=DATASET_COMPUTE_DTYPE,
+    )
+    # All landmark sets are reduced at once
+    landmark_indices = dr.select_landmark_sets(seeds)
+    projected_positions = dr.reduce_landmark_sets(landmark_indices)
+
+    original_distances = set_distances(
+        dataset.embeddings[landmark_indices],
+        distance_metric,
+        dtype=compute_dtype(DATASET_COMPUTE_DTYPE),
+    )
+    projected_distances = set_distances(
+        projected_positions,
+        distance_metric,
+        dtype=compute_dtype(DATASET_COMPUTE_DTYPE),
     )
-    result = []
-    for seed in seeds:
-        dr.select_landmarks(seed=seed)
-        dr.reduce_landmarks()
-
-        original_position = np.vstack(dr.landmarks["embeddings"].apply(np.array))
-        projected_position = np.vstack(dr.landmarks["position"].apply(np.array))
-
-        original_distances = dr.distances(original_position, original_position).tolist()
-        projected_distances = dr.distances(
-            projected_position, projected_position
-        ).tolist()
 
-        result.append({"label": original_distances, "input": projected_distances})
-    return result
+    return [
+        {"label": original.tolist(), "input": projected.tolist()}
+        for original, projected in zip(original_distances, projected_distances)
+    ]
 
 
 if __name__ == "__main__":
@@ -1,14 +1,21 @@
-import gc
+import argparse
 import os
 import sys
 import subprocess
+import time
 from platform import system
-from typing import List
+from typing import List, Optional
 
 BACKEND_PATH: str = os.path.join(os.getcwd(), 'services', 'backend')
 sys.path.append(BACKEND_PATH)
 
-from neighbors import Neighbors, ComputedNeighbors  # noqa: E402
+from neighbors import (  # noqa: E402
+    ComputedNeighbors, Neighbors, TopKNeighbors
+)
+from approximate_neighbors import RandomProjectionForest  # noqa: E402
+from neighbor_builder import (  # noqa: E402
+    CombinedNeighborsBuilder, ConcurrentNeighborsBuilder
+)
 from dataset import Dataset  # noqa: E402
 
 NEIGHBORS_EXECUTABLE_PATH: str = os.path.join(
@@ -19,39 +26,172 @@ COMPILE_SCRIPT_PATH: str = os.path.join(
     BACKEND_PATH, "compile-neighbors"
 )
 
-DATASETS: List[Dataset] = Dataset.all()
 
-DIMENSIONS: int = Neighbors.DIMENSIONS_768
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compute the neighbor files of the datasets"
+    )
+    parser.add_argument(
+        "-d", "--datasets", type=str, nargs="+", default=Dataset.VALID_NAMES,
+        choices=Dataset.VALID_NAMES, help="Datasets to process",
+    )
+    parser.add_argument(
+        "--combined", action="store_true",
+        help=(
+            "Build the euclidean and the cosine neighbors together from one "
+            "Gram matrix per row block instead of two engine runs"
+        ),
+    )
+    parser.add_argument(
+        "--approximate", action="store_true",
+        help=(
+            "Build approximate top-K neighbors with a random projection "
+            "forest instead of exact neighbors"
+        ),
+    )
+    parser.add_argument(
+        "-k", type=int, default=RandomProjectionForest.DEFAULT_K,
+        help="Neighbors per datapoint in approximate mode",
+    )
+    parser.add_argument(
+        "--recall_target", type=float,
+        default=RandomProjectionForest.DEFAULT_RECALL_TARGET,
+        help="Estimated recall@k to reach in approximate mode",
+    )
+    parser.add_argument(
+        "--memory_budget", type=int, default=None,
+        help=(
+            "Memory in MiB that concurrent engine runs may use together, "
+            "half of the physical memory by default"
+        ),
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        default=ConcurrentNeighborsBuilder.DEFAULT_MAX_WORKERS,
+        help="Maximum number of concurrent engine runs",
+    )
+    parser.add_argument(
+        "--block_size", type=int, default=None,
+        help=(
+            "Rows per block. The engine computes each block in its own run "
+            "and resumes an interrupted build after the last finished "
+            "block, by default it computes the whole file at once. Combined "
+            f"mode uses {CombinedNeighborsBuilder.DEFAULT_BLOCK_SIZE} rows "
+            "by default"
+        ),
+    )
+    parser.add_argument(
+        "--position_dtype", type=str,
+        default=Neighbors.DEFAULT_POSITION_DTYPE,
+        choices=list(Neighbors.POSITION_DTYPES),
+        help="Storage dtype of the embeddings in the neighbor files",
+    )
+    return parser.parse_args()
+
 
+def compile_engine():
+    # An engine that is older than its sources is rebuilt as well
+    if not os.path.exists(NEIGHBORS_EXECUTABLE_PATH) or (
+        system() != "Windows" and not ComputedNeighbors.engine_is_current()
+    ):
+        print("Compiling neighbors executable...")
+        process = subprocess.run(COMPILE_SCRIPT_PATH, shell=True)
+        if process.returncode != 0:
+            raise RuntimeError("Failed to compile neighbors executable!")
 
-if not os.path.exists(NEIGHBORS_EXECUTABLE_PATH):
-    print("Compiling neighbors executable...")
-    process = subprocess.run(COMPILE_SCRIPT_PATH, shell=True)
-    if process.returncode != 0:
-        raise RuntimeError("Failed to compile neighbors executable!")
 
-for dataset in DATASETS:
-    print(f"\n\nProcessing dataset: {dataset.name}")
-    print("Computing euclidean neighbors...")
-    euclidean_neighbors = ComputedNeighbors(
-        distance_metric="euclidean",
-        dimensions=DIMENSIONS,
-        dataset=dataset.dataframe
+def build_with_engine(
+    datasets: List[Dataset],
+    position_dtype: str,
+    block_size: Optional[int],
+    memory_budget: Optional[int],
+    workers: int
+):
+    builder = ConcurrentNeighborsBuilder(
+        memory_budget=(
+            None if memory_budget is None else memory_budget * 2**20
+        ),
+        max_workers=workers
+    )
+    for dataset in datasets:
+        builder.add(
+            dataset.euclidean_neighbors_path, "euclidean",
+            dataset.embeddings, position_dtype, block_size
+        )
+        builder.add(
+            dataset.cosine_neighbors_path, "cosine",
+            dataset.embeddings, position_dtype, block_size
+        )
+    print(f"Computing neighbors of {len(datasets)} datasets...")
+    builder.build(
+        progress=lambda done, total: print(f"{done}/{total} files written")
     )
-    print("Writing euclidean neighbors to disk...")
-    euclidean_neighbors.dump(dataset.euclidean_neighbors_path)
-    del euclidean_neighbors
-    gc.collect()
 
-    print("Computing cosine neighbors...")
-    cosine_neighbors = ComputedNeighbors(
-        distance_metric="cosine",
-        dimensions=DIMENSIONS,
-        dataset=dataset.dataframe
+
+def build_combined(
+    dataset: Dataset, position_dtype: str, block_size: Optional[int]
+):
+    builder = CombinedNeighborsBuilder(
+        dataset.embeddings,
+        block_size=block_size or CombinedNeighborsBuilder.DEFAULT_BLOCK_SIZE,
+        position_dtype=position_dtype
     )
-    print("Writing cosine neighbors to disk...")
-    cosine_neighbors.dump(dataset.cosine_neighbors_path)
-    del cosine_neighbors
-    gc.collect()
+    print(
+        "Computing euclidean and cosine neighbors "
+        f"({'normalized' if builder.normalized else 'unnormalized'})..."
+    )
+    builder.build(
+        {
+            "euclidean": dataset.euclidean_neighbors_path,
+            "cosine": dataset.cosine_neighbors_path
+        },
+        progress=lambda done, total: print(
+            f"\r{done}/{total} rows", end="", flush=True
+        )
+    )
+    print()
+
+
+def build_approximate(dataset: Dataset, k: int, recall_target: float):
+    for distance_metric in ("euclidean", "cosine"):
+        print(f"Computing approximate {distance_metric} neighbors...")
+        forest = RandomProjectionForest(dataset.embeddings, distance_metric)
+        indices, distances = forest.build(k=k, recall_target=recall_target)
+        print(
+            f"{forest.tree_amount} trees, "
+            f"estimated recall@{k} {forest.estimated_recall:.3f}"
+        )
+        TopKNeighbors.dump(
+            dataset.topk_neighbors_path(distance_metric),
+            distance_metric, dataset.embeddings, indices, distances,
+            forest.distance_samples()
+        )
+
+
+def main():
+    args = parse_args()
+    datasets: List[Dataset] = [
+        Dataset(name, no_neighbors=True) for name in args.datasets
+    ]
+    start = time.perf_counter()
+
+    if args.approximate:
+        for dataset in datasets:
+            print(f"\n\nProcessing dataset: {dataset.name}")
+            build_approximate(dataset, args.k, args.recall_target)
+    elif args.combined:
+        for dataset in datasets:
+            print(f"\n\nProcessing dataset: {dataset.name}")
+            build_combined(dataset, args.position_dtype, args.block_size)
+    else:
+        compile_engine()
+        build_with_engine(
+            datasets, args.position_dtype, args.block_size,
+            args.memory_budget, args.workers
+        )
+
+    print(f"Done in {time.perf_counter() - start:.1f}s!")
+
 
-print("Done!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+import requests
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure backend throughput under concurrent users"
+    )
+    parser.add_argument(
+        "--url", type=str, default="http://localhost:5000",
+        help="Base url of the backend",
+    )
+    parser.add_argument(
+        "-u", "--users", type=int, default=8,
+        help="Number of concurrent users",
+    )
+    parser.add_argument(
+        "-r", "--rounds", type=int, default=10,
+        help="Number of landmark moves per user",
+    )
+    parser.add_argument(
+        "-d", "--dataset_name", type=str, default="emotion",
+        help="Dataset to create the instances on",
+    )
+    parser.add_argument(
+        "-i", "--idr_algorithm", type=str, default="trivial",
+        help="iDR algorithm used for the projections",
+    )
+    parser.add_argument(
+        "--shared_instance", action="store_true",
+        help="Let all users work on the same instance",
+    )
+    parser.add_argument("--seed", default=42, type=int, help="Random seed")
+    return parser.parse_args()
+
+
+def create_instance(url: str, dataset_name: str, seed: int) -> str:
+    response = requests.post(
+        f"{url}/instances",
+        json={"dataset_name": dataset_name, "seed": seed},
+    )
+    response.raise_for_status()
+    return response.json()["instance"]["id"]
+
+
+def user(
+    url: str,
+    instance_id: str,
+    rounds: int,
+    idr_algorithm: str,
+    seed: int,
+    latencies: Dict[str, List[float]],
+    errors: List[str],
+    lock: threading.Lock,
+):
+    rng = random.Random(seed)
+    session = requests.Session()
+    instance_url = f"{url}/instances/{instance_id}"
+
+    def timed(name: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, instance_url + path, **kwargs)
+        duration = time.perf_counter() - start
+        with lock:
+            if response.ok:
+                latencies[name].append(duration)
+            else:
+                errors.append(f"{name}: {response.status_code}")
+        return response
+
+    landmarks = timed("landmarks", "GET", "/landmarks").json()["landmarks"]
+    for _ in range(rounds):
+        landmark = rng.choice(landmarks)
+        landmark["position"] = [
+            coordinate + rng.uniform(-0.1, 0.1)
+            for coordinate in landmark["position"]
+        ]
+        timed("move", "PATCH", "/landmarks", json={"landmarks": landmarks})
+        timed(
+            "datapoints", "GET", "/datapoints",
+            params={"idr_algorithm": idr_algorithm},
+        )
+        timed("metrics", "GET", "/metrics")
+
+
+def main():
+    args = parse_args()
+
+    if args.shared_instance:
+        shared_id = create_instance(args.url, args.dataset_name, args.seed)
+        instance_ids = [shared_id] * args.users
+    else:
+        instance_ids = [
+            create_instance(args.url, args.dataset_name, args.seed + i)
+            for i in range(args.users)
+        ]
+
+    latencies = {
+        name: [] for name in ("landmarks", "move", "datapoints", "metrics")
+    }
+    errors = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=user,
+            args=(
+                args.url, instance_id, args.rounds, args.idr_algorithm,
+                args.seed + i, latencies, errors, lock,
+            ),
+        )
+        for i, instance_id in enumerate(instance_ids)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    for instance_id in set(instance_ids):
+        requests.delete(f"{args.url}/instances/{instance_id}")
+
+    request_amount = sum(len(values) for values in latencies.values())
+    print(
+        f"{args.users} users, {request_amount} requests in {duration:.2f}s "
+        f"({request_amount / duration:.1f} requests/s, "
+        f"{args.users * args.rounds / duration:.2f} moves/s)"
+    )
+    for name, values in latencies.items():
+        if not values:
+            continue
+        values = np.asarray(values) * 1000
+        print(
+            f"{name:>10}: mean {values.mean():8.1f}ms  "
+            f"p50 {np.percentile(values, 50):8.1f}ms  "
+            f"p95 {np.percentile(values, 95):8.1f}ms  "
+            f"max {values.max():8.1f}ms"
+        )
+    if errors:
+        print(f"{len(errors)} failed requests, e.g. {errors[:5]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import requests
+
+BACKEND_PATH: str = os.path.join(os.getcwd(), "services", "backend")
+sys.path.append(BACKEND_PATH)
+
+from dataset import Dataset  # noqa: E402
+from dr import DimensionalityReduction  # noqa: E402
+from shard_workers import ShardCoordinator  # noqa: E402
+
+SHARD_WORKERS_PATH: str = os.path.join(BACKEND_PATH, "shard_workers.py")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Start shard workers on localhost and compare the positions and "
+            "metrics of a coordinator with those of a single process"
+        )
+    )
+    parser.add_argument(
+        "-d", "--dataset", type=str, default="emotion",
+        choices=Dataset.VALID_NAMES,
+    )
+    parser.add_argument(
+        "-m", "--distance_metric", type=str, default="cosine",
+        choices=DimensionalityReduction.DISTANCE_METRICS,
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=3, help="Shard workers"
+    )
+    parser.add_argument("-l", "--num_landmarks", type=int, default=20)
+    parser.add_argument("-k", type=int, default=7, help="Metrics k")
+    parser.add_argument("--port", type=int, default=5100, help="First port")
+    parser.add_argument("--startup_timeout", type=float, default=120.0)
+    return parser.parse_args()
+
+
+def start_workers(args, datapoint_amount: int) -> list:
+    bounds = np.linspace(0, datapoint_amount, args.workers + 1).astype(int)
+    processes = []
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        processes.append(subprocess.Popen([
+            sys.executable, SHARD_WORKERS_PATH, args.dataset,
+            str(start), str(end), "--port", str(args.port + i)
+        ]))
+    return processes
+
+
+def wait_for(urls: list, timeout: float):
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                requests.get(f"{url}/shard", timeout=1).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not start")
+                time.sleep(0.5)
+
+
+def main():
+    args = parse_args()
+    dataset = Dataset(args.dataset)
+    # The workers map the caches instead of loading the dataset
+    dataset.embeddings_file()
+    dataset.labels_file()
+    urls = [
+        f"http://127.0.0.1:{args.port + i}" for i in range(args.workers)
+    ]
+    processes = start_workers(args, len(dataset))
+    try:
+        wait_for(urls, args.startup_timeout)
+        shards = ShardCoordinator(urls)
+        print(f"Shards: {shards.shards}")
+
+        instance = DimensionalityReduction(
+            "balanced", args.distance_metric, args.num_landmarks, dataset
+        )
+        instance.select_landmarks()
+        instance.reduce_landmarks()
+        results = {}
+        for mode, mode_shards in (("local", None), ("sharded", shards)):
+            # A copy of the instance, the cached results of one mode are
+            # not used by the other
+            copy = DimensionalityReduction.from_snapshot(instance.snapshot())
+            start = time.perf_counter()
+            copy.calculate("none", workers=0, shards=mode_shards)
+            metrics = copy.compute_metrics(args.k, shards=mode_shards)
+            results[mode] = (copy.state.positions.copy(), metrics)
+            print(f"{mode}: {time.perf_counter() - start:.2f}s")
+
+        local_positions, local_metrics = results["local"]
+        sharded_positions, sharded_metrics = results["sharded"]
+        print(
+            "max position difference "
+            f"{np.abs(sharded_positions - local_positions).max():.2e}"
+        )
+        for name, value in local_metrics.items():
+            difference = np.abs(
+                np.asarray(sharded_metrics[name]) - np.asarray(value)
+            ).max()
+            print(f"{name}: max difference {difference:.2e}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()